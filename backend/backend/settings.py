@@ -47,6 +47,30 @@ if not IS_HEROKU_APP:
 else:
     LOG_LEVEL = env('LOG_LEVEL', default='INFO')
 
+# util.main.log() writes to the "shiganshina" logger. Messages below LOG_LEVEL are dropped
+# before they are even formatted
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'formatters': {
+        'plain': {'format': '%(message)s'},
+    },
+    'handlers': {
+        'console': {
+            'class': 'logging.StreamHandler',
+            'stream': 'ext://sys.stdout',
+            'formatter': 'plain',
+        },
+    },
+    'loggers': {
+        'shiganshina': {
+            'handlers': ['console'],
+            'level': LOG_LEVEL,
+            'propagate': False,
+        },
+    },
+}
+
 # On Heroku, it's safe to use a wildcard for `ALLOWED_HOSTS``, since the Heroku router performs
 # validation of the Host header in the incoming HTTP request. On other platforms you may need
 # to list the expected hostnames explicitly to prevent HTTP Host header attacks. See:
@@ -75,6 +99,7 @@ INSTALLED_APPS = [
     "inbox",
     "followers",
     "remote_node",
+    "githubUpdater",
     "drf_spectacular",
     # HEALTHCHECK APPS
     'health_check',                             # required
@@ -150,7 +175,7 @@ else:
 # Django Rest Framework settings
 REST_FRAMEWORK = {
     'DEFAULT_AUTHENTICATION_CLASSES': [
-        'rest_framework.authentication.BasicAuthentication',
+        'remote_node.authentication.CachedBasicAuthentication',
     ],
     'DEFAULT_PERMISSION_CLASSES': [],
     'TEST_REQUEST_DEFAULT_FORMAT': 'json',
@@ -222,3 +247,113 @@ SPECTACULAR_SETTINGS = {
     'TITLE': 'API for Team attack',
     'DESCRIPTION': 'Swagger API docs for Team attack (Shiganshina Social)',
 }
+
+# Remote node HTTP client
+# Every remote node gets its own pooled, keep-alive session (see remote_node/util.py),
+# so the pool sizes below are per node.
+REMOTE_NODE_POOL_CONNECTIONS = env.int('REMOTE_NODE_POOL_CONNECTIONS', default=4)
+REMOTE_NODE_POOL_MAXSIZE = env.int('REMOTE_NODE_POOL_MAXSIZE', default=16)
+# default timeout (seconds) for requests to remote nodes. Can be overridden per node in the admin page
+REMOTE_NODE_TIMEOUT = env.float('REMOTE_NODE_TIMEOUT', default=10.0)
+# "?all" lookups query every remote node in parallel: number of worker threads,
+# and how long (seconds) we wait overall for one of the nodes to answer
+REMOTE_NODE_FANOUT_WORKERS = env.int('REMOTE_NODE_FANOUT_WORKERS', default=16)
+REMOTE_NODE_FANOUT_DEADLINE = env.float('REMOTE_NODE_FANOUT_DEADLINE', default=15.0)
+# URL -> node routing table is cached in memory (see remote_node/routing.py). It's rebuilt when a
+# RemoteNode is saved, and at least every this many seconds so other processes' changes are seen
+REMOTE_NODE_ROUTES_TTL = env.float('REMOTE_NODE_ROUTES_TTL', default=60.0)
+# circuit breaker (see remote_node/health.py): a node's breaker opens once at least MIN_REQUESTS requests were
+# made to it in the last WINDOW seconds and ERROR_RATE of them failed. After COOLDOWN seconds one probe is let through
+REMOTE_NODE_BREAKER_WINDOW = env.float('REMOTE_NODE_BREAKER_WINDOW', default=60.0)
+REMOTE_NODE_BREAKER_MIN_REQUESTS = env.int('REMOTE_NODE_BREAKER_MIN_REQUESTS', default=5)
+REMOTE_NODE_BREAKER_ERROR_RATE = env.float('REMOTE_NODE_BREAKER_ERROR_RATE', default=0.5)
+REMOTE_NODE_BREAKER_COOLDOWN = env.float('REMOTE_NODE_BREAKER_COOLDOWN', default=30.0)
+# how often (seconds) a node's health snapshot is saved for the admin page
+REMOTE_NODE_HEALTH_PERSIST_INTERVAL = env.float('REMOTE_NODE_HEALTH_PERSIST_INTERVAL', default=30.0)
+
+# Directory of remote authors for "GET /authors?all" (see remote_node/directory.py). Every node's author list
+# is copied into the database in the background at most every INTERVAL seconds, PAGE_SIZE authors per request
+# and at most MAX_PAGES pages per node. Remote authors not seen for STALE_AFTER seconds aren't listed anymore
+REMOTE_DIRECTORY_IN_PROCESS = env.bool('REMOTE_DIRECTORY_IN_PROCESS', default=True)
+REMOTE_DIRECTORY_INTERVAL = env.float('REMOTE_DIRECTORY_INTERVAL', default=5 * 60.0)
+REMOTE_DIRECTORY_PAGE_SIZE = env.int('REMOTE_DIRECTORY_PAGE_SIZE', default=100)
+REMOTE_DIRECTORY_MAX_PAGES = env.int('REMOTE_DIRECTORY_MAX_PAGES', default=20)
+REMOTE_DIRECTORY_STALE_AFTER = env.float('REMOTE_DIRECTORY_STALE_AFTER', default=24 * 60 * 60.0)
+
+# Verified Basic auth tokens are cached so we don't run the password hasher on every request
+# (see remote_node/authentication.py). TTL is in seconds.
+REMOTE_AUTH_CACHE_TTL = env.float('REMOTE_AUTH_CACHE_TTL', default=300.0)
+REMOTE_AUTH_CACHE_SIZE = env.int('REMOTE_AUTH_CACHE_SIZE', default=1024)
+
+# JSON of remote authors (e.g. the authors of likes) is cached (see remote_node/authors.py).
+# Entries are fresh for TTL seconds, then served for STALE_TTL more seconds while they're refreshed in the
+# background. Authors that don't exist are remembered for NEGATIVE_TTL seconds.
+REMOTE_AUTHOR_CACHE_TTL = env.float('REMOTE_AUTHOR_CACHE_TTL', default=300.0)
+REMOTE_AUTHOR_CACHE_STALE_TTL = env.float('REMOTE_AUTHOR_CACHE_STALE_TTL', default=3600.0)
+REMOTE_AUTHOR_CACHE_NEGATIVE_TTL = env.float('REMOTE_AUTHOR_CACHE_NEGATIVE_TTL', default=60.0)
+REMOTE_AUTHOR_CACHE_SIZE = env.int('REMOTE_AUTHOR_CACHE_SIZE', default=4096)
+# name of a Django cache (in CACHES) to share the author cache between processes. Off by default
+REMOTE_AUTHOR_CACHE_BACKEND = env.str('REMOTE_AUTHOR_CACHE_BACKEND', default=None)
+
+# Responses to "?all" GETs proxied to remote nodes are cached in memory (see remote_node/responses.py).
+# Unless the node's Cache-Control says otherwise, a response is fresh for the TTL (seconds) of its kind of
+# resource, then revalidated with its ETag. MAX_BYTES caps the cached bodies per process (0 turns the cache off)
+REMOTE_RESPONSE_CACHE_MAX_BYTES = env.int('REMOTE_RESPONSE_CACHE_MAX_BYTES', default=32 * 1024 * 1024)
+REMOTE_RESPONSE_CACHE_DEFAULT_TTL = env.float('REMOTE_RESPONSE_CACHE_DEFAULT_TTL', default=15.0)
+REMOTE_RESPONSE_CACHE_TTLS = {
+    'authors': env.float('REMOTE_RESPONSE_CACHE_AUTHORS_TTL', default=300.0),
+    'posts': env.float('REMOTE_RESPONSE_CACHE_POSTS_TTL', default=30.0),
+    'image': env.float('REMOTE_RESPONSE_CACHE_IMAGE_TTL', default=3600.0),
+    'comments': env.float('REMOTE_RESPONSE_CACHE_COMMENTS_TTL', default=10.0),
+    'likes': env.float('REMOTE_RESPONSE_CACHE_LIKES_TTL', default=10.0),
+    'liked': env.float('REMOTE_RESPONSE_CACHE_LIKES_TTL', default=10.0),
+    'followers': env.float('REMOTE_RESPONSE_CACHE_FOLLOWERS_TTL', default=30.0),
+}
+
+# The follower graph is kept in memory for friend checks (see followers/graph.py). It's updated when a
+# Follower is saved or deleted, and reloaded at least every this many seconds to see other processes' follows
+FOLLOWER_GRAPH_TTL = env.float('FOLLOWER_GRAPH_TTL', default=60.0)
+
+# Follows of remote authors are checked with the author's node (see followers/liveness.py),
+# at most once per (author, follower) pair every this many seconds
+FOLLOWER_LIVENESS_TTL = env.float('FOLLOWER_LIVENESS_TTL', default=300.0)
+
+# Full-text search of posts and comments (see post/search.py): at most MAX_RESULTS visible matches can be
+# paged through, and only the first MAX_TERMS words of a query are used
+SEARCH_MAX_RESULTS = env.int('SEARCH_MAX_RESULTS', default=500)
+SEARCH_MAX_TERMS = env.int('SEARCH_MAX_TERMS', default=10)
+
+# GitHub activity sync (see githubUpdater/githubUpdater.py): authors are fetched in parallel by WORKERS threads.
+# A token is optional, but raises GitHub's rate limit from 60 to 5000 requests an hour
+GITHUB_SYNC_WORKERS = env.int('GITHUB_SYNC_WORKERS', default=8)
+GITHUB_SYNC_TIMEOUT = env.float('GITHUB_SYNC_TIMEOUT', default=10.0)
+GITHUB_TOKEN = env.str('GITHUB_TOKEN', default=None)
+# authors are synced in the background (see githubUpdater/scheduler.py) by a thread in the web process
+# and/or `python manage.py sync_github`: each author at most every INTERVAL seconds, BATCH_SIZE authors at a time
+GITHUB_SYNC_IN_PROCESS = env.bool('GITHUB_SYNC_IN_PROCESS', default=True)
+GITHUB_SYNC_INTERVAL = env.float('GITHUB_SYNC_INTERVAL', default=15 * 60.0)
+GITHUB_SYNC_BATCH_SIZE = env.int('GITHUB_SYNC_BATCH_SIZE', default=20)
+
+# Outbound delivery queue (see remote_node/delivery.py)
+# deliveries are sent by a thread in the web process and/or `python manage.py deliver_outbound`
+OUTBOUND_DELIVERY_IN_PROCESS = env.bool('OUTBOUND_DELIVERY_IN_PROCESS', default=True)
+OUTBOUND_DELIVERY_WORKERS = env.int('OUTBOUND_DELIVERY_WORKERS', default=8)
+OUTBOUND_DELIVERY_BATCH_SIZE = env.int('OUTBOUND_DELIVERY_BATCH_SIZE', default=50)
+# failed deliveries are retried after BASE, 2*BASE, 4*BASE... seconds (at most MAX), then marked DEAD
+OUTBOUND_DELIVERY_MAX_ATTEMPTS = env.int('OUTBOUND_DELIVERY_MAX_ATTEMPTS', default=8)
+OUTBOUND_DELIVERY_BACKOFF_BASE = env.float('OUTBOUND_DELIVERY_BACKOFF_BASE', default=30.0)
+OUTBOUND_DELIVERY_BACKOFF_MAX = env.float('OUTBOUND_DELIVERY_BACKOFF_MAX', default=6 * 60 * 60.0)
+# seconds a worker may hold a claimed delivery before another worker can pick it up again
+OUTBOUND_DELIVERY_LEASE = env.float('OUTBOUND_DELIVERY_LEASE', default=120.0)
+# deliveries to the same inbox on a node that accepts several items per POST (RemoteNode.batch_inbox)
+# are sent together, at most this many items per POST
+OUTBOUND_DELIVERY_MAX_BATCH_ITEMS = env.int('OUTBOUND_DELIVERY_MAX_BATCH_ITEMS', default=50)
+
+# most items accepted in one POST to an inbox (see inbox/ingest.py)
+INBOX_MAX_ITEMS = env.int('INBOX_MAX_ITEMS', default=100)
+
+# Inbox compaction (see inbox/compaction.py), run by `python manage.py compact_inbox` every INTERVAL seconds.
+# Each author keeps their newest MAX_PER_AUTHOR items, and items older than RETENTION_DAYS are deleted (0 turns either off)
+INBOX_MAX_PER_AUTHOR = env.int('INBOX_MAX_PER_AUTHOR', default=1000)
+INBOX_RETENTION_DAYS = env.int('INBOX_RETENTION_DAYS', default=0)
+INBOX_COMPACTION_INTERVAL = env.float('INBOX_COMPACTION_INTERVAL', default=60 * 60.0)
@@ -4,3 +4,7 @@ from django.apps import AppConfig
 class FollowersConfig(AppConfig):
     default_auto_field = "django.db.models.BigAutoField"
     name = "followers"
+
+    def ready(self):
+        # connect the signal receivers that keep the follower graph up to date
+        from . import graph
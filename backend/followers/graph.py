@@ -0,0 +1,130 @@
+'''
+In-process follower graph
+
+Deciding whether two authors are friends (they follow each other) used to take two
+Follower queries per check. Instead, every Follower row is loaded once into two adjacency
+maps (who an author follows, and who follows an author), so friend checks don't touch the database.
+
+The graph is updated in place when a Follower save or delete is committed, and reloaded at least every
+FOLLOWER_GRAPH_TTL seconds so follows made by other processes are picked up too.
+'''
+import threading
+import time
+from django.conf import settings
+from django.db import transaction
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
+from followers.models import Follower
+
+def _id(author) -> str:
+    '''
+    Accept either a User or its id
+    '''
+    return str(getattr(author, 'pk', author))
+
+class FollowerGraph:
+    '''
+    Adjacency sets of the follower graph, keyed on author id
+    '''
+    def __init__(self, edges):
+        # actor id -> ids of the authors they follow
+        self.following = {}
+        # object id -> ids of the authors following them
+        self.followers = {}
+        for actor, object in edges:
+            self.add(actor, object)
+
+    def add(self, actor, object) -> None:
+        actor, object = _id(actor), _id(object)
+        self.following.setdefault(actor, set()).add(object)
+        self.followers.setdefault(object, set()).add(actor)
+
+    def remove(self, actor, object) -> None:
+        actor, object = _id(actor), _id(object)
+        self.following.get(actor, set()).discard(object)
+        self.followers.get(object, set()).discard(actor)
+
+    def follows(self, actor, object) -> bool:
+        return _id(object) in self.following.get(_id(actor), ())
+
+    def following_of(self, author) -> set:
+        '''
+        Ids of the authors `author` follows
+        '''
+        return set(self.following.get(_id(author), ()))
+
+    def friends_of(self, author) -> set:
+        '''
+        Ids of the authors that follow `author` and are followed back
+        '''
+        author = _id(author)
+        return self.following.get(author, set()) & self.followers.get(author, set())
+
+    def are_friends(self, author, others) -> dict:
+        '''
+        For each of `others`, whether they and `author` follow each other (keyed on id)
+        '''
+        friends = self.friends_of(author)
+        return {_id(other): _id(other) in friends for other in others}
+
+_graph = None
+_built_at = 0.0
+_lock = threading.Lock()
+
+def graph() -> FollowerGraph:
+    '''
+    Return the follower graph, loading it from the database if it is missing or expired
+    '''
+    global _graph, _built_at
+    current = _graph
+    if current is not None and time.monotonic() - _built_at < settings.FOLLOWER_GRAPH_TTL:
+        return current
+
+    with _lock:
+        if _graph is None or time.monotonic() - _built_at >= settings.FOLLOWER_GRAPH_TTL:
+            _graph = FollowerGraph(Follower.objects.values_list('actor_id', 'object_id').iterator())
+            _built_at = time.monotonic()
+        return _graph
+
+def follows(actor, object) -> bool:
+    '''
+    Whether `actor` follows `object` (Users or ids)
+    '''
+    return graph().follows(actor, object)
+
+def are_friends(author, others) -> dict:
+    '''
+    Batch friend check: {id: bool} for each of `others` (Users or ids)
+    '''
+    return graph().are_friends(author, others)
+
+def is_friend(author, other) -> bool:
+    return are_friends(author, [other])[_id(other)]
+
+def invalidate() -> None:
+    '''
+    Throw away the graph, so it's reloaded on the next lookup
+    '''
+    global _graph
+    with _lock:
+        _graph = None
+
+def _apply(change, actor, object) -> None:
+    with _lock:
+        if _graph is not None:
+            change(_graph, actor, object)
+
+@receiver(post_save, sender=Follower)
+def add_follower(sender, instance, created, **kwargs):
+    # changes are applied once they're committed, so a rolled back follow never reaches the graph
+    if not created:
+        # an existing follow was changed and we don't know what it was before
+        transaction.on_commit(invalidate)
+        return
+    actor, object = instance.actor_id, instance.object_id
+    transaction.on_commit(lambda: _apply(FollowerGraph.add, actor, object))
+
+@receiver(post_delete, sender=Follower)
+def remove_follower(sender, instance, **kwargs):
+    actor, object = instance.actor_id, instance.object_id
+    transaction.on_commit(lambda: _apply(FollowerGraph.remove, actor, object))
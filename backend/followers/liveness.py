@@ -0,0 +1,113 @@
+'''
+Cached checks that follows of remote authors still exist
+
+When the followed author is remote, their node is the one that knows whether the follow still
+exists (e.g. the remote author removed the follower), so we ask it with
+GET {author}/followers/{actor} and delete our Follower if it answers 404.
+
+Each (object, actor) pair is checked at most every FOLLOWER_LIVENESS_TTL seconds. verify() checks
+a batch of pairs in parallel and waits for the answers, verify_in_background() does the same on a
+separate thread so listings can be served from our Follower rows right away.
+'''
+import threading
+import time
+import urllib.parse
+from django.conf import settings
+from django.db import connection
+from django.db.models import Q
+from followers.models import Follower
+from restapi.models import User
+import remote_node.util
+import util.main
+
+# (object id, actor id) -> time.monotonic() of the last check
+_checked = {}
+# pairs being checked in the background
+_pending = set()
+_lock = threading.Lock()
+
+def needs_check(object: User) -> bool:
+    '''
+    Whether follows of this author have to be checked with their node
+    '''
+    # team HTTP (linkup1) and team lost don't serve /followers/{id} this way, so their follows can't be checked
+    return object.is_remote and 'linkup1' not in object.url and 'lostone' not in object.url
+
+def _is_fresh(key: tuple, now: float) -> bool:
+    checked_at = _checked.get(key)
+    return checked_at is not None and now - checked_at < settings.FOLLOWER_LIVENESS_TTL
+
+def _stale(pairs: list) -> list:
+    now = time.monotonic()
+    return [
+        (object, actor, actor_url) for object, actor, actor_url in pairs
+        if needs_check(object) and not _is_fresh((object.id, actor.id), now)
+    ]
+
+def _follower_url(object: User, actor_url: str) -> str:
+    return object.url.rstrip('/') + '/followers/' + urllib.parse.quote(actor_url, safe='')
+
+def verify(pairs: list) -> dict:
+    '''
+    Check (object, actor, actor url) follows with the followed authors' nodes, all at once.
+    Follows the node says don't exist anymore are deleted.
+
+    Returns {(object id, actor id): whether the follow still exists}. Pairs that didn't need
+    checking, were checked recently, or whose node couldn't be reached count as existing.
+    '''
+    results = {(object.id, actor.id): True for object, actor, _ in pairs}
+    urls = {_follower_url(object, actor_url): (object, actor) for object, actor, actor_url in _stale(pairs)}
+    if not urls:
+        return results
+
+    gone = []
+    now = time.monotonic()
+    for url, response in remote_node.util.get_many(list(urls)).items():
+        object, actor = urls[url]
+        if response is None:
+            # couldn't ask the node: keep the follow, and try again next time
+            util.main.log('liveness/verify', 'Could not check if %s still follows %s', actor, object)
+            continue
+        with _lock:
+            _checked[(object.id, actor.id)] = now
+        if response.status_code == 404:
+            util.main.log('liveness/verify', 'Got 404 response from %s, so %s does not follow %s. Deleting local follower entry...', url, actor, object)
+            gone.append((object, actor))
+            results[(object.id, actor.id)] = False
+        elif response.status_code != 200:
+            util.main.log('liveness/verify', 'Failed to get follower from %s with status code %s. Skipping.', url, response.status_code)
+
+    if gone:
+        query = Q()
+        for object, actor in gone:
+            query |= Q(object=object, actor=actor)
+        # delete() sends post_delete for each follow, so the follower graph stays up to date
+        Follower.objects.filter(query).delete()
+    _prune(now)
+    return results
+
+def _prune(now: float) -> None:
+    with _lock:
+        for key in [key for key, checked_at in _checked.items() if now - checked_at >= settings.FOLLOWER_LIVENESS_TTL]:
+            del _checked[key]
+
+def _verify(pairs: list, keys: set) -> None:
+    try:
+        verify(pairs)
+    except Exception as e:
+        util.main.log('liveness/_verify', 'Error checking followers: %s', e)
+    finally:
+        connection.close()
+        with _lock:
+            _pending.difference_update(keys)
+
+def verify_in_background(pairs: list) -> None:
+    '''
+    Like verify(), but on a separate thread, without waiting for the answers
+    '''
+    with _lock:
+        pairs = [pair for pair in _stale(pairs) if (pair[0].id, pair[1].id) not in _pending]
+        keys = {(object.id, actor.id) for object, actor, _ in pairs}
+        _pending.update(keys)
+    if pairs:
+        threading.Thread(target=_verify, args=(pairs, keys), name='follower-liveness', daemon=True).start()
@@ -0,0 +1,39 @@
+# Generated by Django 5.0.14 on 2026-10-18 15:09
+
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import Count, Min
+
+
+def remove_duplicate_followers(apps, schema_editor):
+    '''
+    Keep only the oldest Follower of each (actor, object) pair, so the unique constraint can be added
+    '''
+    Follower = apps.get_model('followers', 'Follower')
+    duplicates = (
+        Follower.objects.values('actor', 'object')
+        .annotate(count=Count('id'), keep=Min('id'))
+        .filter(count__gt=1)
+    )
+    for duplicate in duplicates:
+        Follower.objects.filter(actor=duplicate['actor'], object=duplicate['object']).exclude(id=duplicate['keep']).delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('followers', '0003_alter_follower_actor'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.RunPython(remove_duplicate_followers, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='follower',
+            index=models.Index(fields=['object', 'actor'], name='followers_f_object__dd1593_idx'),
+        ),
+        migrations.AddConstraint(
+            model_name='follower',
+            constraint=models.UniqueConstraint(fields=('actor', 'object'), name='unique_follower'),
+        ),
+    ]
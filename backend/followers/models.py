@@ -15,6 +15,15 @@ class Follower(models.Model):
     # although this may be a user from another server, we make a copy so this is still a ForeignKey
     actor = models.ForeignKey(User, on_delete=models.CASCADE, related_name='actor')
 
+    class Meta:
+        constraints = [
+            # someone can only follow an author once. Also indexes (actor, object) lookups
+            models.UniqueConstraint(fields=['actor', 'object'], name='unique_follower'),
+        ]
+        indexes = [
+            # "who follows this author" lookups
+            models.Index(fields=['object', 'actor']),
+        ]
 
     def __str__(self):
         # foreign_author = requests.get(self.actor).json()
@@ -1,5 +1,7 @@
 from django.test import TestCase, LiveServerTestCase
-from followers import models, serializers
+from django.db import IntegrityError, transaction
+from followers import models, serializers, graph, liveness
+from unittest.mock import MagicMock, patch
 import urllib
 import base64
 import os
@@ -152,3 +154,102 @@ class FollowerTestCase(LiveServerTestCase):
         follower_response = self.client.get(f'/api/authors/{self.user2.id}/followers/{user1_url}')
         self.assertEqual(follower_response.status_code, 404)
 
+
+class FollowerGraphTest(TestCase):
+    '''
+    Tests the in-memory follower graph used for friend checks
+    '''
+    def setUp(self):
+        graph.invalidate()
+        self.user1 = User.objects.create_user(displayName='graph1', password='pwd', github='', profileImage=None)
+        self.user2 = User.objects.create_user(displayName='graph2', password='pwd', github='', profileImage=None)
+        self.user3 = User.objects.create_user(displayName='graph3', password='pwd', github='', profileImage=None)
+        models.Follower.objects.create(actor=self.user1, object=self.user2)
+        models.Follower.objects.create(actor=self.user2, object=self.user1)
+        models.Follower.objects.create(actor=self.user3, object=self.user1)
+
+    def tearDown(self):
+        graph.invalidate()
+
+    def test_friend_checks_without_queries(self):
+        graph.graph()
+        with self.assertNumQueries(0):
+            self.assertTrue(graph.follows(self.user3, self.user1))
+            self.assertFalse(graph.follows(self.user1, self.user3))
+            self.assertEqual(graph.are_friends(self.user1, [self.user2, self.user3.id]), {
+                self.user2.id: True,
+                self.user3.id: False,
+            })
+
+    def test_signals_update_graph(self):
+        graph.graph()
+        with self.captureOnCommitCallbacks(execute=True):
+            models.Follower.objects.create(actor=self.user1, object=self.user3)
+        self.assertTrue(graph.is_friend(self.user1, self.user3))
+        with self.captureOnCommitCallbacks(execute=True):
+            models.Follower.objects.filter(actor=self.user2, object=self.user1).delete()
+        self.assertFalse(graph.is_friend(self.user1, self.user2))
+
+    def test_rolled_back_follow_not_applied(self):
+        graph.graph()
+        with self.captureOnCommitCallbacks(execute=True) as callbacks:
+            with self.assertRaises(RuntimeError), transaction.atomic():
+                models.Follower.objects.create(actor=self.user1, object=self.user3)
+                raise RuntimeError
+        self.assertEqual(callbacks, [])
+        self.assertFalse(graph.follows(self.user1, self.user3))
+
+    def test_unique_follower(self):
+        with self.assertRaises(IntegrityError), transaction.atomic():
+            models.Follower.objects.create(actor=self.user1, object=self.user2)
+
+
+class FollowerLivenessTest(TestCase):
+    '''
+    Tests the cached checks of follows of remote authors
+    '''
+    def setUp(self):
+        liveness._checked.clear()
+        self.local = User.objects.create_user(displayName='live1', password='pwd', github='', profileImage=None)
+        self.remote = User.objects.create_user(displayName='live2', password='pwd', github='', profileImage=None)
+        User.objects.filter(pk=self.remote.pk).update(is_remote=True, url='https://remote.com/api/authors/live2')
+        self.remote.refresh_from_db()
+        models.Follower.objects.create(actor=self.local, object=self.remote)
+
+    def tearDown(self):
+        liveness._checked.clear()
+
+    def _response(self, status_code):
+        response = MagicMock()
+        response.status_code = status_code
+        return response
+
+    @patch('remote_node.util.get_many')
+    def test_unfollowed_remotely(self, mock_get_many):
+        mock_get_many.side_effect = lambda urls: {url: self._response(404) for url in urls}
+        results = liveness.verify([(self.remote, self.local, self.local.url)])
+        self.assertEqual(results, {(self.remote.id, self.local.id): False})
+        self.assertFalse(models.Follower.objects.filter(actor=self.local, object=self.remote).exists())
+
+    @patch('remote_node.util.get_many')
+    def test_checks_are_cached(self, mock_get_many):
+        mock_get_many.side_effect = lambda urls: {url: self._response(200) for url in urls}
+        pairs = [(self.remote, self.local, self.local.url)]
+        self.assertEqual(liveness.verify(pairs), {(self.remote.id, self.local.id): True})
+        self.assertEqual(liveness.verify(pairs), {(self.remote.id, self.local.id): True})
+        self.assertEqual(mock_get_many.call_count, 1)
+
+    @patch('remote_node.util.get_many')
+    def test_unreachable_node_not_cached(self, mock_get_many):
+        mock_get_many.side_effect = lambda urls: {url: None for url in urls}
+        pairs = [(self.remote, self.local, self.local.url)]
+        self.assertEqual(liveness.verify(pairs), {(self.remote.id, self.local.id): True})
+        liveness.verify(pairs)
+        self.assertEqual(mock_get_many.call_count, 2)
+        self.assertTrue(models.Follower.objects.filter(actor=self.local, object=self.remote).exists())
+
+    @patch('remote_node.util.get_many')
+    def test_local_author_not_checked(self, mock_get_many):
+        models.Follower.objects.create(actor=self.remote, object=self.local)
+        self.assertEqual(liveness.verify([(self.local, self.remote, self.remote.url)]), {(self.local.id, self.remote.id): True})
+        mock_get_many.assert_not_called()
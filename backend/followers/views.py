@@ -9,6 +9,7 @@ from restapi.serializers import UserSerializer
 import util.main as util
 import remote_node.util
 from remote_node.models import RemoteNode
+from followers import liveness as follower_liveness
 import os
 import json
 from restapi.models import User
@@ -33,23 +34,17 @@ class FollowerViewSet(viewsets.ModelViewSet):
 
         if 'all' not in request.query_params:
             # search only locally
-            util.log('FollowerViewSet/list', f'Getting followers for author {author_id} LOCALLY: {request.query_params}')
+            util.log('FollowerViewSet/list', 'Getting followers for author %s LOCALLY: %s', author_id, request.query_params)
             try:
                 author = models.User.objects.get(pk=author_id, is_remote=False)
-                followers = models.Follower.objects.filter(object=author)
-
-                for follower in followers:
-                    try:
-                        follower_still_exists = self._check_remote_follower(author, follower.actor, foreign_author_id=follower.actor.url)
-                        if follower_still_exists:
-                            followers_list['items'].append(UserSerializer(follower.actor).data)
-                        else:
-                            util.log('FollowerViewSet/list', f'Follower object does not exist anymore for (object={author}, actor={follower.actor}). Skipping adding to list...')
-                    except Exception as e:
-                        util.log('FollowerViewSet/get_single', f'Error checking remote follower: {e}. Moving on...')
+                followers = list(models.Follower.objects.filter(object=author).select_related('actor'))
+
+                # answer from our own follower rows right away, and check stale follows with the nodes in the background
+                followers_list['items'] = [UserSerializer(follower.actor).data for follower in followers]
+                follower_liveness.verify_in_background([(author, follower.actor, follower.actor.url) for follower in followers])
                 return Response(followers_list, status=status.HTTP_200_OK)
             except models.User.DoesNotExist:
-                util.log('FollowerViewSet/list', f'Author {author_id} does not exist')
+                util.log('FollowerViewSet/list', 'Author %s does not exist', author_id)
                 return Response({'error': f'Author {author_id} does not exist'}, status=status.HTTP_404_NOT_FOUND)
 
         # else, we look through all nodes
@@ -60,23 +55,18 @@ class FollowerViewSet(viewsets.ModelViewSet):
                 node
             )
             try:
-                util.log('FollowerViewSet/list', f'Request URL: {request_url}')
-                auth_token = base64.b64encode(f"{node.displayName}:{node.password}".encode('ascii')).decode('ascii')
-                headers = {
-                    'Authorization': f'Basic {auth_token}',
-                    'Content-Type': 'application/json'
-                }
-                response = requests.get(request_url, headers=headers)
+                util.log('FollowerViewSet/list', 'Request URL: %s', request_url)
+                response = remote_node.util.cached_get(node, request_url)
                 if response.status_code == 200:
                     followers_list['items'] = response.json()['items']
-                    util.log('FollowerViewSet/list', f'Got {len(followers_list["items"])} followers from {request_url}')
+                    util.log('FollowerViewSet/list', 'Got %s followers from %s', len(followers_list["items"]), request_url)
                     return Response(followers_list, status=status.HTTP_200_OK)
                 else:
-                    util.log('FollowerViewSet/list', f'Failed to get followers from {request_url} with status code {response.status_code}. Moving onto next node...')
+                    util.log('FollowerViewSet/list', 'Failed to get followers from %s with status code %s. Moving onto next node...', request_url, response.status_code)
             except Exception as e:
-                util.log('FollowerViewSet/list', f'Error getting followers: {e}. Moving onto next node.')
+                util.log('FollowerViewSet/list', 'Error getting followers: %s. Moving onto next node.', e)
 
-        util.log('FollowerViewSet/list', f'Couldn\'t find followers for author {author_id} in any node. Returning empty list')
+        util.log('FollowerViewSet/list', 'Couldn\'t find followers for author %s in any node. Returning empty list', author_id)
         return Response({'error': f'Could not find author {author_id} in any node.'}, status=status.HTTP_404_NOT_FOUND)
 
 
@@ -91,21 +81,21 @@ class FollowerViewSet(viewsets.ModelViewSet):
         actor_id = util.id_from_url(foreign_author_id)
 
         if 'all' not in request.query_params:
-            util.log('FollowerViewSet/get_single', f'Getting single follower locally: object={object_id} actor={actor_id}')
+            util.log('FollowerViewSet/get_single', 'Getting single follower locally: object=%s actor=%s', object_id, actor_id)
             try:
                 object = models.User.objects.get(pk=object_id)
             except models.User.DoesNotExist:
-                util.log('FollowerViewSet/get_single', f'Object user {object_id} does not exist (followee)')
+                util.log('FollowerViewSet/get_single', 'Object user %s does not exist (followee)', object_id)
                 return Response({'error': f'Object user {object_id} does not exist (Followee)'}, status=status.HTTP_404_NOT_FOUND)
 
             try:
                 actor = models.User.objects.get(pk=actor_id)
             except models.User.DoesNotExist:
-                util.log('FollowerViewSet/get_single', f'Actor user {actor_id} does not exist (follower)')
+                util.log('FollowerViewSet/get_single', 'Actor user %s does not exist (follower)', actor_id)
                 return Response({'error': f'Object user {actor_id} does not exist'}, status=status.HTTP_404_NOT_FOUND)
 
             if not models.Follower.objects.filter(object=object_id, actor=actor_id).exists():
-                util.log('FollowerViewSet/get_single', f'Follower object does not exist (object={object}, actor={actor})')
+                util.log('FollowerViewSet/get_single', 'Follower object does not exist (object=%s, actor=%s)', object, actor)
                 return Response({'error': f'Follower object does not exist (object={object}, actor={actor})'}, status=status.HTTP_404_NOT_FOUND)
 
             object_data = UserSerializer(object).data
@@ -116,7 +106,7 @@ class FollowerViewSet(viewsets.ModelViewSet):
                 if not follower_still_exists:
                     return Response({'error': f'Follower object does not exist anymore for (object={object}, actor={actor})'}, status=status.HTTP_404_NOT_FOUND)
             except Exception as e:
-                util.log('FollowerViewSet/get_single', f'Error checking remote follower: {e}. Moving on...')
+                util.log('FollowerViewSet/get_single', 'Error checking remote follower: %s. Moving on...', e)
 
             return Response({
                 'type': 'follower',
@@ -126,31 +116,26 @@ class FollowerViewSet(viewsets.ModelViewSet):
             })
 
         # else, we look through all nodes
-        util.log('FollowerViewSet/get_single', f'Getting single follower from all nodes: object={object_id} actor={actor_id}')
+        util.log('FollowerViewSet/get_single', 'Getting single follower from all nodes: object=%s actor=%s', object_id, actor_id)
         for node in self.nodes:
             request_url = remote_node.util.transform_url_for_node(
                 f'{node.url.rstrip("/")}/authors/{author_id}/followers/{urllib.parse.quote(foreign_author_id, safe="")}',
                 node
             )
             try:
-                util.log('FollowerViewSet/get_single', f'Request URL: {request_url}')
-                auth_token = base64.b64encode(f"{node.displayName}:{node.password}".encode('ascii')).decode('ascii')
-                headers = {
-                    'Authorization': f'Basic {auth_token}',
-                    'Content-Type': 'application/json'
-                }
-                response = requests.get(request_url, headers=headers)
+                util.log('FollowerViewSet/get_single', 'Request URL: %s', request_url)
+                response = remote_node.util.cached_get(node, request_url)
                 if response.status_code == 200:
                     follower_json = response.json()
-                    util.log('FollowerViewSet/get_single', f'Got 200 response from {request_url}:')
+                    util.log('FollowerViewSet/get_single', 'Got 200 response from %s:', request_url)
                     print(json.dumps(follower_json, indent=2))
                     return Response(follower_json, status=status.HTTP_200_OK)
                 else:
-                    util.log('FollowerViewSet/get_single', f'Failed to get follower {foreign_author_id} from {request_url} with status code {response.status_code}. Moving onto next node...')
+                    util.log('FollowerViewSet/get_single', 'Failed to get follower %s from %s with status code %s. Moving onto next node...', foreign_author_id, request_url, response.status_code)
             except Exception as e:
-                util.log('FollowerViewSet/get_single', f'Error getting follower: {e}. Moving onto next node.')
+                util.log('FollowerViewSet/get_single', 'Error getting follower: %s. Moving onto next node.', e)
 
-        util.log('FollowerViewSet/get_single', f'Could not find follower data author={author_id}, actor={foreign_author_id} in any node. Returning 404')
+        util.log('FollowerViewSet/get_single', 'Could not find follower data author=%s, actor=%s in any node. Returning 404', author_id, foreign_author_id)
         return Response({'error': f'Could not find follower data author={author_id}, actor={foreign_author_id} in any node.'}, status=status.HTTP_404_NOT_FOUND)
 
     def update(self, request, author_id=None, foreign_author_id=None, *args, **kwargs):
@@ -167,7 +152,7 @@ class FollowerViewSet(viewsets.ModelViewSet):
             return Response(status=status.HTTP_403_FORBIDDEN)
 
         # ensure user is logged in (in any way)
-        util.log('FollowerViewSet/update', f'Update follow request: {request.user.is_authenticated} {request.user}')
+        util.log('FollowerViewSet/update', 'Update follow request: %s %s', request.user.is_authenticated, request.user)
         if not request.user.is_authenticated:
             return Response(status=status.HTTP_403_FORBIDDEN)
         try:
@@ -195,7 +180,7 @@ class FollowerViewSet(viewsets.ModelViewSet):
         except models.Follower.DoesNotExist:
             pass
         
-        util.log('FollowerViewSet/update', f'Making {actor.displayName} follow {author.displayName}')
+        util.log('FollowerViewSet/update', 'Making %s follow %s', actor.displayName, author.displayName)
         serializer = serializers.FollowerSerializer(data={
             'object': author.id,
             'actor': actor.id
@@ -211,7 +196,7 @@ class FollowerViewSet(viewsets.ModelViewSet):
             }
             return Response(returnData, status=status.HTTP_201_CREATED)
         else:
-            util.log('FollowerViewSet/update', f'Error creating follower: {serializer.errors}')
+            util.log('FollowerViewSet/update', 'Error creating follower: %s', serializer.errors)
             return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
 
@@ -228,12 +213,12 @@ class FollowerViewSet(viewsets.ModelViewSet):
 
         # check if the author exists locally
         if not models.User.objects.filter(pk=author_id).exists():
-            util.log('FollowerViewSet/destroy', f'Author {author_id} does not exist (followee)')
+            util.log('FollowerViewSet/destroy', 'Author %s does not exist (followee)', author_id)
             return Response({'error': f'Author {author_id} not found (follower)'}, status=status.HTTP_404_NOT_FOUND)
 
         # test that actor exists locally
         if not models.User.objects.filter(pk=actor_id).exists():
-            util.log('FollowerViewSet/destroy', f'Actor {actor_id} does not exist (follower)')
+            util.log('FollowerViewSet/destroy', 'Actor %s does not exist (follower)', actor_id)
             return Response({'error': f'Actor {actor_id} not found (followee)'}, status=status.HTTP_404_NOT_FOUND)
 
         author = models.User.objects.get(pk=author_id)
@@ -242,7 +227,7 @@ class FollowerViewSet(viewsets.ModelViewSet):
         if author.is_remote and 'linkup1' in author.url:
             # we are trying to unfollow a user from TeamHTTP. Send them an "unfollow" inbox
             inbox_url = f"{author.url.rstrip('/')}/inbox"
-            util.log('FollowerViewSet/destroy', f'Author is remote and from HTTP. Sending unfollow inbox to {inbox_url}')
+            util.log('FollowerViewSet/destroy', 'Author is remote and from HTTP. Sending unfollow inbox to %s', inbox_url)
             data = {
                 'type': 'unfollow',
                 'summary': f'{actor.displayName} unfollowed {author.displayName}.',
@@ -254,7 +239,7 @@ class FollowerViewSet(viewsets.ModelViewSet):
                 'author': author.url,
                 'items': [data]
             }
-            util.log('FollowerViewSet/destroy', f'Sending unfollow inbox to {author.url} in team HTTP')
+            util.log('FollowerViewSet/destroy', 'Sending unfollow inbox to %s in team HTTP', author.url)
             print(json.dumps(inbox_item, indent=2))
             print(inbox_item)
             response = remote_node.util.post(inbox_url, inbox_item)
@@ -265,14 +250,14 @@ class FollowerViewSet(viewsets.ModelViewSet):
         elif author.is_remote and 'lostone' in author.url:
             # we are trying to unfollow a user from team Lost. Send them an "unfollow" inbox
             inbox_url = f"{author.url.rstrip('/')}/inbox/"
-            util.log('FollowerViewSet/destroy', f'Author is remote and from HTTP. Sending unfollow inbox to {inbox_url}')
+            util.log('FollowerViewSet/destroy', 'Author is remote and from HTTP. Sending unfollow inbox to %s', inbox_url)
             data = {
                 'type': 'Unfollow',
                 'summary': f'{actor.displayName} unfollowed {author.displayName}.',
                 'actor': UserSerializer(actor).data,
                 'object': UserSerializer(author).data
             }
-            util.log('FollowerViewSet/destroy', f'Sending unfollow inbox to {author.url} in team Lost')
+            util.log('FollowerViewSet/destroy', 'Sending unfollow inbox to %s in team Lost', author.url)
             print(json.dumps(data, indent=2))
             print(data)
             response = remote_node.util.post(inbox_url, data)
@@ -300,28 +285,9 @@ class FollowerViewSet(viewsets.ModelViewSet):
         now, check if object is remote
         If they are, we need to check the appropriate remote nodes to see if the follower exists (e.g. if the remote user unfollowed)
         if the remote use unfollowed, we should delete the local follower entry
+        (checks are cached for FOLLOWER_LIVENESS_TTL seconds, see followers/liveness.py)
 
         returns False if the follower does not exist
         returns True if it does
         '''
-        # check if "linkup1" is NOT in object.url because team HTTP does not do things this way.
-        # team lost also does not do things this way, so escape
-        if object.is_remote and 'linkup1' not in object.url and 'lostone' not in object.url:
-            util.log('FollowerViewSet/get_single', f'User "{object} is remote. Checking remote if {actor} still follows {object}"')
-            object_follower_url = object.url.rstrip('/') + '/followers/' + urllib.parse.quote(foreign_author_id, safe='')
-            util.log('FollowerViewSet/get_single', f'getting url: {object_follower_url}')
-            response = remote_node.util.get(object_follower_url)
-            if response.status_code == 200:
-                # we're good, continuing
-                util.log('FollowerViewSet/get_single', f'Got 200 response from {object_follower_url}, so {actor} still follows {object}. We are good!')
-                return True
-            elif response.status_code == 404:
-                # the follower does not exist, so we should delete the local follower entry
-                util.log('FollowerViewSet/get_single', f'Got 404 response from {object_follower_url}, so {actor} does not follow {object}. Deleting local follower entry...')
-                models.Follower.objects.get(object=object, actor=actor).delete()
-                return False
-            else:
-                util.log('FollowerViewSet/get_single', f'Failed to get follower from {object_follower_url} with status code {response.status_code}. Skipping.')
-                return True
-        else:
-            return True
+        return follower_liveness.verify([(object, actor, foreign_author_id)])[(object.id, actor.id)]
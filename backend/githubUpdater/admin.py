@@ -0,0 +1,15 @@
+from django.contrib import admin
+
+# Register your models here.
+from .models import GithubSync
+
+class GithubSyncAdmin(admin.ModelAdmin):
+    list_display = [
+        'author',
+        'github_id',
+        'last_synced',
+        'last_status',
+        'last_error',
+    ]
+
+admin.site.register(GithubSync, GithubSyncAdmin)
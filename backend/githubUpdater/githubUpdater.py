@@ -1,8 +1,30 @@
+'''
+Syncs the public GitHub activity of our authors into posts
+
+Authors are fetched in parallel (GITHUB_SYNC_WORKERS threads, which only do HTTP), and each request
+sends the ETag of the author's last response, so GitHub answers 304 when nothing changed.
+New events are checked against the existing posts with one query and inserted with one bulk_create.
+'''
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Q
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+from requests.adapters import HTTPAdapter
+from githubUpdater.models import GithubSync
 from post.models import Post
 from restapi.models import User
 import requests
 import util.main as util
 
+GITHUB_API_URL = 'https://api.github.com'
+
+# keep-alive connections to the GitHub API, shared by the worker threads
+_session = requests.Session()
+_session.mount('https://', HTTPAdapter(pool_maxsize=settings.GITHUB_SYNC_WORKERS))
+_pool = ThreadPoolExecutor(max_workers=settings.GITHUB_SYNC_WORKERS, thread_name_prefix='github')
+
 
 def generateSummary(event):
     ''' 
@@ -41,57 +63,156 @@ def generateSummary(event):
         util.log('generateSummary', event)
         raise
 
-def updateGithubSingle(author_id):
+# authors with a GitHub URL (compared ignoring case, like GitHub does)
+HAS_GITHUB = Q(github__icontains='github.com/')
+
+def has_github(author: User) -> bool:
     '''
-    Updates the posts in the database with the posts from the GitHub API
+    Whether an author has a GitHub URL (the same test as HAS_GITHUB)
     '''
-    github_url = User.objects.get(pk=author_id).github
-    github_id =  github_url.rstrip('/').split('/')[-1]
+    return _github_id(author.github) != ''
 
-    response = requests.get(f'https://api.github.com/users/{github_id}/events/public')
-    if response.status_code != 200:
-        util.log('updateGithubSingle', f'Could not get events for {github_id} from GitHub API: {response.status_code}')
-        return []
-    events = response.json()
+def github_id_from_url(github_url: str) -> str:
+    '''
+    e.g. https://github.com/uofa-cmput404 -> uofa-cmput404
+    '''
+    return github_url.rstrip('/').split('/')[-1]
 
-    new_posts = []
+def fetch_events(github_id: str, etag: str) -> requests.Response:
+    '''
+    GET a GitHub user's public events (runs on a worker thread, so no database access here)
+    '''
+    headers = {'Accept': 'application/vnd.github+json'}
+    if etag:
+        headers['If-None-Match'] = etag
+    if settings.GITHUB_TOKEN:
+        headers['Authorization'] = f'Bearer {settings.GITHUB_TOKEN}'
+    return _session.get(f'{GITHUB_API_URL}/users/{github_id}/events/public', headers=headers, timeout=settings.GITHUB_SYNC_TIMEOUT)
 
+def build_posts(author: User, github_id: str, events: list) -> list:
+    '''
+    Unsaved posts for the events that have a summary
+    '''
+    posts = []
     for event in events:
         summary = generateSummary(event)
         if summary is None:
             continue
-        post_id = author_id + '-' + event['id']
+        posts.append(Post(
+            id=f'{author.id}-{event["id"]}',
+            author=author,
+            title=f'Github Activity: {github_id}',
+            description='',
+            content=summary,
+            source=event['repo']['url'],
+            origin=event['repo']['url'],
+            visibility='PUBLIC',
+            isGithub=True,
+            published=parse_datetime(event['created_at']),
+        ))
+    return posts
+
+def _github_id(github: str) -> str:
+    '''
+    The GitHub username a GithubSync is for ('' for authors without a GitHub URL)
+    '''
+    return github_id_from_url(github) if 'github.com/' in (github or '').lower() else ''
+
+def sync_authors(authors) -> list:
+    '''
+    Fetch the GitHub activity of several authors at once and add the new events as posts.
+    Authors without a GitHub URL aren't fetched, but are still marked as synced. Returns the new posts.
+    '''
+    # a sync asked for after this is kept for the next round
+    started = timezone.now()
+    authors = list(authors)
+    syncs = GithubSync.objects.in_bulk([author.pk for author in authors])
+
+    # ensure that the author's github is a valid github url
+    for author in [author for author in authors if not has_github(author)]:
+        sync = syncs.get(author.pk)
+        if sync is None:
+            sync = syncs[author.pk] = GithubSync(author=author)
+        sync.github_id = ''
+        sync.last_synced = timezone.now()
+        sync.last_status = None
+        sync.last_error = 'No GitHub URL'
+    authors = [author for author in authors if has_github(author)]
+
+    futures = {}
+    for author in authors:
+        github_id = github_id_from_url(author.github)
+        sync = syncs.get(author.pk)
+        if sync is None:
+            sync = syncs[author.pk] = GithubSync(author=author, github_id=github_id)
+        elif sync.github_id != github_id:
+            # the author changed their GitHub: the old ETag means nothing now
+            sync.github_id = github_id
+            sync.etag = ''
+        futures[_pool.submit(fetch_events, github_id, sync.etag)] = author
+
+    candidates = []
+    for future in as_completed(futures):
+        author = futures[future]
+        sync = syncs[author.pk]
+        sync.last_synced = timezone.now()
+        try:
+            response = future.result()
+        except requests.RequestException as e:
+            util.log('sync_authors', 'Could not get events for %s from GitHub API: %s', sync.github_id, e)
+            sync.last_status = None
+            sync.last_error = str(e)
+            continue
 
+        sync.last_status = response.status_code
+        if response.status_code == 304:
+            # nothing new since the last sync
+            sync.last_error = ''
+            continue
+        if response.status_code != 200:
+            util.log('sync_authors', 'Could not get events for %s from GitHub API: %s', sync.github_id, response.status_code)
+            sync.last_error = response.text[:500]
+            continue
         try:
-            Post.objects.get(pk=post_id)
-        except Post.DoesNotExist:
-            date = event['created_at']
-            post_data = {
-                'id': post_id,
-                'author': User.objects.get(pk=author_id),
-                'title': f'Github Activity: {github_id}',
-                'description': '',
-                'content': summary,
-                'source': event['repo']['url'],
-                'origin': event['repo']['url'],
-                'visibility': 'PUBLIC',
-                'isGithub': True,
-            }
-            new = Post.objects.create(**post_data)
-            new.published = event['created_at']
-            new.save()
-            new_posts.append(new)
+            posts = build_posts(author, sync.github_id, response.json())
+        except Exception as e:
+            # a malformed response or event only fails this author. The ETag is kept, so the events are fetched again
+            util.log('sync_authors', 'Could not read the events of %s: %r', sync.github_id, e)
+            sync.last_error = f'Could not read events: {e!r}'[:500]
+            continue
+        sync.last_error = ''
+        sync.etag = response.headers.get('ETag', '')
+        candidates.extend(posts)
 
+    with transaction.atomic():
+        # authors who changed their GitHub while it was being fetched: their old events aren't stored
+        # (the view deleted them), and their request_sync() is left for the next round
+        current = dict(User.objects.filter(pk__in=syncs).values_list('pk', 'github'))
+        changed = {pk for pk, sync in syncs.items() if _github_id(current.get(pk)) != sync.github_id}
+        candidates = [post for post in candidates if post.author_id not in changed]
+        syncs = [sync for pk, sync in syncs.items() if pk not in changed]
+
+        # one query for the events we already have posts for
+        existing = set(Post.objects.filter(id__in=[post.id for post in candidates]).values_list('id', flat=True))
+        new_posts = [post for post in candidates if post.id not in existing]
+
+        # ignore_conflicts in case another sync added the same events (or request_sync() the same sync) in the meantime
+        Post.objects.bulk_create(new_posts, ignore_conflicts=True)
+        GithubSync.objects.bulk_create([sync for sync in syncs if sync._state.adding], ignore_conflicts=True)
+        GithubSync.objects.bulk_update(
+            [sync for sync in syncs if not sync._state.adding],
+            ['github_id', 'etag', 'last_synced', 'last_status', 'last_error'],
+        )
+        GithubSync.objects.filter(pk__in=[sync.pk for sync in syncs], requested_at__lte=started).update(requested_at=None)
     return new_posts
 
+def updateGithubSingle(author_id):
+    '''
+    Updates the posts in the database with the posts from the GitHub API
+    '''
+    return sync_authors([User.objects.get(pk=author_id)])
+
 def updateGithubAll():
     # Get all authors
-    authors = User.objects.filter(is_active=True, is_remote=False, is_node=False)
-    new_posts = []
-    for author in authors:
-        # ensure that the author's github is a valid github url
-        if 'github.com/' not in author.github:
-            continue
-        added = updateGithubSingle(author.id)
-        new_posts.extend(added)
-    return new_posts
\ No newline at end of file
+    authors = User.objects.filter(HAS_GITHUB, is_active=True, is_remote=False, is_node=False)
+    return sync_authors(authors)
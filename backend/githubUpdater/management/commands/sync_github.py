@@ -0,0 +1,29 @@
+from django.core.management.base import BaseCommand
+from django.db import connection
+import time
+
+from githubUpdater import scheduler
+
+# python manage.py sync_github [--once] [--interval SECONDS]
+
+class Command(BaseCommand):
+    help = "sync the GitHub activity of authors that are due (see githubUpdater/scheduler.py)."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--once', action='store_true', help='sync every author that is due, then exit')
+        parser.add_argument('--interval', type=float, default=60.0, help='seconds to wait between polls when nobody is due')
+
+    def handle(self, *args, **options):
+        if options['once']:
+            synced = scheduler.drain()
+            print(f'Synced {synced} authors.')
+            return
+
+        print('Syncing GitHub activity. Press Ctrl+C to stop.')
+        while True:
+            synced = scheduler.drain()
+            if synced:
+                print(f'Synced {synced} authors.')
+            # don't hold a connection open while idle
+            connection.close()
+            time.sleep(options['interval'])
@@ -0,0 +1,28 @@
+# Generated by Django 5.0.14 on 2026-10-18 15:13
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    initial = True
+
+    dependencies = [
+        ('restapi', '0004_user_is_remote'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='GithubSync',
+            fields=[
+                ('author', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='github_sync', serialize=False, to=settings.AUTH_USER_MODEL)),
+                ('github_id', models.CharField(help_text='the GitHub username the ETag belongs to', max_length=250)),
+                ('etag', models.CharField(blank=True, help_text='ETag of the last events response', max_length=250)),
+                ('last_synced', models.DateTimeField(blank=True, help_text='when GitHub was last asked for events', null=True)),
+                ('last_status', models.IntegerField(blank=True, help_text='status code of the last events response', null=True)),
+                ('last_error', models.TextField(blank=True)),
+            ],
+        ),
+    ]
@@ -0,0 +1,24 @@
+# Generated by Django 5.0.14 on 2026-10-18 15:15
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('githubUpdater', '0001_initial'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='githubsync',
+            name='requested_at',
+            field=models.DateTimeField(blank=True, help_text="when a sync was asked for, if it hasn't run yet", null=True),
+        ),
+        migrations.AddIndex(
+            model_name='githubsync',
+            index=models.Index(fields=['last_synced'], name='githubUpdat_last_sy_5aa0be_idx'),
+        ),
+    ]
@@ -0,0 +1,40 @@
+from django.db import models
+from restapi.models import User
+
+# Create your models here.
+class GithubSync(models.Model):
+    '''
+    Where we are in syncing an author's GitHub activity.
+
+    The ETag of the last events response is sent back as If-None-Match, so GitHub can
+    answer 304 (which doesn't count against the rate limit) when nothing happened.
+    '''
+    author = models.OneToOneField(User, on_delete=models.CASCADE, primary_key=True, related_name='github_sync')
+    github_id = models.CharField(max_length=250, help_text="the GitHub username the ETag belongs to")
+    etag = models.CharField(max_length=250, blank=True, help_text="ETag of the last events response")
+    last_synced = models.DateTimeField(blank=True, null=True, help_text="when GitHub was last asked for events")
+    last_status = models.IntegerField(blank=True, null=True, help_text="status code of the last events response")
+    last_error = models.TextField(blank=True)
+    requested_at = models.DateTimeField(blank=True, null=True, help_text="when a sync was asked for, if it hasn't run yet")
+
+    class Meta:
+        indexes = [
+            # the scheduler syncs the least recently synced authors first
+            models.Index(fields=['last_synced']),
+        ]
+
+    @property
+    def status(self):
+        '''
+        queued, failed, synced or never (synced)
+        '''
+        if self.requested_at is not None:
+            return 'queued'
+        if self.last_error:
+            return 'failed'
+        if self.last_synced is not None:
+            return 'synced'
+        return 'never'
+
+    def __str__(self):
+        return f"GitHub sync of {self.author}"
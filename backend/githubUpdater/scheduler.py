@@ -0,0 +1,153 @@
+'''
+Background GitHub sync
+
+Authors' GitHub activity used to be synced inside `PUT /api/update_github` and author updates, which
+could take longer than the router timeout. Now those requests only wake up the scheduler, and the
+sync happens in the background, by:
+
+- a scheduler thread in the web process (can be turned off with GITHUB_SYNC_IN_PROCESS), and/or
+- the `python manage.py sync_github` worker command.
+
+Each round syncs the GITHUB_SYNC_BATCH_SIZE authors that are due: first the ones a sync was asked
+for (request_sync), then the ones synced longest ago, so authors are spread over GITHUB_SYNC_INTERVAL.
+'''
+import logging
+import threading
+from datetime import timedelta
+from django.conf import settings
+from django.db import connection, transaction
+from django.db.models import F, Min, Q
+from django.utils import timezone
+from githubUpdater.githubUpdater import HAS_GITHUB, github_id_from_url, sync_authors
+from githubUpdater.models import GithubSync
+from restapi.models import User
+import util.main
+
+def syncable_authors():
+    '''
+    Local authors with a GitHub URL
+    '''
+    return User.objects.filter(HAS_GITHUB, is_active=True, is_remote=False, is_node=False)
+
+def due_authors(limit: int) -> list:
+    '''
+    Up to `limit` authors whose GitHub activity should be synced now, most overdue first
+    '''
+    cutoff = timezone.now() - timedelta(seconds=settings.GITHUB_SYNC_INTERVAL)
+    return list(syncable_authors().filter(
+        Q(github_sync__isnull=True) |
+        Q(github_sync__requested_at__isnull=False) |
+        Q(github_sync__last_synced__isnull=True) |
+        Q(github_sync__last_synced__lt=cutoff)
+    ).order_by(
+        F('github_sync__requested_at').asc(nulls_last=True),
+        F('github_sync__last_synced').asc(nulls_first=True),
+    )[:limit])
+
+def _sync(authors: list) -> None:
+    new_posts = sync_authors(authors)
+    util.main.log('scheduler/sync_due', 'Synced %s author(s), %s new github post(s)', len(authors), len(new_posts))
+
+def sync_due(limit: int = None) -> int:
+    '''
+    Sync one batch of due authors. Returns how many authors were synced.
+    '''
+    authors = due_authors(limit or settings.GITHUB_SYNC_BATCH_SIZE)
+    if authors:
+        _sync(authors)
+    return len(authors)
+
+def drain() -> int:
+    '''
+    Sync batches until no author is due. Returns how many authors were synced.
+    '''
+    total = 0
+    synced = set()
+    while True:
+        authors = due_authors(settings.GITHUB_SYNC_BATCH_SIZE)
+        if not authors:
+            return total
+        if all(author.pk in synced for author in authors):
+            # everyone left was already synced in this round but is still due: stop instead of spinning
+            util.main.log('scheduler/drain', 'Authors %s are still due after syncing them', [author.pk for author in authors], level=logging.WARNING)
+            return total
+        _sync(authors)
+        synced.update(author.pk for author in authors)
+        total += len(authors)
+
+def next_due_in() -> float:
+    '''
+    Seconds until the next author is due (0 if one is due now), or None if there's nobody to sync
+    '''
+    authors = syncable_authors()
+    if authors.filter(Q(github_sync__isnull=True) | Q(github_sync__requested_at__isnull=False)).exists():
+        return 0
+    last_synced = authors.aggregate(last_synced=Min('github_sync__last_synced'))['last_synced']
+    if last_synced is None:
+        return None
+    due_at = last_synced + timedelta(seconds=settings.GITHUB_SYNC_INTERVAL)
+    return max((due_at - timezone.now()).total_seconds(), 0)
+
+def request_sync(author: User) -> None:
+    '''
+    Sync an author as soon as possible (e.g. after they changed their GitHub)
+    '''
+    GithubSync.objects.update_or_create(
+        author=author,
+        defaults={'requested_at': timezone.now()},
+        create_defaults={'requested_at': timezone.now(), 'github_id': github_id_from_url(author.github or '')},
+    )
+    transaction.on_commit(kick)
+
+def statuses(authors=None) -> list:
+    '''
+    The sync status of each syncable author (or of the given authors)
+    '''
+    authors = list(syncable_authors() if authors is None else authors)
+    syncs = GithubSync.objects.in_bulk([author.pk for author in authors])
+    items = []
+    for author in authors:
+        sync = syncs.get(author.pk) or GithubSync(author=author)
+        items.append({
+            'author': author.url,
+            'github': author.github,
+            'status': sync.status,
+            'last_synced': sync.last_synced,
+            'last_status': sync.last_status,
+            'last_error': sync.last_error,
+            'requested_at': sync.requested_at,
+        })
+    return items
+
+# in-process scheduler
+_wake = threading.Event()
+_scheduler = None
+_scheduler_lock = threading.Lock()
+
+def _schedule() -> None:
+    timeout = None
+    while True:
+        _wake.wait(timeout=timeout)
+        _wake.clear()
+        try:
+            drain()
+            # sleep until the next author is due, or until someone asks for a sync
+            timeout = next_due_in()
+        except Exception as e:
+            util.main.log('scheduler/_schedule', 'Error syncing github: %s', e, level=logging.ERROR)
+            timeout = settings.GITHUB_SYNC_INTERVAL
+        finally:
+            connection.close()
+
+def kick() -> None:
+    '''
+    Wake up the in-process scheduler (starting it the first time)
+    '''
+    global _scheduler
+    if not settings.GITHUB_SYNC_IN_PROCESS:
+        return
+    with _scheduler_lock:
+        if _scheduler is None or not _scheduler.is_alive():
+            _scheduler = threading.Thread(target=_schedule, name='github-scheduler', daemon=True)
+            _scheduler.start()
+    _wake.set()
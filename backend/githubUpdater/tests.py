@@ -0,0 +1,163 @@
+from datetime import timedelta
+from django.test import TestCase
+from django.utils import timezone
+from unittest.mock import MagicMock, call, patch
+from githubUpdater import githubUpdater, scheduler
+from githubUpdater.models import GithubSync
+from post.models import Post
+from restapi.models import User
+
+# Create your tests here.
+
+class GithubSyncTest(TestCase):
+    '''
+    Tests the GitHub activity sync: conditional requests and deduplication
+    '''
+    def setUp(self):
+        self.author = User.objects.create_user(
+            displayName='octo',
+            password='pwd',
+            github='https://github.com/octocat',
+            profileImage=None,
+        )
+        self.events = [
+            {
+                'id': '1',
+                'type': 'WatchEvent',
+                'repo': {'name': 'octocat/hello', 'url': 'https://api.github.com/repos/octocat/hello'},
+                'created_at': '2024-03-01T10:00:00Z',
+            },
+            {
+                # events without a summary are skipped
+                'id': '2',
+                'type': 'GollumEvent',
+                'repo': {'name': 'octocat/hello', 'url': 'https://api.github.com/repos/octocat/hello'},
+                'created_at': '2024-03-02T10:00:00Z',
+            },
+        ]
+
+    def _response(self, status_code, events=None, etag=''):
+        response = MagicMock(status_code=status_code, headers={'ETag': etag})
+        response.json.return_value = events
+        return response
+
+    def test_sync(self):
+        with patch('githubUpdater.githubUpdater.fetch_events', return_value=self._response(200, self.events, 'W/"abc"')) as mock_fetch:
+            new_posts = githubUpdater.updateGithubSingle(self.author.id)
+        mock_fetch.assert_called_once_with('octocat', '')
+        self.assertEqual([post.id for post in new_posts], [f'{self.author.id}-1'])
+
+        post = Post.objects.get(pk=f'{self.author.id}-1')
+        self.assertTrue(post.isGithub)
+        self.assertEqual(post.published.isoformat(), '2024-03-01T10:00:00+00:00')
+        self.assertEqual(GithubSync.objects.get(author=self.author).etag, 'W/"abc"')
+
+    def test_not_modified(self):
+        GithubSync.objects.create(author=self.author, github_id='octocat', etag='W/"abc"')
+        with patch('githubUpdater.githubUpdater.fetch_events', return_value=self._response(304)) as mock_fetch:
+            self.assertEqual(githubUpdater.updateGithubAll(), [])
+        mock_fetch.assert_called_once_with('octocat', 'W/"abc"')
+        self.assertEqual(GithubSync.objects.get(author=self.author).last_status, 304)
+
+    def test_existing_posts_are_skipped(self):
+        with patch('githubUpdater.githubUpdater.fetch_events', return_value=self._response(200, self.events)):
+            githubUpdater.updateGithubAll()
+            self.assertEqual(githubUpdater.updateGithubAll(), [])
+        self.assertEqual(Post.objects.filter(author=self.author).count(), 1)
+
+    def test_github_changed(self):
+        GithubSync.objects.create(author=self.author, github_id='someoneelse', etag='W/"abc"')
+        with patch('githubUpdater.githubUpdater.fetch_events', return_value=self._response(304)) as mock_fetch:
+            githubUpdater.updateGithubAll()
+        # the ETag of the old account isn't sent
+        mock_fetch.assert_called_once_with('octocat', '')
+
+    def test_malformed_events(self):
+        other = User.objects.create_user(displayName='hubot', password='pwd', github='https://github.com/hubot', profileImage=None)
+        # a push without commits can't be summarized
+        malformed = [{'id': '3', 'type': 'PushEvent', 'repo': {'name': 'octocat/hello'}, 'payload': {'commits': []}}]
+        responses = {'octocat': self._response(200, malformed, 'W/"bad"'), 'hubot': self._response(200, self.events, 'W/"good"')}
+        with patch('githubUpdater.githubUpdater.fetch_events', side_effect=lambda github_id, etag: responses[github_id]):
+            new_posts = githubUpdater.updateGithubAll()
+        self.assertEqual([post.id for post in new_posts], [f'{other.id}-1'])
+
+        failed = GithubSync.objects.get(author=self.author)
+        self.assertIn('IndexError', failed.last_error)
+        self.assertEqual(failed.etag, '')
+        self.assertIsNotNone(failed.last_synced)
+        self.assertEqual(GithubSync.objects.get(author=other).etag, 'W/"good"')
+        # neither author is due again until the next interval
+        self.assertEqual(scheduler.due_authors(10), [])
+
+    def test_github_changed_during_sync(self):
+        def events():
+            # the author picks another GitHub while their events are being read
+            User.objects.filter(pk=self.author.pk).update(github='https://github.com/hubot')
+            with patch('githubUpdater.scheduler.kick'):
+                scheduler.request_sync(User.objects.get(pk=self.author.pk))
+            return self.events
+
+        response = self._response(200, etag='W/"abc"')
+        response.json.side_effect = events
+        with patch('githubUpdater.githubUpdater.fetch_events', return_value=response):
+            self.assertEqual(githubUpdater.updateGithubAll(), [])
+        self.assertFalse(Post.objects.filter(author=self.author).exists())
+        # the new request is still queued
+        self.assertEqual(GithubSync.objects.get(author=self.author).status, 'queued')
+        self.assertEqual(scheduler.due_authors(10), [self.author])
+
+
+class GithubSchedulerTest(TestCase):
+    '''
+    Tests that authors are synced in the background, most overdue first
+    '''
+    def setUp(self):
+        self.authors = [
+            User.objects.create_user(displayName=f'author{i}', password='pwd', github=f'https://github.com/author{i}', profileImage=None)
+            for i in range(3)
+        ]
+        # no github: never synced
+        User.objects.create_user(displayName='nogithub', password='pwd', github='', profileImage=None)
+        now = timezone.now()
+        GithubSync.objects.create(author=self.authors[0], github_id='author0', last_synced=now)
+        GithubSync.objects.create(author=self.authors[1], github_id='author1', last_synced=now - timedelta(days=1))
+
+    def test_due_authors(self):
+        # never synced first, then the longest ago. author0 was just synced
+        self.assertEqual(scheduler.due_authors(10), [self.authors[2], self.authors[1]])
+        self.assertEqual(scheduler.due_authors(1), [self.authors[2]])
+
+    def test_request_sync(self):
+        with self.captureOnCommitCallbacks(execute=True), patch('githubUpdater.scheduler.kick') as mock_kick:
+            scheduler.request_sync(self.authors[0])
+        mock_kick.assert_called_once()
+        self.assertEqual(scheduler.due_authors(10)[0], self.authors[0])
+        self.assertEqual(GithubSync.objects.get(author=self.authors[0]).status, 'queued')
+
+        with patch('githubUpdater.githubUpdater.fetch_events', return_value=MagicMock(status_code=304)):
+            self.assertEqual(scheduler.drain(), 3)
+        self.assertEqual(scheduler.due_authors(10), [])
+        self.assertEqual(GithubSync.objects.get(author=self.authors[0]).status, 'synced')
+
+    def test_github_url_case(self):
+        shouty = User.objects.create_user(displayName='shouty', password='pwd', github='https://GitHub.com/Foo', profileImage=None)
+        with patch('githubUpdater.githubUpdater.fetch_events', return_value=MagicMock(status_code=304)) as mock_fetch:
+            self.assertEqual(scheduler.drain(), 3)
+        self.assertIn(call('Foo', ''), mock_fetch.call_args_list)
+        self.assertEqual(GithubSync.objects.get(author=shouty).status, 'synced')
+        self.assertGreater(scheduler.next_due_in(), 0)
+
+    def test_drain_stops_without_progress(self):
+        # a sync that doesn't record anything leaves the authors due
+        with patch('githubUpdater.scheduler.sync_authors', return_value=[]) as mock_sync:
+            self.assertEqual(scheduler.drain(), 2)
+        mock_sync.assert_called_once()
+
+    def test_put_only_enqueues(self):
+        with patch('githubUpdater.scheduler.kick') as mock_kick, patch('githubUpdater.githubUpdater.sync_authors') as mock_sync:
+            response = self.client.put('/api/update_github')
+        self.assertEqual(response.status_code, 202)
+        mock_kick.assert_called_once()
+        mock_sync.assert_not_called()
+        self.assertEqual(response.data, {'type': 'github-sync', 'status': 'queued'})
+        self.assertEqual(len(self.client.get('/api/update_github').data['items']), 3)
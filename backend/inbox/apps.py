@@ -4,3 +4,7 @@ from django.apps import AppConfig
 class InboxConfig(AppConfig):
     default_auto_field = "django.db.models.BigAutoField"
     name = "inbox"
+
+    def ready(self):
+        # connect the signal receivers that clear inbox snapshots when their post or comment changes
+        from . import snapshots
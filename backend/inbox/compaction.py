@@ -0,0 +1,95 @@
+'''
+Inbox compaction
+
+Inbox rows used to pile up forever (the only cleanup was deleting a whole inbox, which left its
+InboxPost/InboxComment/FollowRequest rows behind). `python manage.py compact_inbox` keeps them in check:
+
+- items older than INBOX_RETENTION_DAYS are deleted (if set),
+- repeated like notifications on the same object are collapsed into the newest one, whose `count` says
+  how many likes it stands for (the Like rows themselves are kept, they're the post's likes),
+- each author keeps only their newest INBOX_MAX_PER_AUTHOR items,
+- follow requests are never expired or capped: deleting one would drop a follow the author hasn't answered,
+- InboxPost, InboxComment and FollowRequest rows no inbox item points at anymore are deleted.
+'''
+from datetime import timedelta
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Count, Max, Q, Sum
+from django.utils import timezone
+from inbox import models
+import util.main
+
+def expire() -> int:
+    '''
+    Delete the items (but not follow requests) older than INBOX_RETENTION_DAYS. Returns how many were deleted.
+    '''
+    if not settings.INBOX_RETENTION_DAYS:
+        return 0
+    cutoff = timezone.now() - timedelta(days=settings.INBOX_RETENTION_DAYS)
+    deleted, _ = models.Inbox.objects.filter(published__lt=cutoff).exclude(type='follow').delete()
+    return deleted
+
+def collapse_likes() -> int:
+    '''
+    Collapse the like notifications each author got for the same object into the newest one.
+    Returns how many items were removed.
+    '''
+    groups = models.Inbox.objects.filter(type='like', like__isnull=False).values('author', 'like__object').annotate(
+        entries=Count('id'), total=Sum('count'), newest=Max('id'),
+    ).filter(entries__gt=1)
+
+    removed = 0
+    for group in groups:
+        with transaction.atomic():
+            # the snapshot is taken again with the new count on the next read
+            models.Inbox.objects.filter(pk=group['newest']).update(count=group['total'], snapshot=None)
+            deleted, _ = models.Inbox.objects.filter(
+                author=group['author'], type='like', like__object=group['like__object'],
+            ).exclude(pk=group['newest']).delete()
+        removed += deleted
+    return removed
+
+def cap() -> int:
+    '''
+    Delete all but each author's newest INBOX_MAX_PER_AUTHOR items (not counting follow requests).
+    Returns how many were deleted.
+    '''
+    limit = settings.INBOX_MAX_PER_AUTHOR
+    if not limit:
+        return 0
+    # pending follow requests are kept, and don't count towards the cap
+    capped = models.Inbox.objects.exclude(type='follow')
+    over = capped.values('author').annotate(entries=Count('id')).filter(entries__gt=limit)
+
+    deleted = 0
+    for author in over.values_list('author', flat=True):
+        items = capped.filter(author=author)
+        # the newest item that doesn't fit, in the (published, id) order inboxes are listed in
+        published, id = items.order_by('-published', '-id').values_list('published', 'id')[limit]
+        count, _ = items.filter(Q(published__lt=published) | Q(published=published, id__lte=id)).delete()
+        deleted += count
+    return deleted
+
+def collect_garbage() -> int:
+    '''
+    Delete the InboxPost, InboxComment and FollowRequest rows no inbox item points at. Returns how many were deleted.
+    '''
+    deleted = 0
+    for model in [models.InboxPost, models.InboxComment, models.FollowRequest]:
+        count, _ = model.objects.filter(inbox__isnull=True).delete()
+        deleted += count
+    return deleted
+
+def compact() -> dict:
+    '''
+    Run every compaction step. Returns how many rows each step removed.
+    '''
+    # garbage is collected last, so it picks up what the other steps left behind
+    removed = {
+        'expired': expire(),
+        'collapsed': collapse_likes(),
+        'capped': cap(),
+        'garbage': collect_garbage(),
+    }
+    util.main.log('compaction/compact', 'Compacted inboxes: %s', removed)
+    return removed
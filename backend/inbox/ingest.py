@@ -0,0 +1,253 @@
+'''
+Adding items to a local author's inbox
+
+A POST to an inbox can carry several items (likes, comments, follows, posts, unfollows). They are all
+added in one transaction: what the items need (the posts being commented on, the likes that already
+exist) is looked up with one query per kind, and the new Like, Comment, InboxComment, InboxPost,
+FollowRequest and Inbox rows are created with one bulk insert per table.
+
+Each item gets its own result, so one bad item doesn't reject the others.
+'''
+from django.db import transaction
+from django.db.models import Q
+from rest_framework import status
+from restapi.models import User
+from post.models import Post, Comment, Like
+from post.serializers import LikeSerializer
+from followers.models import Follower
+from inbox import models, serializers
+import inbox.util
+import inbox.snapshots
+import util.main
+
+
+class ItemError(Exception):
+    '''
+    An inbox item that can't be added. `body` is the error JSON
+    '''
+    def __init__(self, body, status_code: int = status.HTTP_400_BAD_REQUEST):
+        if isinstance(body, str):
+            body = {'error': body}
+        super().__init__(body)
+        self.body = body
+        self.status_code = status_code
+
+
+class ItemResult:
+    '''
+    What happened to one inbox item: the HTTP status it would have gotten on its own, and the response body
+    '''
+    def __init__(self, status_code: int, body: dict = None, inbox: models.Inbox = None):
+        self.status_code = status_code
+        self.body = body
+        self.inbox = inbox
+
+    def json(self) -> dict:
+        return {'status': self.status_code, 'body': self.body}
+
+
+class Batch:
+    '''
+    The unsaved rows for a batch of inbox items, saved together by save()
+    '''
+    def __init__(self, inbox_user: User, items: list):
+        self.inbox_user = inbox_user
+        self.items = items
+        self.results = [None] * len(items)
+        # index of the item -> its unsaved Inbox
+        self.inboxes = {}
+        self.inbox_posts = []
+        self.follow_requests = []
+        self.comments = []
+        self.inbox_comments = []
+        self.likes = []
+        self._authors = {}
+        self._posts = {}
+        self._liked = set()
+
+    def _prefetch(self) -> None:
+        '''
+        Look up the posts being commented on, and which likes already exist, for all the items at once
+        '''
+        post_ids = set()
+        likes = Q()
+        for item in self.items:
+            item_type = _type(item)
+            try:
+                if item_type == 'comment':
+                    post_ids.add(util.main.id_from_url(item.get('id') or item.get('post').get('id')))
+                elif item_type == 'like':
+                    likes |= Q(author=util.main.standardize_url(item['author']['url']), object=util.main.standardize_url(item['object']))
+            except (AttributeError, KeyError, TypeError):
+                # reported when the item itself is handled
+                continue
+        if post_ids:
+            self._posts = Post.objects.select_related('author').in_bulk(list(post_ids))
+        if likes:
+            self._liked = set(Like.objects.filter(likes).values_list('author', 'object'))
+
+    def _author(self, json_data: dict) -> User:
+        '''
+        The (possibly copied) author for some author JSON, looked up once per batch
+        '''
+        key = util.main.id_from_url(json_data.get('id') or '')
+        if key not in self._authors:
+            # a savepoint, so an author that can't be copied only fails its own item
+            with transaction.atomic():
+                self._authors[key] = inbox.util.retrieve_or_copy_author(json_data)
+        return self._authors[key]
+
+    def _add_inbox(self, index: int, inbox_type: str, **fields) -> None:
+        self.inboxes[index] = models.Inbox(author=self.inbox_user, type=inbox_type, **fields)
+
+    def _post(self, index: int, item: dict) -> None:
+        post_id = util.main.standardize_url(item.get('id') or '')
+        if not post_id:
+            raise ItemError({'post_id': ['This field is required.']})
+        inbox_post = models.InboxPost(post_id=post_id)
+        self.inbox_posts.append(inbox_post)
+        self._add_inbox(index, 'post', post=inbox_post)
+
+    def _follow(self, index: int, item: dict) -> None:
+        # we only care about people following our local users
+        object_id = util.main.id_from_url(item.get('object').get('id'))
+        if object_id == str(self.inbox_user.id):
+            object = self.inbox_user
+        else:
+            object = User.objects.filter(pk=object_id).first()
+            if object is None:
+                raise ItemError('Author being followed does not exist', status.HTTP_404_NOT_FOUND)
+
+        # the person who is following our user. If it is remote, make a copy
+        actor = self._author(item.get('actor'))
+        follow_request = models.FollowRequest(actor=actor, object=object)
+        self.follow_requests.append(follow_request)
+        self._add_inbox(index, 'follow', follow=follow_request)
+
+    def _comment(self, index: int, item: dict) -> None:
+        author_url = item.get('author').get('id')
+
+        # the post being commented on
+        post_url = item.get('id') or item.get('post').get('id')
+        if not post_url:
+            raise ItemError('Post ID is required')
+        post_id = util.main.id_from_url(post_url)
+        post = self._posts.get(post_id)
+        if post is None:
+            raise ItemError('Post does not exist', status.HTTP_404_NOT_FOUND)
+        if post.author.id != self.inbox_user.id:
+            raise ItemError(f'Post {post_id} does not belong to author {self.inbox_user.id}')
+
+        comment_author_data = item.get('author')
+        if not comment_author_data:
+            raise ItemError('Comment author is required')
+        comment_text = item.get('comment')
+        if not comment_text:
+            raise ItemError('Comment content is required')
+        comment_author = self._author(comment_author_data)
+
+        comment = Comment(
+            author=comment_author,
+            post=post,
+            comment=comment_text,
+            contentType=item.get('contentType') or 'text/plain',
+        )
+        inbox_comment = serializers.InboxCommentSerializer(data={'commentUrl': comment.url, 'author': author_url})
+        if not inbox_comment.is_valid():
+            raise ItemError(inbox_comment.errors)
+        util.main.log('ingest/_comment', 'Creating comment by author %s on post %s: %s', comment_author, post_id, comment_text)
+        self.comments.append(comment)
+        inbox_comment = models.InboxComment(commentUrl=comment.url, author=inbox_comment.validated_data['author'])
+        self.inbox_comments.append(inbox_comment)
+        self._add_inbox(index, 'comment', comment=inbox_comment)
+
+    def _like(self, index: int, item: dict) -> None:
+        author_url = util.main.standardize_url(item.get('author').get('url'))
+        object_url = util.main.standardize_url(item.get('object'))
+        if (author_url, object_url) in self._liked:
+            raise ItemError('User already liked this object')
+
+        like = LikeSerializer(data={'author': author_url, 'object': object_url})
+        if not like.is_valid():
+            raise ItemError(like.errors)
+        self._liked.add((author_url, object_url))
+        like = Like(author=like.validated_data['author'], object=like.validated_data['object'])
+        self.likes.append(like)
+        self._add_inbox(index, 'like', like=like)
+
+    def _unfollow(self, index: int, item: dict) -> None:
+        # team HTTP and Lost uses the unfollow type to remove followers
+        actor_id = util.main.id_from_url(item.get('actor').get('id'))
+        object_id = util.main.id_from_url(item.get('object').get('id'))
+        util.main.log('ingest/_unfollow', 'Unfollow request received from %s to %s', actor_id, object_id)
+
+        deleted, _ = Follower.objects.filter(actor=actor_id, object=object_id).delete()
+        if not deleted:
+            raise ItemError('Follow object does not exist', status.HTTP_404_NOT_FOUND)
+        self.results[index] = ItemResult(status.HTTP_204_NO_CONTENT, {'success': 'Follow object deleted'})
+
+    def add(self) -> None:
+        '''
+        Validate the items and prepare their rows
+        '''
+        self._prefetch()
+        handlers = {
+            'post': self._post,
+            'follow': self._follow,
+            'comment': self._comment,
+            'like': self._like,
+            'unfollow': self._unfollow,
+        }
+        for index, item in enumerate(self.items):
+            item_type = _type(item)
+            try:
+                if item_type is None:
+                    raise ItemError('Invalid inbox data. Remember to wrap Inbox items!')
+                if item_type not in handlers:
+                    raise ItemError('Invalid inbox type')
+                handlers[item_type](index, item)
+            except ItemError as e:
+                util.main.log('ingest/add', 'Inbox item %s (%s) was not added: %s', index, item_type, e.body)
+                self.results[index] = ItemResult(e.status_code, e.body)
+            except Exception as e:
+                util.main.log('ingest/add', 'Error processing inbox item %s (%s): %s', index, item_type, e)
+                self.results[index] = ItemResult(status.HTTP_400_BAD_REQUEST, {'error': f'Error processing inbox {item_type}: {e}'})
+
+    def save(self) -> None:
+        '''
+        Create the rows, one bulk insert per table (parents before the rows pointing at them)
+        '''
+        models.InboxPost.objects.bulk_create(self.inbox_posts)
+        models.FollowRequest.objects.bulk_create(self.follow_requests)
+        Comment.objects.bulk_create(self.comments)
+        # bulk_create sends no post_save, so the comment counts in the snapshots are cleared here
+        inbox.snapshots.invalidate_posts(comment.post_id for comment in self.comments)
+        models.InboxComment.objects.bulk_create(self.inbox_comments)
+        Like.objects.bulk_create(self.likes)
+        models.Inbox.objects.bulk_create(self.inboxes.values())
+
+    def serialize(self) -> None:
+        '''
+        Fill in the results of the added items, and save their snapshots (see inbox/snapshots.py)
+        '''
+        rendered = inbox.snapshots.take(self.inboxes.values())
+        for index, inbox_model in self.inboxes.items():
+            self.results[index] = ItemResult(status.HTTP_201_CREATED, rendered[inbox_model.id], inbox_model)
+
+
+def _type(item) -> str:
+    try:
+        return item.get('type').lower()
+    except AttributeError:
+        return None
+
+def ingest(inbox_user: User, items: list) -> list:
+    '''
+    Add inbox items (JSON) to a local author's inbox in one transaction. Returns an ItemResult per item.
+    '''
+    batch = Batch(inbox_user, items)
+    with transaction.atomic():
+        batch.add()
+        batch.save()
+    batch.serialize()
+    return batch.results
@@ -0,0 +1,27 @@
+from django.core.management.base import BaseCommand
+from django.conf import settings
+from django.db import connection
+import time
+
+from inbox import compaction
+
+# python manage.py compact_inbox [--once] [--interval SECONDS]
+
+class Command(BaseCommand):
+    help = "cap, collapse and clean up inboxes (see inbox/compaction.py)."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--once', action='store_true', help='compact once, then exit')
+        parser.add_argument('--interval', type=float, default=settings.INBOX_COMPACTION_INTERVAL, help='seconds between compactions')
+
+    def handle(self, *args, **options):
+        if options['once']:
+            print(f'Removed {compaction.compact()}.')
+            return
+
+        print('Compacting inboxes. Press Ctrl+C to stop.')
+        while True:
+            print(f'Removed {compaction.compact()}.')
+            # don't hold a connection open while idle
+            connection.close()
+            time.sleep(options['interval'])
@@ -0,0 +1,20 @@
+# Generated by Django 5.0.14 on 2026-10-18 14:52
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('inbox', '0011_alter_followrequest_actor_alter_followrequest_object'),
+        ('post', '0008_keyset_indexes'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='inbox',
+            index=models.Index(fields=['author', '-published', '-id'], name='inbox_inbox_author__b43359_idx'),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.0.14 on 2026-10-18 15:31
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('inbox', '0012_keyset_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='inbox',
+            name='snapshot',
+            field=models.JSONField(blank=True, editable=False, help_text="the item's JSON, as served by GET /inbox", null=True),
+        ),
+    ]
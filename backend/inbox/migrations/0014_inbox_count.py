@@ -0,0 +1,18 @@
+# Generated by Django 5.0.14 on 2026-10-18 15:34
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('inbox', '0013_inbox_snapshot'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='inbox',
+            name='count',
+            field=models.PositiveIntegerField(default=1, editable=False, help_text='how many notifications this entry stands for'),
+        ),
+    ]
@@ -66,3 +66,15 @@ class Inbox(models.Model):
 
     # if the type is a follow, this field will be non-null
     follow = models.ForeignKey(FollowRequest, on_delete=models.CASCADE, null=True, blank=True)
+
+    # repeated likes of the same object are collapsed into one entry (see inbox/compaction.py)
+    count = models.PositiveIntegerField(default=1, editable=False, help_text="how many notifications this entry stands for")
+
+    # the JSON GET /inbox serves for this item, so reads don't have to render it (see inbox/snapshots.py)
+    snapshot = models.JSONField(null=True, blank=True, editable=False, help_text="the item's JSON, as served by GET /inbox")
+
+    class Meta:
+        # covers listing an author's inbox newest first (see util/pagination.py)
+        indexes = [
+            models.Index(fields=['author', '-published', '-id']),
+        ]
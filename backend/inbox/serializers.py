@@ -7,6 +7,7 @@ import util.main as util
 import json 
 import requests
 import remote_node.util
+import inbox.util
 
 class FollowRequestSerializer(serializers.ModelSerializer):
     '''
@@ -41,6 +42,20 @@ class InboxPostSerializer(serializers.ModelSerializer):
         fields = ['post_id']
 
 
+class InboxListSerializer(serializers.ListSerializer):
+    '''
+    ### INBOX LIST SERIALIZER
+    Resolves the posts and comments of a whole page of inbox items at once, instead of one by one
+    '''
+    def to_representation(self, data):
+        items = list(data.all() if hasattr(data, 'all') else data)
+        self.child.context['resolved'] = inbox.util.resolve_inbox_items(items)
+        self.child.context['authors'] = post_serializers.resolve_like_authors(
+            item.like.author for item in items if item.type == 'like' and item.like
+        )
+        return super().to_representation(items)
+
+
 class InboxSerializer(serializers.ModelSerializer):
     '''
     ### INBOX SERIALIZER
@@ -55,6 +70,16 @@ class InboxSerializer(serializers.ModelSerializer):
     class Meta:
         model = models.Inbox
         fields = ['id', 'author', 'type', 'post', 'like', 'comment', 'follow']
+        list_serializer_class = InboxListSerializer
+
+    def _resolve(self, instance, url):
+        '''
+        Get the JSON of the post/comment at url, using what the list serializer already resolved if possible
+        '''
+        resolved = self.context.get('resolved')
+        if resolved is None or url not in resolved:
+            resolved = inbox.util.resolve_inbox_items([instance])
+        return resolved.get(url)
     
     def to_representation(self, instance):
         '''
@@ -67,13 +92,12 @@ class InboxSerializer(serializers.ModelSerializer):
         if instance.type == 'post':
             data = InboxPostSerializer(instance.post).data
             post_url = data.get('post_id')
-            util.log('InboxSerializer', f'Fetching post from {post_url}')
-            response = remote_node.util.get(post_url)
-            if response.status_code == 404:
-                util.log('InboxSerializer', f'Post not found! {post_url}')
+            util.log('InboxSerializer', 'Fetching post from %s', post_url)
+            post_data = self._resolve(instance, post_url)
+            if post_data is None:
+                util.log('InboxSerializer', 'Post not found! %s', post_url)
                 return_data['post'] = {'error': 'Post not found'}
             else:
-                post_data = response.json()
                 return_data = return_data | post_data
         elif instance.type == 'follow':
             data = FollowRequestSerializer(instance.follow).data
@@ -82,19 +106,26 @@ class InboxSerializer(serializers.ModelSerializer):
             return_data['object'] = data.get('object')
             return_data['summary'] = f'{return_data["actor"]["displayName"]} wants to follow {return_data["object"]["displayName"]}'
         elif instance.type == 'like':
-            return post_serializers.LikeSerializer(instance.like).data
+            # the list serializer already looked up the authors of the likes
+            data = post_serializers.LikeSerializer(instance.like, context=self.context).data
+            if instance.count > 1:
+                # repeated likes collapsed by inbox/compaction.py
+                data['count'] = instance.count
+                object_type = post_serializers.liked_object_type(instance.like.object)
+                data['summary'] = f"{data['author']['displayName']} and {instance.count - 1} other(s) like your {object_type}"
+            return data
         elif instance.type == 'comment':
             data = InboxCommentSerializer(instance.comment).data
-            util.log('InboxSerializer/comment', f'Inbox Comment data {data}')
+            util.log('InboxSerializer/comment', 'Inbox Comment data %s', data)
             author_url = data.get('author')
             object_url = data.get('commentUrl')
             # this should have all the info
-            try:
-                comment_data = remote_node.util.get(object_url)
-                return_data = return_data | comment_data.json()
-            except Exception as e:
-                util.log('InboxSerializer/comment', f'Error fetching comment {object_url}: {e}')
+            comment_data = self._resolve(instance, object_url)
+            if comment_data is None:
+                util.log('InboxSerializer/comment', 'Error fetching comment %s', object_url)
                 return_data['error'] = 'Comment not found'
+            else:
+                return_data = return_data | comment_data
         return return_data
 
     def to_internal_value(self, data):
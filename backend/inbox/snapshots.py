@@ -0,0 +1,140 @@
+'''
+Ready-to-serve JSON of inbox items
+
+Rendering an inbox item means loading its post, like, comment or follow, and often fetching the post or
+comment from another node. Inboxes are read much more often than they are written, so each Inbox row keeps
+the JSON GET /inbox serves for it (Inbox.snapshot):
+
+- it's taken when the item is added (see inbox/ingest.py),
+- it's cleared when the local post or comment it shows is edited or deleted (or the post gets or loses a comment,
+  since its comment count is in the snapshot), and taken again on the next read,
+- items whose post or comment couldn't be found aren't snapshotted, so they're tried again on the next read,
+- the images of local friends-only and unlisted posts (which can't be linked to) aren't copied into every
+  recipient's snapshot: the snapshot's content is left empty and filled in from the PostImage when it's served.
+
+With every item on a page snapshotted, listing an inbox is a single query (plus one for the images of
+friends-only and unlisted image posts, if any).
+'''
+import base64
+from django.db.models import Q
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
+from post.models import Post, Comment, PostImage, IMAGE_CONTENT_TYPES
+from post.serializers import resolve_like_authors
+from inbox import models, serializers
+import inbox.util
+import util.main
+
+def is_complete(data: dict) -> bool:
+    '''
+    Whether rendered inbox JSON has everything it should (its post or comment was found)
+    '''
+    return 'error' not in data and not (isinstance(data.get('post'), dict) and 'error' in data['post'])
+
+def take(inboxes) -> dict:
+    '''
+    Render inbox items, resolving their posts, comments and like authors all at once, and save the complete
+    ones as their snapshot (one bulk update). Returns {inbox id: JSON}.
+    '''
+    inboxes = list(inboxes)
+    context = {
+        'resolved': inbox.util.resolve_inbox_items(inboxes),
+        'authors': resolve_like_authors(item.like.author for item in inboxes if item.type == 'like' and item.like),
+    }
+    rendered = {}
+    snapshotted = []
+    for item in inboxes:
+        try:
+            data = serializers.InboxSerializer(item, context=context).data
+        except Exception as e:
+            util.main.log('snapshots/take', 'Error rendering inbox item %s: %s', item.id, e)
+            rendered[item.id] = {'type': item.type, 'error': 'Could not render inbox item'}
+            continue
+        rendered[item.id] = data
+        if is_complete(data):
+            item.snapshot = data
+            if _is_private_image(data):
+                item.snapshot = data | {'content': None}
+            snapshotted.append(item)
+    models.Inbox.objects.bulk_update(snapshotted, ['snapshot'])
+    return rendered
+
+def _is_private_image(data: dict) -> bool:
+    '''
+    Whether inbox JSON is a local post whose content is an inlined image (which only public posts can link to)
+    '''
+    return (
+        data.get('type') == 'post' and data.get('contentType') in IMAGE_CONTENT_TYPES
+        and data.get('visibility') != 'PUBLIC' and inbox.util.is_local_url(data.get('id') or '')
+    )
+
+def _needs_image(snapshot: dict) -> bool:
+    return snapshot.get('content') is None and _is_private_image(snapshot)
+
+def _images(snapshots: list) -> dict:
+    '''
+    The base64 images of the posts in some snapshots, as {post id: base64}, in one query
+    '''
+    if not snapshots:
+        return {}
+    post_ids = [util.main.id_from_url(snapshot['id']) for snapshot in snapshots]
+    return {
+        post_id: base64.b64encode(data).decode('ascii')
+        for post_id, data in PostImage.objects.filter(post_id__in=post_ids).values_list('post_id', 'data')
+    }
+
+def render(page: list) -> list:
+    '''
+    The JSON of a page of inbox items: their snapshots, taking the ones that are missing
+    '''
+    images = _images([item.snapshot for item in page if item.snapshot is not None and _needs_image(item.snapshot)])
+    rendered = {}
+    for item in page:
+        if item.snapshot is None:
+            continue
+        if not _needs_image(item.snapshot):
+            rendered[item.id] = item.snapshot
+        elif util.main.id_from_url(item.snapshot['id']) in images:
+            rendered[item.id] = item.snapshot | {'content': images[util.main.id_from_url(item.snapshot['id'])]}
+
+    # items without a snapshot, and image posts whose image isn't in a PostImage (content that couldn't be decoded)
+    missing = [item.id for item in page if item.id not in rendered]
+    if missing:
+        rendered |= take(models.Inbox.objects.filter(pk__in=missing).select_related(
+            'post', 'comment', 'like', 'follow__actor', 'follow__object'
+        ))
+    return [rendered[item.id] for item in page]
+
+def _id_suffix(field: str, id) -> Q:
+    # local objects are matched on the last part of their URL, like resolve_inbox_items does,
+    # so items addressed by another form of the URL are found too
+    return Q(**{f'{field}__endswith': f'/{id}'}) | Q(**{f'{field}__endswith': f'/{id}/'})
+
+def invalidate(*conditions, **filters) -> None:
+    models.Inbox.objects.filter(*conditions, snapshot__isnull=False, **filters).update(snapshot=None)
+
+def invalidate_posts(post_ids) -> None:
+    '''
+    Clear the snapshots of the inbox items showing these local posts
+    '''
+    conditions = Q()
+    for post_id in set(post_ids):
+        conditions |= _id_suffix('post__post_id', post_id)
+    if conditions:
+        invalidate(conditions, type='post')
+
+@receiver(post_save, sender=Post)
+@receiver(post_delete, sender=Post)
+def _post_changed(sender, instance: Post, created: bool = False, **kwargs) -> None:
+    # a new post isn't in any inbox yet
+    if not created:
+        invalidate_posts([instance.id])
+
+@receiver(post_save, sender=Comment)
+@receiver(post_delete, sender=Comment)
+def _comment_changed(sender, instance: Comment, created: bool = False, **kwargs) -> None:
+    if not created:
+        invalidate(_id_suffix('comment__commentUrl', instance.id), type='comment')
+    if created or kwargs.get('signal') is post_delete:
+        # the post's comment count changed
+        invalidate_posts([instance.post_id])
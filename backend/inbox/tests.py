@@ -10,6 +10,10 @@ from restapi.models import User
 import remote_node.util
 from unittest.mock import patch 
 import inbox.util
+from post.models import Post, Comment, Like
+from django.test import override_settings
+from inbox import compaction
+from django.utils import timezone
 
 # Create your tests here.
 
@@ -523,3 +527,242 @@ class InboxLike(BaseTestCase):
         )
         self.assertEqual(like.count(), 1)
 
+
+
+class InboxResolveLocal(TestCase):
+    '''
+    Posts and comments on our own node should be read from the database, not over HTTP
+    '''
+    def setUp(self):
+        self.user1 = models.User.objects.create_user(
+            displayName='Test User 1',
+            password='testuser1',
+            github='https://github.com/uofa-cmput404',
+            profileImage=None
+        )
+        self.post = Post.objects.create(author=self.user1, title='Local post', content='hello', visibility='PUBLIC')
+        self.comment = Comment.objects.create(author=self.user1, post=self.post, comment='local comment')
+
+        inbox_post = models.InboxPost.objects.create(post_id=standardize_url(self.post.url))
+        inbox_comment = models.InboxComment.objects.create(commentUrl=self.comment.url, author=self.user1.url)
+        models.Inbox.objects.create(author=self.user1, type='post', post=inbox_post)
+        models.Inbox.objects.create(author=self.user1, type='comment', comment=inbox_comment)
+
+    @patch('remote_node.util.node_get')
+    def test_local_items_resolved_from_db(self, mock_get):
+        inboxes = models.Inbox.objects.filter(author=self.user1).order_by('published')
+        data = serializers.InboxSerializer(inboxes, many=True).data
+
+        self.assertFalse(mock_get.called)
+        self.assertEqual(data[0]['title'], 'Local post')
+        self.assertEqual(data[1]['comment'], 'local comment')
+
+    @patch('remote_node.util.node_get')
+    def test_local_author_no_http(self, mock_get):
+        '''
+        Listing and posting to a local author's inbox doesn't make any HTTP calls to find the author
+        '''
+        response = self.client.get(f'/api/authors/{self.user1.id}/inbox')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(len(response.data['items']), 2)
+
+        response = self.client.post(
+            f'/api/authors/{self.user1.id}/inbox',
+            {'type': 'inbox', 'author': self.user1.url, 'items': [{'type': 'post', 'id': self.post.url}]},
+            content_type='application/json'
+        )
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertFalse(mock_get.called)
+
+
+class InboxBatch(TestCase):
+    '''
+    Several inbox items can be POSTed at once, and each gets its own result
+    '''
+    def setUp(self):
+        self.user1 = models.User.objects.create_user(displayName='Batch User 1', password='pwd', github='', profileImage=None)
+        self.user2 = models.User.objects.create_user(displayName='Batch User 2', password='pwd', github='', profileImage=None)
+        self.post = Post.objects.create(author=self.user1, title='Local post', content='hello', visibility='PUBLIC')
+
+    def _author_json(self, user):
+        return {'type': 'author', 'id': user.url, 'url': user.url, 'host': user.host, 'displayName': user.displayName}
+
+    @patch('remote_node.util.node_get')
+    def test_batch(self, mock_get):
+        like = {'type': 'like', 'author': self._author_json(self.user2), 'object': self.post.url}
+        items = [
+            like,
+            {'type': 'comment', 'author': self._author_json(self.user2), 'comment': 'nice', 'id': self.post.url},
+            {'type': 'follow', 'actor': self._author_json(self.user2), 'object': self._author_json(self.user1)},
+            {'type': 'post', 'id': self.post.url},
+            like,
+            {'type': 'poke'},
+        ]
+        response = self.client.post(
+            f'/api/authors/{self.user1.id}/inbox',
+            {'type': 'inbox', 'author': self.user1.url, 'items': items},
+            content_type='application/json'
+        )
+        self.assertEqual(response.status_code, status.HTTP_207_MULTI_STATUS)
+        self.assertEqual([item['status'] for item in response.data['items']], [201, 201, 201, 201, 400, 400])
+        self.assertEqual(response.data['items'][1]['body']['comment'], 'nice')
+
+        self.assertEqual(models.Inbox.objects.filter(author=self.user1).count(), 4)
+        self.assertEqual(Comment.objects.filter(post=self.post).count(), 1)
+        self.assertTrue(models.FollowRequest.objects.filter(actor=self.user2, object=self.user1).exists())
+        self.assertFalse(mock_get.called)
+
+    def test_single_item_response(self):
+        response = self.client.post(
+            f'/api/authors/{self.user1.id}/inbox',
+            {'type': 'inbox', 'author': self.user1.url, 'items': [{'type': 'comment', 'author': self._author_json(self.user2), 'comment': 'nice', 'id': f'{self.user1.url}/posts/missing'}]},
+            content_type='application/json'
+        )
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+        self.assertEqual(response.data, {'error': 'Post does not exist'})
+
+
+class InboxSnapshot(TestCase):
+    '''
+    Inbox items are served from their snapshots, which are taken on write and cleared when their post changes
+    '''
+    def setUp(self):
+        self.user1 = models.User.objects.create_user(displayName='Snapshot User 1', password='pwd', github='', profileImage=None)
+        self.post = Post.objects.create(author=self.user1, title='Local post', content='hello', visibility='PUBLIC')
+        response = self.client.post(
+            f'/api/authors/{self.user1.id}/inbox',
+            {'type': 'inbox', 'author': self.user1.url, 'items': [{'type': 'post', 'id': self.post.url}]},
+            content_type='application/json'
+        )
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+
+    def test_snapshot_taken_on_write(self):
+        item = models.Inbox.objects.get(author=self.user1)
+        self.assertEqual(item.snapshot['title'], 'Local post')
+
+    def test_read_is_one_query(self):
+        with self.assertNumQueries(2):
+            # the author, then the page of items
+            response = self.client.get(f'/api/authors/{self.user1.id}/inbox?cursor')
+        self.assertEqual(response.data['items'][0]['title'], 'Local post')
+
+    def test_snapshot_cleared_when_post_changes(self):
+        self.post.title = 'Edited post'
+        self.post.save()
+        self.assertIsNone(models.Inbox.objects.get(author=self.user1).snapshot)
+
+        response = self.client.get(f'/api/authors/{self.user1.id}/inbox')
+        self.assertEqual(response.data['items'][0]['title'], 'Edited post')
+        self.assertEqual(models.Inbox.objects.get(author=self.user1).snapshot['title'], 'Edited post')
+
+    def test_snapshot_cleared_when_post_gets_comments(self):
+        comment = Comment.objects.create(author=self.user1, post=self.post, comment='first')
+        self.assertIsNone(models.Inbox.objects.get(author=self.user1).snapshot)
+        response = self.client.get(f'/api/authors/{self.user1.id}/inbox')
+        self.assertEqual(response.data['items'][0]['count'], 1)
+
+        comment.delete()
+        self.assertIsNone(models.Inbox.objects.get(author=self.user1).snapshot)
+        self.client.get(f'/api/authors/{self.user1.id}/inbox')
+
+        # comments added through the inbox are bulk created, without signals
+        response = self.client.post(
+            f'/api/authors/{self.user1.id}/inbox',
+            {'type': 'inbox', 'author': self.user1.url, 'items': [{
+                'type': 'comment', 'id': self.post.url, 'comment': 'second',
+                'author': {'type': 'author', 'id': self.user1.url, 'url': self.user1.url, 'host': self.user1.host, 'displayName': self.user1.displayName},
+            }]},
+            content_type='application/json'
+        )
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        item = models.Inbox.objects.get(author=self.user1, type='post')
+        self.assertIsNone(item.snapshot)
+
+    def test_private_image_not_copied(self):
+        image = base64.b64encode(b'\x89PNG not really').decode('ascii')
+        post = Post.objects.create(author=self.user1, title='Image', content=image, contentType='image/png;base64', visibility='FRIENDS')
+        response = self.client.post(
+            f'/api/authors/{self.user1.id}/inbox',
+            {'type': 'inbox', 'author': self.user1.url, 'items': [{'type': 'post', 'id': post.url}]},
+            content_type='application/json'
+        )
+        self.assertEqual(response.data['content'], image)
+        item = models.Inbox.objects.get(author=self.user1, post__post_id=post.url)
+        self.assertIsNone(item.snapshot['content'])
+
+        with self.assertNumQueries(3):
+            # the author, the page of items, then the image
+            response = self.client.get(f'/api/authors/{self.user1.id}/inbox?cursor')
+        self.assertEqual([entry['content'] for entry in response.data['items']], [image, 'hello'])
+
+    def test_snapshot_cleared_for_other_url_forms(self):
+        # a peer that addressed the post with a trailing slash
+        other = models.Inbox.objects.create(
+            author=self.user1, type='post', snapshot={'title': 'Local post'},
+            post=models.InboxPost.objects.create(post_id=f'{self.post.url}/'),
+        )
+        self.post.title = 'Edited post'
+        self.post.save()
+        self.assertIsNone(models.Inbox.objects.get(pk=other.pk).snapshot)
+
+
+class InboxCompaction(TestCase):
+    '''
+    Tests collapsing repeated likes, capping inbox length and collecting orphaned rows
+    '''
+    def setUp(self):
+        self.user1 = models.User.objects.create_user(displayName='Compaction User 1', password='pwd', github='', profileImage=None)
+        self.object_url = f'{self.user1.url}/posts/1'
+
+    def _like(self, n):
+        like = Like.objects.create(author=f'https://remote.com/api/authors/{n}', object=self.object_url)
+        return models.Inbox.objects.create(author=self.user1, type='like', like=like)
+
+    def test_collapse_likes(self):
+        items = [self._like(n) for n in range(3)]
+        self.assertEqual(compaction.collapse_likes(), 2)
+        remaining = models.Inbox.objects.get(author=self.user1)
+        self.assertEqual(remaining.pk, items[-1].pk)
+        self.assertEqual(remaining.count, 3)
+        # the likes themselves are kept
+        self.assertEqual(Like.objects.filter(object=self.object_url).count(), 3)
+
+    @override_settings(INBOX_MAX_PER_AUTHOR=2)
+    def test_cap(self):
+        posts = [models.InboxPost.objects.create(post_id=f'{self.user1.url}/posts/{n}') for n in range(4)]
+        items = [models.Inbox.objects.create(author=self.user1, type='post', post=post) for post in posts]
+        self.assertEqual(compaction.cap(), 2)
+        self.assertEqual(
+            set(models.Inbox.objects.filter(author=self.user1).values_list('pk', flat=True)),
+            {items[2].pk, items[3].pk},
+        )
+
+    @override_settings(INBOX_MAX_PER_AUTHOR=1, INBOX_RETENTION_DAYS=1)
+    def test_follow_requests_kept(self):
+        follow = models.Inbox.objects.create(
+            author=self.user1, type='follow', follow=models.FollowRequest.objects.create(actor=self.user1, object=self.user1),
+        )
+        posts = [models.Inbox.objects.create(author=self.user1, type='post', post=models.InboxPost.objects.create(post_id=f'{self.user1.url}/posts/{n}')) for n in range(2)]
+        models.Inbox.objects.filter(pk__in=[follow.pk, posts[0].pk]).update(published=timezone.now() - timezone.timedelta(days=2))
+        self.assertEqual(compaction.expire(), 1)
+        self.assertEqual(compaction.cap(), 0)
+        self.assertEqual(set(models.Inbox.objects.values_list('pk', flat=True)), {follow.pk, posts[1].pk})
+
+    def test_collapsed_comment_like_summary(self):
+        self.object_url = f'{self.user1.url}/posts/1/comments/1'
+        likers = [models.User.objects.create_user(displayName=f'Liker {n}', password='pwd', github='', profileImage=None) for n in range(2)]
+        for liker in likers:
+            models.Inbox.objects.create(author=self.user1, type='like', like=Like.objects.create(author=liker.url, object=self.object_url))
+        compaction.collapse_likes()
+        data = serializers.InboxSerializer(models.Inbox.objects.get(author=self.user1)).data
+        self.assertEqual(data['summary'], 'Liker 1 and 1 other(s) like your comment')
+
+    def test_collect_garbage(self):
+        kept = models.InboxPost.objects.create(post_id=f'{self.user1.url}/posts/1')
+        models.Inbox.objects.create(author=self.user1, type='post', post=kept)
+        models.InboxPost.objects.create(post_id=f'{self.user1.url}/posts/2')
+        models.InboxComment.objects.create(commentUrl=f'{self.user1.url}/posts/1/comments/1', author=self.user1.url)
+        models.FollowRequest.objects.create(actor=self.user1, object=self.user1)
+
+        self.assertEqual(compaction.collect_garbage(), 3)
+        self.assertEqual(list(models.InboxPost.objects.values_list('pk', flat=True)), [kept.pk])
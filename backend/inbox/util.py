@@ -1,6 +1,13 @@
 from inbox import models
 from restapi.serializers import UserSerializer
-from util.main import id_from_url
+from post.models import Post, Comment
+from post.serializers import PostSerializer, CommentSerializer
+from util.main import id_from_url, standardize_url
+import util.main
+import remote_node.util
+import os
+
+BASE_URL = os.environ.get('HOST_API_URL') + 'authors'
 
 
 def retrieve_or_copy_author(json_data: dict) -> models.User:
@@ -62,3 +69,45 @@ def copy_user(json_data: dict) -> models.User:
             raise Exception(user.errors)
     except Exception as e:
         raise Exception(f'Error copying user: {e}')
+
+def is_local_url(url: str) -> bool:
+    '''
+    True if the URL points at an object on our own node
+    '''
+    return standardize_url(url).startswith(BASE_URL)
+
+def resolve_inbox_items(inboxes) -> dict:
+    '''
+    Get the JSON of the posts and comments referenced by a list of inbox items.
+
+    Posts and comments on our node are loaded from the database with one query per type.
+    Only remote ones go over the network, and those are fetched in parallel.
+
+    Returns a dict of url -> JSON (None if the object could not be found)
+    '''
+    post_urls = [inbox.post.post_id for inbox in inboxes if inbox.type == 'post' and inbox.post]
+    comment_urls = [inbox.comment.commentUrl for inbox in inboxes if inbox.type == 'comment' and inbox.comment]
+    resolved = {url: None for url in post_urls + comment_urls}
+
+    # local posts and comments: ids are the last part of the URL
+    local_posts = {id_from_url(url): url for url in post_urls if is_local_url(url)}
+    posts = list(Post.objects.filter(pk__in=local_posts).with_comment_count())
+    for post, data in zip(posts, PostSerializer(posts, many=True, context={'image_urls': True}).data):
+        resolved[local_posts[post.id]] = data
+
+    local_comments = {id_from_url(url): url for url in comment_urls if is_local_url(url)}
+    for comment in Comment.objects.filter(pk__in=local_comments).select_related('author', 'post'):
+        resolved[local_comments[comment.id]] = CommentSerializer(comment).data
+
+    # everything else is on a remote node
+    remote_urls = [url for url in resolved if not is_local_url(url)]
+    for url, response in remote_node.util.get_many(remote_urls).items():
+        if response is None or response.status_code != 200:
+            util.main.log('inbox/util/resolve_inbox_items', 'Could not get %s from remote node', url)
+            continue
+        try:
+            resolved[url] = response.json()
+        except ValueError as e:
+            util.main.log('inbox/util/resolve_inbox_items', '%s did not return JSON: %s', url, e)
+
+    return resolved
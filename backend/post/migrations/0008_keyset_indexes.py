@@ -0,0 +1,31 @@
+# Generated by Django 5.0.14 on 2026-10-18 14:52
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('post', '0007_post_isgithub'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='comment',
+            index=models.Index(fields=['post', '-published', '-id'], name='post_commen_post_id_06a023_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='like',
+            index=models.Index(fields=['object', '-published', '-id'], name='post_like_object_ce9f35_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='post',
+            index=models.Index(fields=['author', '-published', '-id'], name='post_post_author__827574_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='post',
+            index=models.Index(fields=['visibility', '-published', '-id'], name='post_post_visibil_e0bd8b_idx'),
+        ),
+    ]
@@ -0,0 +1,70 @@
+# Generated by Django 5.0.14 on 2026-10-18 14:54
+
+import django.db.models.deletion
+from django.db import migrations, models
+import base64
+import binascii
+import hashlib
+
+# copied from post.models, so later changes there don't change this migration
+IMAGE_CONTENT_TYPES = ['image/png;base64', 'image/jpeg;base64', 'image/gif;base64']
+
+
+def decode_image(content: str) -> bytes:
+    '''
+    Decode base64 image content (optionally a data: URL). Returns None if it isn't valid base64
+    '''
+    if content.startswith('data:') and ',' in content:
+        content = content.split(',', 1)[1]
+    try:
+        return base64.b64decode(content, validate=True)
+    except binascii.Error:
+        return None
+
+
+def move_images(apps, schema_editor):
+    '''
+    Move the base64 content of existing image posts into PostImage
+    '''
+    Post = apps.get_model('post', 'Post')
+    PostImage = apps.get_model('post', 'PostImage')
+    for post in Post.objects.filter(contentType__in=IMAGE_CONTENT_TYPES).exclude(content='').iterator():
+        image = decode_image(post.content)
+        if image is None:
+            # not valid base64, leave it as it is
+            continue
+        PostImage.objects.create(
+            post=post,
+            data=image,
+            content_type=post.contentType.split(';')[0],
+            etag=hashlib.sha256(image).hexdigest(),
+        )
+        Post.objects.filter(pk=post.pk).update(content='')
+
+
+def restore_images(apps, schema_editor):
+    Post = apps.get_model('post', 'Post')
+    PostImage = apps.get_model('post', 'PostImage')
+    for image in PostImage.objects.iterator():
+        Post.objects.filter(pk=image.post_id).update(content=base64.b64encode(image.data).decode('ascii'))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('post', '0008_keyset_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PostImage',
+            fields=[
+                ('post', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='image', serialize=False, to='post.post')),
+                ('data', models.BinaryField()),
+                ('content_type', models.CharField(max_length=250)),
+                ('etag', models.CharField(max_length=64)),
+                ('updated', models.DateTimeField(auto_now=True)),
+            ],
+        ),
+        migrations.RunPython(move_images, restore_images),
+    ]
@@ -0,0 +1,19 @@
+# Generated by Django 5.0.14 on 2026-10-18 15:13
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('post', '0009_postimage'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='post',
+            name='published',
+            field=models.DateTimeField(default=django.utils.timezone.now, editable=False),
+        ),
+    ]
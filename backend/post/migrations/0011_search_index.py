@@ -0,0 +1,121 @@
+# Full-text search index for posts and comments (see post/search.py)
+#
+# - PostgreSQL: a generated tsvector column with a GIN index on each table
+# - SQLite: FTS5 tables kept up to date by triggers (skipped if SQLite was built without FTS5). Migrations that
+#   rebuild post_post or post_comment on SQLite drop the triggers: migrate post back to 0010 and forward again to rebuild
+# Other databases get no index, and search falls back to plain LIKE queries.
+
+from django.db import migrations, OperationalError
+
+# only text content is searchable (not base64 images/applications)
+POSTGRES_FORWARD = [
+    '''
+    ALTER TABLE post_post ADD COLUMN search_vector tsvector GENERATED ALWAYS AS (
+        setweight(to_tsvector('english', coalesce(title, '')), 'A') ||
+        setweight(to_tsvector('english', coalesce(description, '')), 'B') ||
+        setweight(to_tsvector('english', CASE WHEN "contentType" IN ('text/plain', 'text/markdown') THEN coalesce(content, '') ELSE '' END), 'C')
+    ) STORED
+    ''',
+    'CREATE INDEX post_post_search_idx ON post_post USING GIN (search_vector)',
+    '''
+    ALTER TABLE post_comment ADD COLUMN search_vector tsvector GENERATED ALWAYS AS (
+        to_tsvector('english', coalesce(comment, ''))
+    ) STORED
+    ''',
+    'CREATE INDEX post_comment_search_idx ON post_comment USING GIN (search_vector)',
+]
+POSTGRES_BACKWARD = [
+    'ALTER TABLE post_post DROP COLUMN search_vector',
+    'ALTER TABLE post_comment DROP COLUMN search_vector',
+]
+
+SQLITE_POST_CONTENT = '''CASE WHEN {row}."contentType" IN ('text/plain', 'text/markdown') THEN {row}.content ELSE '' END'''
+# rows are matched on the post/comment id (not rowid, which VACUUM may renumber)
+SQLITE_FORWARD = [
+    "CREATE VIRTUAL TABLE post_post_fts USING fts5(post_id UNINDEXED, title, description, content, tokenize='porter unicode61')",
+    "CREATE VIRTUAL TABLE post_comment_fts USING fts5(comment_id UNINDEXED, comment, tokenize='porter unicode61')",
+    f'''
+    INSERT INTO post_post_fts(post_id, title, description, content)
+    SELECT id, title, description, {SQLITE_POST_CONTENT.format(row='post_post')} FROM post_post
+    ''',
+    'INSERT INTO post_comment_fts(comment_id, comment) SELECT id, comment FROM post_comment',
+    f'''
+    CREATE TRIGGER post_post_fts_insert AFTER INSERT ON post_post BEGIN
+        INSERT INTO post_post_fts(post_id, title, description, content)
+        VALUES (new.id, new.title, new.description, {SQLITE_POST_CONTENT.format(row='new')});
+    END
+    ''',
+    '''
+    CREATE TRIGGER post_post_fts_delete AFTER DELETE ON post_post BEGIN
+        DELETE FROM post_post_fts WHERE post_id = old.id;
+    END
+    ''',
+    f'''
+    CREATE TRIGGER post_post_fts_update AFTER UPDATE OF title, description, content, "contentType" ON post_post BEGIN
+        DELETE FROM post_post_fts WHERE post_id = old.id;
+        INSERT INTO post_post_fts(post_id, title, description, content)
+        VALUES (new.id, new.title, new.description, {SQLITE_POST_CONTENT.format(row='new')});
+    END
+    ''',
+    '''
+    CREATE TRIGGER post_comment_fts_insert AFTER INSERT ON post_comment BEGIN
+        INSERT INTO post_comment_fts(comment_id, comment) VALUES (new.id, new.comment);
+    END
+    ''',
+    '''
+    CREATE TRIGGER post_comment_fts_delete AFTER DELETE ON post_comment BEGIN
+        DELETE FROM post_comment_fts WHERE comment_id = old.id;
+    END
+    ''',
+    '''
+    CREATE TRIGGER post_comment_fts_update AFTER UPDATE OF comment ON post_comment BEGIN
+        DELETE FROM post_comment_fts WHERE comment_id = old.id;
+        INSERT INTO post_comment_fts(comment_id, comment) VALUES (new.id, new.comment);
+    END
+    ''',
+]
+SQLITE_BACKWARD = [
+    'DROP TRIGGER IF EXISTS post_post_fts_insert',
+    'DROP TRIGGER IF EXISTS post_post_fts_delete',
+    'DROP TRIGGER IF EXISTS post_post_fts_update',
+    'DROP TRIGGER IF EXISTS post_comment_fts_insert',
+    'DROP TRIGGER IF EXISTS post_comment_fts_delete',
+    'DROP TRIGGER IF EXISTS post_comment_fts_update',
+    'DROP TABLE IF EXISTS post_post_fts',
+    'DROP TABLE IF EXISTS post_comment_fts',
+]
+
+
+def _run(schema_editor, statements):
+    for statement in statements:
+        schema_editor.execute(statement)
+
+def forward(apps, schema_editor):
+    vendor = schema_editor.connection.vendor
+    if vendor == 'postgresql':
+        _run(schema_editor, POSTGRES_FORWARD)
+    elif vendor == 'sqlite':
+        try:
+            _run(schema_editor, SQLITE_FORWARD[:1])
+        except OperationalError:
+            # no FTS5 in this SQLite build: search uses LIKE queries instead
+            return
+        _run(schema_editor, SQLITE_FORWARD[1:])
+
+def backward(apps, schema_editor):
+    vendor = schema_editor.connection.vendor
+    if vendor == 'postgresql':
+        _run(schema_editor, POSTGRES_BACKWARD)
+    elif vendor == 'sqlite':
+        _run(schema_editor, SQLITE_BACKWARD)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('post', '0010_post_published_default'),
+    ]
+
+    operations = [
+        migrations.RunPython(forward, backward),
+    ]
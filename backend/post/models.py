@@ -1,15 +1,32 @@
 from typing import Any
 from django.db import models
+from django.utils import timezone
 from django.dispatch import receiver
 from django.db.models.signals import pre_save
 from restapi.models import User
 import uuid
 import base64
+import binascii
+import hashlib
 
 # Create a ForeignKey for Like that us a union of Post and Comment
 from django.contrib.contenttypes.fields import GenericForeignKey, GenericRelation
 from django.contrib.contenttypes.models import ContentType
 
+IMAGE_CONTENT_TYPES = ['image/png;base64', 'image/jpeg;base64', 'image/gif;base64']
+
+class PostQuerySet(models.QuerySet):
+    '''
+    Extra queryset methods for posts
+    '''
+    def with_comment_count(self):
+        '''
+        Join each post's author and annotate it with its number of comments (as `comment_count`),
+        so serializing a page of posts takes a constant number of queries
+        '''
+        return self.select_related('author').annotate(comment_count=models.Count('comments'))
+
+
 class Post(models.Model):
     '''
     ### POST MODEL
@@ -52,7 +69,8 @@ class Post(models.Model):
         ('image/gif;base64', 'Base64 GIF Image'),
     ]
     contentType = models.CharField(max_length=250, choices=CONTENT_TYPES, default='text/plain', help_text="Content type of the post")
-    published = models.DateTimeField(auto_now_add=True)
+    # not auto_now_add, so posts can be created with their publish date (e.g. GitHub activity)
+    published = models.DateTimeField(default=timezone.now, editable=False)
     VISIBILITIES = [
         ('PUBLIC', 'Public'),
         ('FRIENDS', 'Friends'),
@@ -61,6 +79,15 @@ class Post(models.Model):
     visibility = models.CharField(max_length=250, choices=VISIBILITIES, default='PUBLIC', help_text="Visibility of the post")
     isGithub = models.BooleanField(default=False, help_text="Is this post from Github?")
 
+    objects = PostQuerySet.as_manager()
+
+    class Meta:
+        # cover the (published, id) ordering used for cursor pagination (see util/pagination.py)
+        indexes = [
+            models.Index(fields=['author', '-published', '-id']),
+            models.Index(fields=['visibility', '-published', '-id']),
+        ]
+
     @property
     def url(self):
         return f"{self.author.url}/posts/{self.id}"
@@ -68,11 +95,39 @@ class Post(models.Model):
     def __str__(self):
         return self.title
 
+    @property
+    def has_stored_image(self):
+        '''
+        Whether the image of this post lives in a PostImage (instead of base64 in `content`)
+        '''
+        return self.contentType in IMAGE_CONTENT_TYPES and not self.content
+
+    def save(self, *args, **kwargs):
+        '''
+        Base64 image content is decoded and moved into a PostImage, so the (possibly huge)
+        image isn't loaded every time the post is
+        '''
+        image = None
+        if self.contentType in IMAGE_CONTENT_TYPES and self.content.rstrip('/').endswith(f'/posts/{self.pk}/image'):
+            # an edit sent back the image URL it was given: the stored image stays as it is
+            self.content = ''
+        elif self.contentType in IMAGE_CONTENT_TYPES and self.content:
+            image = decode_image(self.content)
+            if image is not None:
+                self.content = ''
+        super().save(*args, **kwargs)
+        if image is not None:
+            PostImage.objects.update_or_create(post=self, defaults={
+                'data': image,
+                'content_type': self.contentType.split(';')[0],
+                'etag': hashlib.sha256(image).hexdigest(),
+            })
+
     def image_to_base64(self):
         '''
         This method converts an image to base64
         '''
-        if self.contentType in ['image/png;base64', 'image/jpeg;base64', 'image/gif;base64']:
+        if self.contentType in IMAGE_CONTENT_TYPES:
             with open(self.content, "rb") as image_file:
                 self.content = base64.b64encode(image_file.read()).decode('utf-8')
         super().save()
@@ -119,6 +174,11 @@ class Comment(models.Model):
     ]
     contentType = models.CharField(max_length=250, choices=CONTENT_TYPES, default='text/plain', help_text="Content type of the comment")
 
+    class Meta:
+        indexes = [
+            models.Index(fields=['post', '-published', '-id']),
+        ]
+
     @property
     def url(self):
         return f"{self.post.url}/comments/{self.id}"
@@ -143,9 +203,40 @@ class Like(models.Model):
     class Meta:
         indexes = [
             models.Index(fields=['author', 'object']),
+            models.Index(fields=['object', '-published', '-id']),
         ]
 
     published = models.DateTimeField(auto_now_add=True)
     author = models.URLField(help_text="The user URL ID who liked the post")
     object = models.URLField(help_text="The URL ID of the object being liked")
 
+
+def decode_image(content: str) -> bytes:
+    '''
+    Decode base64 image content (optionally a data: URL). Returns None if it isn't valid base64
+    '''
+    if content.startswith('data:') and ',' in content:
+        content = content.split(',', 1)[1]
+    try:
+        return base64.b64decode(content, validate=True)
+    except binascii.Error:
+        return None
+
+
+### POST IMAGE MODEL
+class PostImage(models.Model):
+    '''
+    ### POST IMAGE MODEL
+    The binary image of an image post. The post's `content` is left empty once the image is stored here.
+    Fields:
+        - post (Post): The image post
+        - data (bytes): The image itself
+        - content_type (str): The MIME type of the image (e.g. image/png)
+        - etag (str): sha256 of the image, used for HTTP caching
+        - updated (datetime): When the image was last changed
+    '''
+    post = models.OneToOneField(Post, on_delete=models.CASCADE, primary_key=True, related_name='image')
+    data = models.BinaryField()
+    content_type = models.CharField(max_length=250)
+    etag = models.CharField(max_length=64)
+    updated = models.DateTimeField(auto_now=True)
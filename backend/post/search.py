@@ -0,0 +1,141 @@
+'''
+Full-text search over posts and comments
+
+Posts are searched on their title, description and text content (not base64 images), comments on their
+text. The index is made by post/migrations/0011_search_index.py:
+
+- PostgreSQL: a generated `search_vector` tsvector column with a GIN index, ranked with ts_rank
+  (title matches count more than description matches, which count more than content matches),
+- SQLite: FTS5 tables kept up to date by triggers, ranked with bm25,
+- anything else (or SQLite without FTS5): unranked LIKE queries, newest first.
+
+Only what the user may see is searched (the visibility condition is part of the ranked query), and a search
+returns the ids of the matches in rank order (at most SEARCH_MAX_RESULTS), paginated like any other list.
+'''
+import re
+from django.conf import settings
+from django.db import connection
+from django.db.models import Q
+from post.models import Post, Comment
+from restapi.models import User
+from followers import graph as follower_graph
+
+POSTS = 'posts'
+COMMENTS = 'comments'
+
+# weights of title, description and content matches in SQLite's bm25
+SQLITE_POST_WEIGHTS = (10.0, 5.0, 1.0)
+
+_backend = None
+
+def backend() -> str:
+    '''
+    'postgres', 'fts5' or 'like', depending on the database and what the migration could create
+    '''
+    global _backend
+    if _backend is None:
+        if connection.vendor == 'postgresql':
+            _backend = 'postgres'
+        elif connection.vendor == 'sqlite' and 'post_post_fts' in connection.introspection.table_names():
+            _backend = 'fts5'
+        else:
+            _backend = 'like'
+    return _backend
+
+def terms(query: str) -> list:
+    '''
+    The words of a search query
+    '''
+    return re.findall(r'\w+', query)[:settings.SEARCH_MAX_TERMS]
+
+def _fts5_query(words: list) -> str:
+    # every word quoted, so nothing the user types is read as FTS5 syntax. Words are ANDed
+    return ' '.join('"{}"'.format(word.replace('"', '')) for word in words)
+
+def visible_posts(user: User) -> Q:
+    '''
+    The posts a user may find by searching: public ones, their own, and their friends' friends-only ones.
+    Unlisted posts are only found by their author.
+    '''
+    visible = Q(visibility='PUBLIC')
+    if user.is_authenticated and not user.is_node:
+        friends = follower_graph.graph().friends_of(user)
+        visible |= Q(author=user.id) | Q(visibility='FRIENDS', author__in=friends)
+    return visible
+
+def _visible(kind: str, user: User):
+    '''
+    The posts or comments the user may see (comments are visible when their post is)
+    '''
+    posts = Post.objects.filter(visible_posts(user))
+    if kind == POSTS:
+        return posts
+    return Comment.objects.filter(post__in=posts.values('id'))
+
+def _postgres(kind: str, words: list, user: User) -> tuple:
+    table = 'post_post' if kind == POSTS else 'post_comment'
+    visible, params = _visible(kind, user).values('id').query.sql_with_params()
+    # smaller ranks are better matches
+    sql = f'''
+        SELECT id, -ts_rank(search_vector, query) AS rank, published FROM {table}, plainto_tsquery('english', %s) query
+        WHERE search_vector @@ query AND id IN ({visible})
+    '''
+    return sql, [' '.join(words), *params], 'rank, published DESC'
+
+def _fts5(kind: str, words: list, user: User) -> tuple:
+    visible, params = _visible(kind, user).values('id').query.sql_with_params()
+    if kind == POSTS:
+        sql = f'''
+            SELECT post_id AS id, bm25(post_post_fts, 0.0, {', '.join(map(str, SQLITE_POST_WEIGHTS))}) AS rank FROM post_post_fts
+            WHERE post_post_fts MATCH %s AND post_id IN ({visible})
+        '''
+    else:
+        sql = f'''
+            SELECT comment_id AS id, bm25(post_comment_fts) AS rank FROM post_comment_fts
+            WHERE post_comment_fts MATCH %s AND comment_id IN ({visible})
+        '''
+    return sql, [_fts5_query(words), *params], 'rank'
+
+def _like(kind: str, words: list, user: User):
+    queryset = _visible(kind, user)
+    for word in words:
+        if kind == POSTS:
+            queryset = queryset.filter(
+                Q(title__icontains=word) | Q(description__icontains=word)
+                | Q(content__icontains=word, contentType__in=['text/plain', 'text/markdown'])
+            )
+        else:
+            queryset = queryset.filter(comment__icontains=word)
+    return queryset
+
+def search(kind: str, query: str, user: User) -> list:
+    '''
+    Ids of the posts or comments matching a query that the user may see, best match first
+    (at most SEARCH_MAX_RESULTS)
+    '''
+    words = terms(query)
+    if not words:
+        return []
+    limit = settings.SEARCH_MAX_RESULTS
+    if backend() == 'like':
+        return list(_like(kind, words, user).order_by('-published', '-id').values_list('id', flat=True)[:limit])
+
+    # the visibility condition is part of the ranked query, so the limit only counts results the user may see
+    sql, params, order = (_postgres if backend() == 'postgres' else _fts5)(kind, words, user)
+    with connection.cursor() as cursor:
+        cursor.execute(f'SELECT id FROM ({sql}) results ORDER BY {order} LIMIT %s', [*params, limit])
+        return [row[0] for row in cursor.fetchall()]
+
+def count(kind: str, query: str, user: User) -> int:
+    '''
+    How many posts or comments the user may see match a query (not limited to SEARCH_MAX_RESULTS)
+    '''
+    words = terms(query)
+    if not words:
+        return 0
+    if backend() == 'like':
+        return _like(kind, words, user).count()
+    sql, params, _ = (_postgres if backend() == 'postgres' else _fts5)(kind, words, user)
+    with connection.cursor() as cursor:
+        cursor.execute(f'SELECT COUNT(*) FROM ({sql}) results', params)
+        return cursor.fetchone()[0]
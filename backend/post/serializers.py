@@ -1,17 +1,35 @@
 from rest_framework import serializers
 from post import models
-from post.models import Post, Like, Comment
+from post.models import Post, Like, Comment, PostImage
 from restapi.models import User
 from restapi.serializers import UserSerializer
 from django.contrib.contenttypes.models import ContentType
 import os
 import util.main as util
 import remote_node.util
+import remote_node.authors
 import json
+import base64
+import logging
 
 BASE_URL = os.environ.get("HOST_API_URL") + "authors"
 
 
+class PostListSerializer(serializers.ListSerializer):
+    """
+    ### POST LIST SERIALIZER
+    Loads the stored images of all the friends-only and unlisted image posts at once (as the `images`
+    context, post id -> image bytes), instead of one query per post.
+    """
+    def to_representation(self, data):
+        posts = list(data.all() if hasattr(data, "all") else data)
+        image_urls = self.child.context.get("image_urls", True)
+        inlined = [post.pk for post in posts if post.has_stored_image and not (image_urls and post.visibility == "PUBLIC")]
+        if inlined:
+            self.child.context["images"] = dict(PostImage.objects.filter(post_id__in=inlined).values_list("post_id", "data"))
+        return super().to_representation(posts)
+
+
 class PostSerializer(serializers.ModelSerializer):
     """
     ### POST SERIALIZER
@@ -21,6 +39,10 @@ class PostSerializer(serializers.ModelSerializer):
         - comments (str): The URL of the comments on the post
     Methods:
         - get_comments: Returns the URL to the comments on the post
+
+    Images are stored separately from the post (see PostImage). When a list of posts is serialized
+    (or the `image_urls` context is set), public image posts get the URL of the image as their
+    content instead of the base64 image.
     """
 
     author = UserSerializer(read_only=True)
@@ -44,6 +66,7 @@ class PostSerializer(serializers.ModelSerializer):
             "count",
             "url",
         ]
+        list_serializer_class = PostListSerializer
 
     def get_comments(self, obj):
         """
@@ -86,10 +109,28 @@ class PostSerializer(serializers.ModelSerializer):
 
         data["source"] = f"{BASE_URL}/{instance.author_id}/posts/{data['id']}"
         data["origin"] = f"{BASE_URL}/{instance.author_id}/posts/{data['id']}"
-        data["count"] = Comment.objects.filter(post_id=data["id"]).count()
+        # querysets from Post.objects.with_comment_count() already have the count
+        if hasattr(instance, "comment_count"):
+            data["count"] = instance.comment_count
+        else:
+            data["count"] = Comment.objects.filter(post_id=data["id"]).count()
         data["id"] = f"{BASE_URL}/{instance.author_id}/posts/{data['id']}"
         # data['author'] should already be a correctly formatted author JSON
 
+        if instance.has_stored_image:
+            image_urls = self.context.get("image_urls", isinstance(self.parent, serializers.ListSerializer))
+            if image_urls and instance.visibility == "PUBLIC":
+                data["content"] = f"{data['id']}/image"
+            else:
+                # the list serializer already loaded the images of the page
+                images = self.context.get("images")
+                if images is not None and instance.pk in images:
+                    image = images[instance.pk]
+                else:
+                    image = PostImage.objects.filter(post_id=instance.pk).values_list("data", flat=True).first()
+                if image is not None:
+                    data["content"] = base64.b64encode(image).decode("ascii")
+
         return data
 
 
@@ -135,6 +176,38 @@ class CommentSerializer(serializers.ModelSerializer):
         return data
 
 
+def resolve_like_authors(urls) -> dict:
+    """
+    Returns the author JSON of every author URL (None if it couldn't be found).
+    Local authors are one query, remote authors come from the shared author cache or are fetched in parallel.
+    """
+    urls = set(urls)
+    authors = {user.url: UserSerializer(user).data for user in User.objects.filter(url__in=urls)}
+    authors.update(remote_node.authors.get_remote_authors([url for url in urls if url not in authors]))
+    return authors
+
+
+def liked_object_type(url: str) -> str:
+    """
+    "comment" or "post", depending on the URL of a liked object
+    """
+    return "comment" if "/comments/" in url else "post"
+
+
+class LikeListSerializer(serializers.ListSerializer):
+    """
+    ### LIKE LIST SERIALIZER
+    Resolves the authors of all the likes at once, instead of one like at a time.
+    Authors already known by the caller can be passed in the `authors` context (url -> author JSON).
+    """
+    def to_representation(self, data):
+        likes = list(data.all() if hasattr(data, "all") else data)
+        authors = dict(self.child.context.get("authors") or {})
+        authors.update(resolve_like_authors(like.author for like in likes if like.author not in authors))
+        self.child.context["authors"] = authors
+        return super().to_representation(likes)
+
+
 class LikeSerializer(serializers.ModelSerializer):
     """
     ### LIKE SERIALIZER
@@ -166,6 +239,7 @@ class LikeSerializer(serializers.ModelSerializer):
     class Meta:
         model = models.Like
         fields = ["id", "author", "object", "published"]
+        list_serializer_class = LikeListSerializer
 
     def to_representation(self, instance):
         """
@@ -173,67 +247,21 @@ class LikeSerializer(serializers.ModelSerializer):
         """
         data = super().to_representation(instance)
 
-        # get author locally
-        try:
-            author = User.objects.get(url=instance.author)
-            author_data = UserSerializer(author).data
-        except User.DoesNotExist:
-            util.log(
-                "LikeSerializer/to_representation",
-                f"User {instance.author} does not exist locally, fetching from remote node",
-            )
-            # GOTO: get author from remote node
-        except Exception as e:
-            util.log(
-                "LikeSerializer/to_representation",
-                f"Error getting author {instance.author} from local database: {e}",
-            )
-            util.log("LikeSerializer/to_representation", f"Trying remote instead")
-        else:
-            util.log(
-                "LikeSerializer/to_representation",
-                f"Author data (local): {author_data}",
-            )
-            data["type"] = "like"
-            data["author"] = author_data
-            data["summary"] = f"{author_data['displayName']} likes your post"
+        authors = self.context.get("authors")
+        if authors is None or instance.author not in authors:
+            authors = resolve_like_authors([instance.author])
+        author_data = authors.get(instance.author)
+        if author_data is None:
             util.log(
                 "LikeSerializer/to_representation",
-                f"Like found (local):\n {json.dumps(data, indent=4)}",
+                "Error converting like %s to JSON object: could not get author %s",
+                instance.id,
+                instance.author,
+                level=logging.WARNING,
             )
-            return data
+            raise Exception(f"Failed to get author {instance.author}")
 
-        # get author from remote node
-        try:
-            util.log(
-                "LikeSerializer/to_representation", f"GET author: {instance.author}"
-            )
-            author_data = remote_node.util.get(instance.author)
-            if author_data.status_code != 200:
-                util.log(
-                    "LikeSerializer/to_representation",
-                    f"Failed to connect to {instance.author}. Status code: {author_data.status_code}",
-                )
-                raise Exception(
-                    f"Failed to connect to {instance.author}. Status code: {author_data.status_code}"
-                )
-            else:
-                util.log(
-                    "LikeSerializer/to_representationt",
-                    f"Author data (remote): {author_data.json()}",
-                )
-                data["type"] = "like"
-                data["author"] = author_data.json()
-                data["summary"] = f"{author_data.json()['displayName']} likes your post"
-                util.log(
-                    "LikeSerializer/to_representation",
-                    f"Like found (remote):\n {json.dumps(data, indent=4)}",
-                )
-                return data
-
-        except Exception as e:
-            util.log(
-                "LikeSerializer/to_representation",
-                f"Error converting like {instance.id} to JSON object: {e}",
-            )
-            raise e
+        data["type"] = "like"
+        data["author"] = author_data
+        data["summary"] = f"{author_data['displayName']} likes your {liked_object_type(instance.object)}"
+        return data
@@ -1,6 +1,8 @@
 from time import sleep
 from django.test import TestCase, LiveServerTestCase
-from remote_node.models import RemoteNode
+from remote_node.models import RemoteNode, OutboundDelivery
+from unittest.mock import patch, MagicMock
+import remote_node.authors
 from post import models, serializers
 import urllib
 import base64
@@ -9,8 +11,14 @@ import util
 from util.tests import LiveServerThreadWithReuse
 import util.main as util
 from restapi.models import User
+from followers.models import Follower
 from rest_framework import status
 import json
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from post import search
+from django.contrib.auth.models import AnonymousUser
+from django.test import override_settings
 
 # Create your tests here.
 class PostTestCase(LiveServerTestCase):
@@ -585,3 +593,386 @@ class CommentTestCase(LiveServerTestCase):
         self.assertEqual(response.data.get('type'), 'comment')
         self.assertEqual(response.data.get('comment'), 'user 2 comments on user 1 post')
         print(json.dumps(response.data, indent=2))
+
+
+class PostQueryCountTest(TestCase):
+    '''
+    Serializing a page of posts should take the same number of queries no matter how many posts are on it
+    '''
+    def setUp(self):
+        self.user1 = models.User.objects.create_user(
+            displayName='Test User 1',
+            password='testuser1',
+            github='https://github.com/uofa-cmput404',
+            profileImage=None
+        )
+
+    def _public_posts_queries(self):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get('/api/authors/all/posts/public?size=100')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        return len(queries)
+
+    def test_public_posts_constant_queries(self):
+        post = models.Post.objects.create(author=self.user1, title='Post', content='content', visibility='PUBLIC')
+        models.Comment.objects.create(author=self.user1, post=post, comment='comment')
+        few = self._public_posts_queries()
+
+        for i in range(5):
+            post = models.Post.objects.create(author=self.user1, title=f'Post {i}', content='content', visibility='PUBLIC')
+            models.Comment.objects.create(author=self.user1, post=post, comment='comment')
+        self.assertEqual(self._public_posts_queries(), few)
+
+        response = self.client.get('/api/authors/all/posts/public?size=100')
+        self.assertTrue(all(item['count'] == 1 for item in response.data['items']))
+
+
+class FollowingFeedTest(TestCase):
+    '''
+    Tests the friends/following feed (authors/{id}/posts/following)
+    '''
+    def setUp(self):
+        self.users = [
+            models.User.objects.create_user(
+                displayName=f'Test User {i}',
+                password=f'testuser{i}',
+                github='https://github.com/uofa-cmput404',
+                profileImage=None
+            )
+            for i in range(3)
+        ]
+        me, friend, followed = self.users
+        # me <-> friend are friends, me -> followed is a one-way follow
+        # (the follower graph is updated on commit, which the test's transaction never does)
+        with self.captureOnCommitCallbacks(execute=True):
+            Follower.objects.create(actor=me, object=friend)
+            Follower.objects.create(actor=friend, object=me)
+            Follower.objects.create(actor=me, object=followed)
+
+        for user in [friend, followed]:
+            models.Post.objects.create(author=user, title=f'{user} public', content='c', visibility='PUBLIC')
+            models.Post.objects.create(author=user, title=f'{user} friends', content='c', visibility='FRIENDS')
+            models.Post.objects.create(author=user, title='Github Activity: x', content='c', visibility='PUBLIC', isGithub=True)
+
+    def test_following_feed(self):
+        me = self.users[0]
+        response = self.client.get(f'/api/authors/{me.id}/posts/following?size=100')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        titles = {item['title'] for item in response.data['items']}
+        self.assertEqual(titles, {'Test User 1 public', 'Test User 1 friends', 'Test User 2 public'})
+
+        published = [item['published'] for item in response.data['items']]
+        self.assertEqual(published, sorted(published, reverse=True))
+
+    def test_following_feed_paginated(self):
+        me = self.users[0]
+        response = self.client.get(f'/api/authors/{me.id}/posts/following?page=2&size=2')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(len(response.data['items']), 1)
+
+
+class PostFanOutTest(TestCase):
+    '''
+    Tests that creating a post queues a notification for every follower instead of sending it inline
+    '''
+    def setUp(self):
+        self.author = models.User.objects.create_user(
+            displayName='Test User 1',
+            password='testuser1',
+            github='https://github.com/uofa-cmput404',
+            profileImage=None
+        )
+        self.follower = models.User.objects.create_user(
+            displayName='Test User 2',
+            password='testuser2',
+            github='https://github.com/uofa-cmput404',
+            profileImage=None
+        )
+        Follower.objects.create(actor=self.follower, object=self.author)
+
+    def test_create_post_queues_deliveries(self):
+        auth_token = f'Basic {base64.b64encode(b"Test User 1:testuser1").decode("ascii")}'
+        with patch('remote_node.util.node_post') as mock_post:
+            response = self.client.post(
+                f'/api/authors/{self.author.id}/posts',
+                {
+                    "title": "Test Post",
+                    "source": "https://example.com",
+                    "origin": "https://example.com",
+                    "description": "Test Description",
+                    "content": "Test Content",
+                    "contentType": "text/plain",
+                    "visibility": "PUBLIC"
+                },
+                content_type='application/json',
+                HTTP_AUTHORIZATION=auth_token
+            )
+        self.assertEqual(response.status_code, 201)
+        mock_post.assert_not_called()
+
+        queued = OutboundDelivery.objects.get()
+        self.assertEqual(queued.url, f'{util.url_remove_trailing_slash(self.follower.url)}/inbox')
+        self.assertEqual(queued.status, OutboundDelivery.PENDING)
+        self.assertEqual(queued.payload['items'][0]['id'], response.json()['id'])
+
+
+class CursorPaginationTest(TestCase):
+    '''
+    Tests the opt-in cursor mode of the list endpoints
+    '''
+    def setUp(self):
+        self.author = models.User.objects.create_user(
+            displayName='Test User 1',
+            password='testuser1',
+            github='https://github.com/uofa-cmput404',
+            profileImage=None
+        )
+        self.posts = [
+            models.Post.objects.create(author=self.author, title=f'post {i}', content='c', visibility='PUBLIC')
+            for i in range(7)
+        ]
+        # give some posts the same timestamp, so the id has to break the tie
+        models.Post.objects.filter(pk__in=[post.pk for post in self.posts[:3]]).update(published=self.posts[0].published)
+
+    def test_walk_pages(self):
+        seen = []
+        url = '/api/authors/all/posts/public?cursor&size=3'
+        while url:
+            response = self.client.get(url)
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+            self.assertLessEqual(len(response.data['items']), 3)
+            seen += [item['id'] for item in response.data['items']]
+            url = response.data['next']
+
+        self.assertEqual(len(seen), 7)
+        self.assertEqual(len(set(seen)), 7)
+        expected = models.Post.objects.order_by('-published', '-id')
+        self.assertEqual([item.split('/')[-1] for item in seen], [post.id for post in expected])
+
+    def test_previous_page(self):
+        first = self.client.get('/api/authors/all/posts/public?cursor&size=3')
+        self.assertIsNone(first.data['previous'])
+        second = self.client.get(first.data['next'])
+        back = self.client.get(second.data['previous'])
+        self.assertEqual(back.data['items'], first.data['items'])
+
+    def test_page_numbers_unchanged(self):
+        response = self.client.get('/api/authors/all/posts/public?page=2&size=3')
+        self.assertEqual(len(response.data['items']), 3)
+        self.assertNotIn('next', response.data)
+
+    def test_invalid_cursor(self):
+        response = self.client.get('/api/authors/all/posts/public?cursor=notacursor')
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+
+class PostImageTest(TestCase):
+    '''
+    Tests that images are stored as binary and served with caching and range support
+    '''
+    def setUp(self):
+        self.author = models.User.objects.create_user(
+            displayName='Test User 1',
+            password='testuser1',
+            github='https://github.com/uofa-cmput404',
+            profileImage=None
+        )
+        self.image = bytes(range(256)) * 4
+        self.post = models.Post.objects.create(
+            author=self.author,
+            title='image',
+            content=base64.b64encode(self.image).decode('ascii'),
+            contentType='image/png;base64',
+            visibility='PUBLIC'
+        )
+        self.url = f'/api/authors/{self.author.id}/posts/{self.post.id}/image'
+
+    def test_stored_as_binary(self):
+        self.post.refresh_from_db()
+        self.assertEqual(self.post.content, '')
+        self.assertEqual(bytes(self.post.image.data), self.image)
+        self.assertEqual(self.post.image.content_type, 'image/png')
+
+    def test_retrieve_image(self):
+        response = self.client.get(self.url)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(b''.join(response.streaming_content), self.image)
+        self.assertEqual(response['Content-Type'], 'image/png')
+
+        # the same ETag means the client's copy is still good
+        response = self.client.get(self.url, HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+
+    def test_range(self):
+        response = self.client.get(self.url, HTTP_RANGE='bytes=10-19')
+        self.assertEqual(response.status_code, status.HTTP_206_PARTIAL_CONTENT)
+        self.assertEqual(b''.join(response.streaming_content), self.image[10:20])
+        self.assertEqual(response['Content-Range'], f'bytes 10-19/{len(self.image)}')
+
+        response = self.client.get(self.url, HTTP_RANGE='bytes=-5')
+        self.assertEqual(b''.join(response.streaming_content), self.image[-5:])
+
+        response = self.client.get(self.url, HTTP_RANGE=f'bytes={len(self.image)}-')
+        self.assertEqual(response.status_code, status.HTTP_416_REQUESTED_RANGE_NOT_SATISFIABLE)
+
+    def test_list_gives_image_url(self):
+        response = self.client.get('/api/authors/all/posts/public')
+        item = response.data['items'][0]
+        self.assertEqual(item['content'], f"{item['id']}/image")
+
+        # a single post still has the base64 image
+        data = serializers.PostSerializer(self.post).data
+        self.assertEqual(base64.b64decode(data['content']), self.image)
+
+    def test_list_loads_private_images_at_once(self):
+        for n in range(3):
+            models.Post.objects.create(
+                author=self.author, title=f'friends image {n}', content=base64.b64encode(self.image).decode('ascii'),
+                contentType='image/png;base64', visibility='FRIENDS',
+            )
+        posts = list(models.Post.objects.with_comment_count().order_by('title'))
+        with self.assertNumQueries(1):
+            data = serializers.PostSerializer(posts, many=True).data
+        self.assertEqual([base64.b64decode(item['content']) for item in data[:3]], [self.image] * 3)
+        self.assertEqual(data[3]['content'], f"{data[3]['id']}/image")
+
+    def test_edit_keeps_image(self):
+        data = serializers.PostSerializer([self.post], many=True).data[0]
+        self.post.content = data['content']
+        self.post.save()
+        self.post.refresh_from_db()
+        self.assertEqual(self.post.content, '')
+        self.assertEqual(bytes(self.post.image.data), self.image)
+
+
+class LikeSerializerBatchTest(TestCase):
+    '''
+    Tests that serializing a list of likes looks up all their authors at once
+    '''
+    def setUp(self):
+        self.users = [
+            models.User.objects.create_user(
+                displayName=f'Test User {i}',
+                password=f'testuser{i}',
+                github='https://github.com/uofa-cmput404',
+                profileImage=None
+            )
+            for i in range(4)
+        ]
+        post = models.Post.objects.create(author=self.users[0], title='post', content='c', visibility='PUBLIC')
+        for user in self.users:
+            models.Like.objects.create(author=user.url, object=post.url)
+        self.remote_urls = [f'https://remote.com/api/authors/{i}' for i in range(3)]
+        for url in self.remote_urls:
+            models.Like.objects.create(author=url, object=post.url)
+        remote_node.authors.author_cache.clear()
+
+    def _remote_responses(self, urls, deadline=None):
+        responses = {}
+        for url in urls:
+            response = MagicMock()
+            response.status_code = 200
+            response.json.return_value = {'type': 'author', 'id': url, 'displayName': url.split('/')[-1]}
+            responses[url] = response
+        return responses
+
+    def test_authors_batched(self):
+        likes = models.Like.objects.all()
+        with patch('remote_node.util.get_many', side_effect=self._remote_responses) as mock_get_many:
+            # one query for the likes, one for the local authors
+            with self.assertNumQueries(2):
+                data = serializers.LikeSerializer(likes, many=True).data
+        mock_get_many.assert_called_once()
+        self.assertCountEqual(mock_get_many.call_args[0][0], self.remote_urls)
+        self.assertEqual(len(data), 7)
+        self.assertCountEqual(
+            [like['author']['displayName'] for like in data],
+            [user.displayName for user in self.users] + ['0', '1', '2']
+        )
+
+        # the remote authors are cached now
+        with patch('remote_node.util.get_many', side_effect=self._remote_responses) as mock_get_many:
+            serializers.LikeSerializer(likes, many=True).data
+        self.assertEqual(mock_get_many.call_args[0][0], [])
+
+
+class SearchTest(TestCase):
+    '''
+    Tests full-text search over posts and comments (/api/search)
+    '''
+    def setUp(self):
+        self.me, self.friend, self.stranger = [
+            models.User.objects.create_user(displayName=f'Search User {i}', password=f'searchuser{i}', github='', profileImage=None)
+            for i in range(3)
+        ]
+        with self.captureOnCommitCallbacks(execute=True):
+            Follower.objects.create(actor=self.me, object=self.friend)
+            Follower.objects.create(actor=self.friend, object=self.me)
+
+        self.titled = models.Post.objects.create(author=self.stranger, title='Colossal titans', description='d', content='walls', visibility='PUBLIC')
+        self.described = models.Post.objects.create(author=self.stranger, title='t', description='about titans', content='walls', visibility='PUBLIC')
+        self.friends_only = models.Post.objects.create(author=self.friend, title='Titan shifting', content='c', visibility='FRIENDS')
+        self.strangers_only = models.Post.objects.create(author=self.stranger, title='Titan secrets', content='c', visibility='FRIENDS')
+        self.unlisted = models.Post.objects.create(author=self.stranger, title='Titan map', content='c', visibility='UNLISTED')
+        self.image = models.Post.objects.create(author=self.stranger, title='image', content='titan', contentType='image/png;base64', visibility='PUBLIC')
+        self.comment = models.Comment.objects.create(author=self.stranger, post=self.titled, comment='The titans are coming')
+        models.Comment.objects.create(author=self.friend, post=self.strangers_only, comment='titans again')
+
+    def _auth(self, user):
+        number = [self.me, self.friend, self.stranger].index(user)
+        token = base64.b64encode(f'{user.displayName}:searchuser{number}'.encode('ascii')).decode('ascii')
+        return {'HTTP_AUTHORIZATION': f'Basic {token}'}
+
+    def test_ranked_and_visible(self):
+        response = self.client.get('/api/search?q=titan&size=100', **self._auth(self.me))
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        ids = [item['id'].split('/')[-1] for item in response.data['items']]
+        # public and friends' posts, not strangers' friends-only or unlisted ones, nor image content
+        self.assertEqual(set(ids), {str(self.titled.id), str(self.described.id), str(self.friends_only.id)})
+        # a title match ranks above a description match
+        self.assertLess(ids.index(str(self.titled.id)), ids.index(str(self.described.id)))
+
+    def test_anonymous_sees_public_only(self):
+        response = self.client.get('/api/search?q=titans')
+        self.assertEqual({item['id'].split('/')[-1] for item in response.data['items']}, {str(self.titled.id), str(self.described.id)})
+
+    def test_comments(self):
+        response = self.client.get('/api/search?q=titans&type=comments', **self._auth(self.me))
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual([item['comment'] for item in response.data['items']], ['The titans are coming'])
+
+    def test_index_follows_edits(self):
+        self.titled.title = 'Renamed'
+        self.titled.description = 'nothing'
+        self.titled.save()
+        self.assertEqual(search.search(search.POSTS, 'colossal', AnonymousUser()), [])
+        self.comment.comment = 'They went away'
+        self.comment.save()
+        self.assertEqual([str(id) for id in search.search(search.COMMENTS, 'away', AnonymousUser())], [str(self.comment.id)])
+        self.comment.delete()
+        self.assertEqual(search.search(search.COMMENTS, 'away', AnonymousUser()), [])
+
+    @override_settings(SEARCH_MAX_RESULTS=3)
+    def test_cap_counts_visible_results_only(self):
+        # better matches the user can't see don't push out the ones they can
+        for n in range(5):
+            models.Post.objects.create(author=self.stranger, title='Zebra zebra zebra', content='c', visibility='UNLISTED')
+        public = models.Post.objects.create(author=self.me, title='t', content='a zebra', visibility='PUBLIC')
+        response = self.client.get('/api/search?q=zebra', **self._auth(self.friend))
+        self.assertEqual([item['id'].split('/')[-1] for item in response.data['items']], [str(public.id)])
+        self.assertEqual(response.data['count'], 1)
+        # the author sees their unlisted posts
+        response = self.client.get('/api/search?q=zebra&size=10', **self._auth(self.stranger))
+        self.assertEqual(len(response.data['items']), 3)
+        self.assertEqual(response.data['count'], 6)
+
+    def test_paginated(self):
+        response = self.client.get('/api/search?q=titans&size=1&page=2')
+        self.assertEqual(len(response.data['items']), 1)
+        self.assertEqual(response.data['count'], 2)
+        self.assertIsNone(response.data['next'])
+        self.assertEqual(response.data['previous'], 'http://testserver/api/search?q=titans&size=1')
+
+    def test_query_required(self):
+        self.assertEqual(self.client.get('/api/search').status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(self.client.get('/api/search?q="*').status_code, status.HTTP_200_OK)
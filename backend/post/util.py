@@ -0,0 +1,79 @@
+'''
+Utilities for serving post images
+'''
+import re
+from django.http import HttpResponse, StreamingHttpResponse
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date, quote_etag
+from post.models import PostImage
+
+# images are sent in chunks of this many bytes
+IMAGE_CHUNK_SIZE = 64 * 1024
+
+RANGE_RE = re.compile(r'^bytes=(\d*)-(\d*)$')
+
+def parse_range(header: str, size: int) -> tuple:
+    '''
+    Parse a single-range `Range: bytes=start-end` header.
+
+    Returns (start, end) with `end` inclusive, or None if the header should be ignored.
+    Raises ValueError if the range can't be satisfied.
+    '''
+    match = RANGE_RE.match(header.strip())
+    if not match or match.groups() == ('', ''):
+        # multiple ranges or a unit we don't support: just send the whole image
+        return None
+    start, end = match.groups()
+    if start == '':
+        # suffix range: the last `end` bytes
+        length = int(end)
+        if length == 0:
+            raise ValueError('empty suffix range')
+        return max(size - length, 0), size - 1
+    start = int(start)
+    end = min(int(end), size - 1) if end else size - 1
+    if start >= size or start > end:
+        raise ValueError('range not satisfiable')
+    return start, end
+
+def _chunks(data: memoryview, start: int, end: int):
+    for offset in range(start, end + 1, IMAGE_CHUNK_SIZE):
+        yield bytes(data[offset:min(offset + IMAGE_CHUNK_SIZE, end + 1)])
+
+def image_response(request, image: PostImage) -> HttpResponse:
+    '''
+    Stream a post image, with ETag/Last-Modified validation (304s) and byte Range support
+    '''
+    etag = quote_etag(image.etag)
+    last_modified = int(image.updated.timestamp())
+    not_modified = get_conditional_response(request, etag=etag, last_modified=last_modified)
+    if not_modified is not None:
+        return not_modified
+
+    data = memoryview(image.data)
+    size = len(data)
+    start, end = 0, size - 1
+    partial = False
+
+    range_header = request.headers.get('Range')
+    # If-Range: only send part of the image if the client has the current version of it
+    if range_header and size and request.headers.get('If-Range', etag) == etag:
+        try:
+            byte_range = parse_range(range_header, size)
+        except ValueError:
+            response = HttpResponse(status=416)
+            response['Content-Range'] = f'bytes */{size}'
+            return response
+        if byte_range is not None:
+            start, end = byte_range
+            partial = True
+
+    response = StreamingHttpResponse(_chunks(data, start, end), content_type=image.content_type, status=206 if partial else 200)
+    response['Content-Length'] = str(end - start + 1 if size else 0)
+    if partial:
+        response['Content-Range'] = f'bytes {start}-{end}/{size}'
+    response['Accept-Ranges'] = 'bytes'
+    response['ETag'] = etag
+    response['Last-Modified'] = http_date(last_modified)
+    response['Cache-Control'] = 'public, max-age=60'
+    return response
@@ -13,6 +13,7 @@ from restapi.models import User
 from .models import Comment, Like, Post
 from inbox.models import Inbox, InboxComment
 from followers.models import Follower
+from followers import graph as follower_graph
 from remote_node.models import RemoteNode
 from django.db.models import Q
 import os
@@ -20,12 +21,16 @@ import requests
 from util.main import url_remove_trailing_slash, standardize_url, removeQueryParamAll
 from followers.serializers import FollowerSerializer
 import remote_node.util
+import remote_node.delivery
 import util.main as util
 from remote_node.util import get as get_remote
+from util.pagination import KeysetPagination
+from post.util import image_response
+from post import search as post_search
 
 BASE_URL = os.environ.get('HOST_API_URL') + 'authors'
 
-class CustomPagination(pagination.PageNumberPagination):
+class CustomPagination(KeysetPagination):
     """
     Custom pagination class to override the default page size
     """
@@ -37,7 +42,7 @@ class PostViewSet(viewsets.ModelViewSet):
     """
     API endpoint that allows posts to be viewed or edited.
     """
-    queryset = models.Post.objects.all().order_by('-published')
+    queryset = models.Post.objects.with_comment_count().order_by('-published')
     serializer_class = serializers.PostSerializer
     pagination_class = CustomPagination
     nodes = RemoteNode.objects.filter(disabled=False)
@@ -50,8 +55,8 @@ class PostViewSet(viewsets.ModelViewSet):
         """
 
         # remote nodes cannot access this resource
-        util.log('PostViewSet/list', f'JSON: {json.dumps(request.data)}')
-        util.log('PostViewSet/list', f'User: {request.user}')
+        util.log('PostViewSet/list', lambda: f'JSON: {json.dumps(request.data)}')
+        util.log('PostViewSet/list', 'User: %s', request.user)
         if not request.user.is_authenticated:
             return Response({"error": "You are not allowed to access this resource"}, status=status.HTTP_403_FORBIDDEN)
 
@@ -59,31 +64,31 @@ class PostViewSet(viewsets.ModelViewSet):
 
         author_id = self.kwargs.get('author_id')
         if not author_id:
-            util.log('PostViewSet/list', f"Author ID is None")
+            util.log('PostViewSet/list', "Author ID is None")
             return Response({"error": "Author ID is required"}, status=status.HTTP_400_BAD_REQUEST)
         
         # FIRST CHECK LOCAL DATABASE
-        util.log('PostViewSet/list', f"Checking local database for user with ID: {self.kwargs.get('author_id')}")
+        util.log('PostViewSet/list', "Checking local database for user with ID: %s", self.kwargs.get('author_id'))
         try:
             author = User.objects.get(pk=author_id, is_remote=False)
         except User.DoesNotExist:
-            util.log('PostViewSet/list', f"Author {author_id} not found in the local database")
+            util.log('PostViewSet/list', "Author %s not found in the local database", author_id)
             author = None
 
         # Author found in the local database
         if author:
             # Get all posts by the author
-            posts = models.Post.objects.filter(author=author).order_by('-published')
-            util.log('PostViewSet/list', f"Posts: {posts}")
+            posts = models.Post.objects.filter(author=author).with_comment_count().order_by('-published')
+            util.log('PostViewSet/list', "Posts: %s", posts)
 
             # If the user is not authenticated, only return public posts
             if not request.user.is_authenticated:
-                util.log('PostViewSet/list', f"User is not authenticated")
+                util.log('PostViewSet/list', "User is not authenticated")
                 posts = posts.filter(visibility='PUBLIC')
             
             # if the user is a node, return all posts
             elif request.user.is_node:
-                util.log('PostViewSet/list', f"User is a node")
+                util.log('PostViewSet/list', "User is a node")
                 pass
 
             # If the authenticated user is the author, retrn all posts
@@ -91,18 +96,18 @@ class PostViewSet(viewsets.ModelViewSet):
                 pass
 
             # check if the authenticated user is following the author. If not, only return public posts
-            elif not Follower.objects.filter(actor=request.user, object=author).exists():
-                    util.log('PostViewSet/list', f"User is not following the author")
+            elif not follower_graph.follows(request.user, author):
+                    util.log('PostViewSet/list', "User is not following the author")
                     posts = posts.filter(visibility='PUBLIC')
 
             # If the authenticated user is following the author, check if the author is following the user
             # If the author is following the user, return public and friends posts
             else:
-                util.log('PostViewSet/list', f"Testing if author is following the user")
+                util.log('PostViewSet/list', "Testing if author is following the user")
                 try:
                     user = User.objects.get(url=request.user.url.rstrip('/'))
                     # if the user is in the local database, check if the user is following the author
-                    if Follower.objects.filter(actor=author, object=user).exists():
+                    if follower_graph.follows(author, user):
                         posts = posts.filter(Q(visibility='PUBLIC') | Q(visibility='FRIENDS'))
                     else:
                         posts = posts.filter(visibility='PUBLIC')
@@ -121,50 +126,42 @@ class PostViewSet(viewsets.ModelViewSet):
             serializer = serializers.PostSerializer(pagination_posts, many=True)
 
             post_list["items"] += serializer.data
+            post_list.update(paginator.cursor_links())
             return Response(post_list, status=status.HTTP_200_OK)
 
         # IF ALL NOT IN QUERY PARAMS, RETURN 404
         if 'all' not in request.query_params:
-            util.log('PostViewSet/list', f"All not in query params, returning 404")
+            util.log('PostViewSet/list', "All not in query params, returning 404")
             return Response({"error": "Author not found"}, status=status.HTTP_404_NOT_FOUND)
         
 
         # IF ALL IN QUERY PARAMS, CHECK REMOTE NODES
-        util.log('PostViewSet/list', f"Searching for author {author_id} on remote nodes")
+        util.log('PostViewSet/list', "Searching for author %s on remote nodes", author_id)
         url = request.build_absolute_uri().split('api/')[1].rstrip('/')
         url = removeQueryParamAll(url)
 
+        requests_by_node = []
         for node in self.nodes:
             if node.displayName == 'local':
                 continue
-            try:
-                request_url = remote_node.util.transform_url_for_node(
-                    f"{node.url.rstrip('/')}/{url}",
-                    node
-                )
-                auth_token = base64.b64encode(f"{node.displayName}:{node.password}".encode('ascii')).decode('ascii')
-                headers = {
-                    'Authorization': f'Basic {auth_token}',
-                    'Content-Type': 'application/json'
-                }
-                if node.displayName == 'user':
-                    # add slash before query parameters just for team HTTP
-                    # we're adding this weird condition here instead of transform_url_for_node because
-                    # we only want to add trailing slash for certain endpoints.
-                    request_url = request_url.split('?')[0]
-                    request_url += '/'
-
-                util.log('PostViewSet/list', f"Requesting posts from {node.nodeName}: {request_url}")
-                response = requests.get(request_url, headers=headers)
-                
-                # If the response is successful, return the posts
-                if response.status_code == 200:
-                    return Response(response.json())
-                else:
-                    util.log('PostViewSet/list', f"{node.nodeName} returned status code: {response.status_code}")
+            request_url = remote_node.util.transform_url_for_node(
+                f"{node.url.rstrip('/')}/{url}",
+                node
+            )
+            if node.displayName == 'user':
+                # add slash before query parameters just for team HTTP
+                # we're adding this weird condition here instead of transform_url_for_node because
+                # we only want to add trailing slash for certain endpoints.
+                request_url = request_url.split('?')[0]
+                request_url += '/'
 
-            except requests.RequestException as e:
-                util.log('PostViewSet/list', f"Error connecting to {node.nodeName}: {e}")
+            util.log('PostViewSet/list', "Requesting posts from %s: %s", node.nodeName, request_url)
+            requests_by_node.append((node, request_url))
+
+        # query all nodes at once. If one of them has the posts, return them
+        response = remote_node.util.get_first(requests_by_node)
+        if response is not None:
+            return Response(response.json())
 
         # Author not found in the local database and remote nodes
         return Response({"error": "Author not found"}, status=status.HTTP_404_NOT_FOUND)
@@ -176,7 +173,7 @@ class PostViewSet(viewsets.ModelViewSet):
         URL: ://service/authors/{AUTHOR_ID}/posts/{POST_ID}
         """
         # check if the user exists in the local database
-        util.log('PostViewSet/retrieve', f"Author ID: {author_id}, Post ID: {pk}")
+        util.log('PostViewSet/retrieve', "Author ID: %s, Post ID: %s", author_id, pk)
         if User.objects.filter(pk=author_id, is_remote=False).exists():
             try:
                 post = models.Post.objects.get(pk=pk)
@@ -185,26 +182,26 @@ class PostViewSet(viewsets.ModelViewSet):
 
             # Validate that the author of the post is the same as the author_id
             if post.author.id != author_id:
-                util.log('PostViewSet/retrieve', f"User {author_id} is not the author of post {pk} (Author: {post.author.id})")
+                util.log('PostViewSet/retrieve', "User %s is not the author of post %s (Author: %s)", author_id, pk, post.author.id)
                 return Response({"error": "Post not found"}, status=status.HTTP_404_NOT_FOUND)
 
 
             # Crazy if statement to implement (good luck deciphering it)
             # Cases where post is publicly viewable
-            util.log('PostViewSet/retrieve', f"Post visibility: {post.visibility}")
-            util.log('PostViewSet/retrieve', f"User: {request.user}" + f" Author ID: {author_id}")
+            util.log('PostViewSet/retrieve', "Post visibility: %s", post.visibility)
+            util.log('PostViewSet/retrieve', "User: %s Author ID: %s", request.user, author_id)
             if (post.visibility in ['PUBLIC', 'UNLISTED'] or                # Anyone can view public or unlisted posts
                 request.user.id == author_id or                             # The author can view their own posts
                 (request.user.is_authenticated and request.user.is_node)):  # Nodes can view any post
-                util.log('PostViewSet/retrieve', f"Post is publicly viewable or user is the author or a node")
+                util.log('PostViewSet/retrieve', "Post is publicly viewable or user is the author or a node")
                 pass
 
             # Otherwise, the post is a 'FRIENDS' post, the user is not the author, and the user is not a node, or the user is not authenticated
             # The user must be following the author and the author must be following the user
             elif request.user.is_authenticated:
-                util.log('PostViewSet/retrieve', f"Post is a friends post and user is not the author or a node but is authenticated")
+                util.log('PostViewSet/retrieve', "Post is a friends post and user is not the author or a node but is authenticated")
                 # if the user is not following the author, they cannot view the post
-                if not Follower.objects.filter(actor=request.user, object=post.author).exists():
+                if not follower_graph.follows(request.user, post.author):
                     return Response({"error": "You are not authorized to view this post"}, 
                                     status=status.HTTP_401_UNAUTHORIZED)
                 # if the author is not following the user, they cannot view the post
@@ -212,7 +209,7 @@ class PostViewSet(viewsets.ModelViewSet):
                 try:
                     user = User.objects.get(url=request.user.url.rstrip('/'))
                     # Check if the author is following the user
-                    if not Follower.objects.filter(actor=post.author, object=user).exists():
+                    if not follower_graph.follows(post.author, user):
                         return Response({"error": "You are not authorized to view this post"}, 
                                         status=status.HTTP_401_UNAUTHORIZED)
                 # If the user is not in the local database, make a remote request to check following
@@ -224,7 +221,7 @@ class PostViewSet(viewsets.ModelViewSet):
                                         status=status.HTTP_401_UNAUTHORIZED)
 
             else:
-                util.log("PostViewSet/retrieve", f"User is not authenticated")
+                util.log("PostViewSet/retrieve", "User is not authenticated")
                 return Response({"error": "You are not authorized to view this post"}, 
                                 status=status.HTTP_401_UNAUTHORIZED)
 
@@ -239,32 +236,24 @@ class PostViewSet(viewsets.ModelViewSet):
         url = request.build_absolute_uri().split('api/')[1].rstrip('/')
         url = removeQueryParamAll(url)
 
+        requests_by_node = []
         for node in self.nodes:
             if node.displayName == 'local':
                 continue
 
-            try:
-                request_url = remote_node.util.transform_url_for_node(
-                    f"{node.url.rstrip('/')}/{url}",
-                    node
-                )
-                auth_token = base64.b64encode(f"{node.displayName}:{node.password}".encode('ascii')).decode('ascii')
-                headers = {
-                    'Authorization': f'Basic {auth_token}',
-                    'Content-Type': 'application/json'
-                }
-                if node.displayName == 'user':
-                    # add slash for team HTTP only for this endpoint
-                    request_url = request_url.split('?')[0]
-                    request_url += '/'
-                response = requests.get(request_url, headers=headers)
-                if response.status_code == 200:
-                    return Response(response.json())
-                else:
-                    util.log('PostViewSet/retrieve', f"Failed to connect to {node.nodeName}. Status code: {response.status_code}")
-            except requests.RequestException as e:
-                util.log('PostViewSet/retrieve', f"Error connecting to {node.nodeName}: {e}")
+            request_url = remote_node.util.transform_url_for_node(
+                f"{node.url.rstrip('/')}/{url}",
+                node
+            )
+            if node.displayName == 'user':
+                # add slash for team HTTP only for this endpoint
+                request_url = request_url.split('?')[0]
+                request_url += '/'
+            requests_by_node.append((node, request_url))
 
+        response = remote_node.util.get_first(requests_by_node)
+        if response is not None:
+            return Response(response.json())
 
         return Response({"error": "Post not found"}, status=status.HTTP_404_NOT_FOUND)
 
@@ -275,21 +264,21 @@ class PostViewSet(viewsets.ModelViewSet):
         URL: ://service/authors/{AUTHOR_ID}/posts
         '''
         # only authenticated user of that account can create a post
-        util.log('PostViewSet/create', f'User: {request.user}')
+        util.log('PostViewSet/create', 'User: %s', request.user)
 
         if not request.user.is_authenticated:
-            util.log('PostViewSet/create', f'User not authenticated')
+            util.log('PostViewSet/create', 'User not authenticated')
             return Response({"error": "You are not authorized to create a post"}, status=status.HTTP_401_UNAUTHORIZED)
         if request.user.is_node:
-            util.log('PostViewSet/create', f'User is a node')
+            util.log('PostViewSet/create', 'User is a node')
             return Response({"error": "You are not allowed to access this resource"}, status=status.HTTP_403_FORBIDDEN)
 
-        util.log('PostViewSet/create', f'Author ID: {self.kwargs.get("author_id")}')
+        util.log('PostViewSet/create', 'Author ID: %s', self.kwargs.get("author_id"))
         author_id = self.kwargs.get('author_id')
         if request.user.id != author_id:
             print(request.user)
             print(request.user.id, author_id)
-            util.log('PostViewSet/create', f'User is not the author of the post')
+            util.log('PostViewSet/create', 'User is not the author of the post')
             return Response({"error": "You are not authorized to create a post for this user"}, status=status.HTTP_401_UNAUTHORIZED)
         
         serializer = self.get_serializer(data=request.data)
@@ -299,29 +288,23 @@ class PostViewSet(viewsets.ModelViewSet):
         else:
             return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
-        # get all user who follow this user, so we can send them a notification to their inbox
-        follower_queryset = Follower.objects.filter(object=author_id)
-        followers = FollowerSerializer(follower_queryset, many=True).data
-        for follower in followers:
-            try:
-                # send a notification to the follower
-                follower_url = follower['actor']
-                author_url = f'{url_remove_trailing_slash(BASE_URL)}/{author_id}'
-                util.log('PostViewSet/create', f'Sending new-post notif to follower: {follower_url}')
-                url_post = f'{url_remove_trailing_slash(follower_url)}/posts'
-
-                x = remote_node.util.post(
-                    f"{url_remove_trailing_slash(follower_url)}/inbox", 
-                    json={
-                        "type": "inbox",
-                        "author": author_url,
-                        "items": [serializer.data['id']]
-                    }
-                )
-                util.log('PostViewSet/create', f'Notification response: {x.status_code}')
-            except Exception as e:
-                util.log('PostViewSet/create', f'Error sending a new-post notif to follower: {e}')
-                continue
+        # queue a notification to the inbox of every follower of this user
+        # (sent in the background by remote_node/delivery.py, so we don't wait on other nodes here)
+        author_url = f'{url_remove_trailing_slash(BASE_URL)}/{author_id}'
+        follower_queryset = Follower.objects.filter(object=author_id).select_related('actor')
+        deliveries = []
+        for follower in follower_queryset:
+            follower_url = follower.actor.url
+            util.log('PostViewSet/create', 'Queueing new-post notif to follower: %s', follower_url)
+            deliveries.append((
+                f"{url_remove_trailing_slash(follower_url)}/inbox",
+                {
+                    "type": "inbox",
+                    "author": author_url,
+                    "items": [serializer.data]
+                }
+            ))
+        remote_node.delivery.enqueue_many(deliveries)
 
         return Response(
             serializer.data,
@@ -332,7 +315,7 @@ class PostViewSet(viewsets.ModelViewSet):
         # only authenticated user of that account can delete a post
         if request.user.is_node:
             return Response({"error": "You are not allowed to access this resource"}, status=status.HTTP_403_FORBIDDEN)
-        util.log('PostViewSet/destroy', f'User: {request.user.id}, Author ID: {self.kwargs.get("author_id")}')
+        util.log('PostViewSet/destroy', 'User: %s, Author ID: %s', request.user.id, self.kwargs.get("author_id"))
         author_id = self.kwargs.get('author_id')
         if request.user.id != author_id:
             return Response({"error": "You are not authorized to delete a post for this user"}, status=status.HTTP_401_UNAUTHORIZED)
@@ -347,7 +330,7 @@ class PostViewSet(viewsets.ModelViewSet):
         # only authenticated user of that account can update a post
         if request.user.is_node:
             return Response({"error": "You are not allowed to access this resource"}, status=status.HTTP_403_FORBIDDEN)
-        util.log('PostViewSet/update', f'User: {request.user}')
+        util.log('PostViewSet/update', 'User: %s', request.user)
         author_id = self.kwargs.get('author_id')
         if request.user.id != author_id:
             return Response({"error": "You are not authorized to update a post for this user"}, status=status.HTTP_401_UNAUTHORIZED)
@@ -358,12 +341,12 @@ class PostViewSet(viewsets.ModelViewSet):
         METHOD: GET
         Returns a list of public posts
         """
-        util.log('PostViewSet/public_posts', f'User: {request.user} getting public posts')
-        posts = models.Post.objects.filter(visibility='PUBLIC').order_by('-published')
+        util.log('PostViewSet/public_posts', 'User: %s getting public posts', request.user)
+        posts = models.Post.objects.filter(visibility='PUBLIC').with_comment_count().order_by('-published')
         page = self.paginate_queryset(posts)
         serializer = serializers.PostSerializer(page, many=True)
 
-        return Response({"type": "posts", "items": serializer.data}, status=status.HTTP_200_OK)
+        return Response({"type": "posts", "items": serializer.data, **self.paginator.cursor_links()}, status=status.HTTP_200_OK)
         
 
     def retrive_image(self, request, author_id=None, post_id=None):
@@ -383,10 +366,16 @@ class PostViewSet(viewsets.ModelViewSet):
             # check if the post is a public image with the correct content type and author_id
             if post.visibility != 'PUBLIC':
                 return Response({"error": "Post is not public"}, status=status.HTTP_400_BAD_REQUEST)
-            if post.contentType not in ['image/png;base64', 'image/jpeg;base64', 'image/gif;base64']:
+            if post.contentType not in models.IMAGE_CONTENT_TYPES:
                 return Response({"error": "Post is not an image"}, status=status.HTTP_400_BAD_REQUEST)
-            if post.author.id != author_id:
+            if post.author_id != author_id:
                 return Response({"error": f"User {author_id} does not have post {post_id}"}, status=status.HTTP_404_NOT_FOUND)
+            if post.has_stored_image:
+                image = models.PostImage.objects.filter(post=post).first()
+                if image is None:
+                    return Response({"error": "Post image not found"}, status=status.HTTP_404_NOT_FOUND)
+                return image_response(request, image)
+            # content that couldn't be decoded when the post was saved is still base64 in the post
             image_data = base64.b64decode(post.content)
             return HttpResponse(image_data, content_type=post.contentType)
 
@@ -398,29 +387,22 @@ class PostViewSet(viewsets.ModelViewSet):
         url = request.build_absolute_uri().split('api/')[1].rstrip('/')
         url = removeQueryParamAll(url)
 
+        requests_by_node = []
         for node in self.nodes:
             if node.displayName == 'local':
                 continue
-            try:
-                request_url = remote_node.util.transform_url_for_node(
-                    f"{node.url.rstrip('/')}/{url}",
-                    node
-                )
-                if node.displayName == 'lost':
-                    util.log('FollowerViewSet/list', f'Adding trailing slash to {node.url} for team lost')
-                    request_url += '/'
-                auth_token = base64.b64encode(f"{node.displayName}:{node.password}".encode('ascii')).decode('ascii')
-                headers = {
-                    'Authorization': f'BASIC {auth_token}',
-                    'Content-Type': 'application/json'
-                }
-                response = requests.get(request_url, headers=headers)
-                if response.status_code == 200:
-                    return Response(response.json())
-                else:
-                    util.log('PostViewSet/retrive_image', f"Failed to connect to {node.nodeName}. Status code: {response.status_code}")
-            except requests.RequestException as e:
-                util.log('PostViewSet/retrive_image', f"Error connecting to {node.nodeName}: {e}")
+            request_url = remote_node.util.transform_url_for_node(
+                f"{node.url.rstrip('/')}/{url}",
+                node
+            )
+            if node.displayName == 'lost':
+                util.log('PostViewSet/retrive_image', 'Adding trailing slash to %s for team lost', node.url)
+                request_url += '/'
+            requests_by_node.append((node, request_url))
+
+        response = remote_node.util.get_first(requests_by_node)
+        if response is not None:
+            return Response(response.json())
         return Response({"error": "Post not found"}, status=status.HTTP_404_NOT_FOUND)
     
     def retrive_friends_follwing(self, request, author_id=None):
@@ -432,83 +414,58 @@ class PostViewSet(viewsets.ModelViewSet):
         """
 
         # get the author from the local database
-        try:
-            author = User.objects.get(pk=author_id)
-        except User.DoesNotExist:
+        if not User.objects.filter(pk=author_id).exists():
             return Response({"error": "Author not found"}, status=status.HTTP_404_NOT_FOUND)
-        
-        # get the list of useres that the author is following
-        following = Follower.objects.filter(actor=author)
-        get_author_ids = [f.object.id for f in following]
-        if len(get_author_ids) == 0:
-            util.log('PostViewSet/retrive_friends_follwing', f"Author is not following anyone")
-        else:
-            util.log('PostViewSet/retrive_friends_follwing', f"Author is following {get_author_ids}")
-
-        util.log('PostViewSet/retrive_friends_follwing', f"Checking for friends only posts")
-        # check from the list of authors that the user is following, get the list of authors that are following the user
-        friends = []
-        for author in get_author_ids:
-            # if current author is following the user and user is following the author, then add user to friends list
-            if Follower.objects.filter(actor=author, object=author_id).exists():
-                friends.append(Follower.objects.get(actor=author_id, object=author))
-        # print("Friends: ", friends)
-        get_friends_ids = []
-        get_friends_ids = [f.object.id for f in friends]
-        # take intersection of the two lists
-        if len(get_friends_ids) == 0:
-            util.log('PostViewSet/retrive_friends_follwing', f"Author has no friends")
-        else:
-            util.log('PostViewSet/retrive_friends_follwing', f"Authors friends: {get_friends_ids}")
-
-        # get_friends_ids = list(set(get_author_ids) & set(get_friends_ids))
-        # print("Friends: ", get_friends_ids)
-
-        # get public posts from authors that the user is following, do not include the author's posts
-        # for authors that are local
-        posts_list = []
-        for author in get_author_ids:
-            # check if the author is a remote author
-            if User.objects.filter(pk=author, is_remote=True).exists():
-                # get the posts from the remote author remotely
-                user = User.objects.get(pk=author)
-                url = f"{user.url.rstrip('/')}/posts"
-                if 'linkup' or 'lost' in url:
-                    url += '/'
-                response = get_remote(url)
-                if response.status_code == 200:
-                    for post in response.json()['items']:
-                        if post['visibility'] == 'PUBLIC' and not 'Github Activity:' in post['title']:
-                            posts_list.append(post)
-            else:
-                # title should not have 'Github Activity:' in it
-                posts = models.Post.objects.filter(Q(author_id=author) & Q(visibility='PUBLIC') & ~Q(title__contains='Github Activity:')).order_by('-published')
-                serializer = serializers.PostSerializer(posts, many=True)
-                posts_list += serializer.data
-
-        # get friends only posts from authors that the user is following and vice versa
-        for author in get_friends_ids:
-            # check if the author is a remote author
-            if User.objects.filter(pk=author, is_remote=True).exists():
-                # get the posts from the remote author remotely
-                user = User.objects.get(pk=author)
-                url = f"{user.url.rstrip('/')}/posts"
-                if 'linkup' or 'lost' in url:
-                    url += '/'
-                response = get_remote(url)
-                if response.status_code == 200:
-                    for post in response.json()['items']:
-                        if post['visibility'] == 'FRIENDS':
-                            posts_list.append(post)
-            else:
-                posts = models.Post.objects.filter(Q(author_id=author) & Q(visibility='FRIENDS')).order_by('-published')
-                serializer = serializers.PostSerializer(posts, many=True)
-                posts_list += serializer.data
 
-        util.log('PostViewSet/retrive_friends_follwing', f"Posts: \n{json.dumps(posts_list, indent=4)}")
+        # authors that the user is following, and the ones among them that follow the user back (friends)
+        graph = follower_graph.graph()
+        following = graph.following_of(author_id)
+        friends = graph.friends_of(author_id)
+
+        # posts from local authors are one query, sorted and paginated by the database.
+        # Github activity is not shown in the feed
+        posts = models.Post.objects.filter(
+            (Q(author__in=following) & Q(visibility='PUBLIC') & ~Q(title__contains='Github Activity:')) |
+            (Q(author__in=friends) & Q(visibility='FRIENDS')),
+            author__is_remote=False,
+        ).with_comment_count().order_by('-published')
+
+        paginator = self.pagination_class()
+        remote_authors = list(User.objects.filter(pk__in=following, is_remote=True))
+        if not remote_authors:
+            pagination_posts = paginator.paginate_queryset(posts, request)
+            serializer = serializers.PostSerializer(pagination_posts, many=True)
+            return Response({"type": "posts", "items": serializer.data, **paginator.cursor_links()}, status=status.HTTP_200_OK)
+
+        # Remote authors' posts have to be merged with ours in python.
+        # We only need the local posts up to the end of the requested page for that.
+        try:
+            page_number = max(int(request.query_params.get(paginator.page_query_param, 1)), 1)
+        except ValueError:
+            page_number = 1
+        limit = page_number * paginator.get_page_size(request)
+        posts_list = list(serializers.PostSerializer(posts[:limit], many=True).data)
+
+        # get the posts from the remote authors remotely, all at once
+        urls = {}
+        for user in remote_authors:
+            url = f"{user.url.rstrip('/')}/posts"
+            if 'linkup' or 'lost' in url:
+                url += '/'
+            urls[url] = user
+        for url, response in remote_node.util.get_many(list(urls), cache=True).items():
+            if response is None or response.status_code != 200:
+                util.log('PostViewSet/retrive_friends_follwing', "Could not get posts from %s", url)
+                continue
+            is_friend = urls[url].id in friends
+            for post in response.json()['items']:
+                if post['visibility'] == 'PUBLIC' and not 'Github Activity:' in post['title']:
+                    posts_list.append(post)
+                elif post['visibility'] == 'FRIENDS' and is_friend:
+                    posts_list.append(post)
+
         # paginate the posts
         posts_list = sorted(posts_list, key=lambda x: x['published'], reverse=True)
-        paginator = self.pagination_class()
         pagination_posts = paginator.paginate_queryset(posts_list, request)
         return Response({"type": "posts", "items": pagination_posts}, status=status.HTTP_200_OK)
 
@@ -539,16 +496,17 @@ class CommentViewSet(viewsets.ModelViewSet):
             page = self.paginate_queryset(comments)
             serializer = serializers.CommentSerializer(page, many=True)
             comment_list["items"] = serializer.data
+            comment_list.update(self.paginator.cursor_links())
 
             try:
                 if request.user.is_authenticated and request.user.displayName == 'attack-and-lost':
                     # make "items" key "comments"
-                    util.log('CommentViewSet/list', f"Changing 'items' key to 'comments' for team lost")
+                    util.log('CommentViewSet/list', "Changing 'items' key to 'comments' for team lost")
                     comment_list["comments"] = comment_list.pop("items")
                     print(json.dumps(comment_list, indent=4))
                     return Response(comment_list, status=status.HTTP_200_OK)
             except Exception as e:
-                util.log('CommentViewSet/list', f"Error changing 'items' key to 'comments' for team lost: {e}. Returning normal response")
+                util.log('CommentViewSet/list', "Error changing 'items' key to 'comments' for team lost: %s. Returning normal response", e)
 
             return Response(comment_list, status=status.HTTP_200_OK)
 
@@ -558,25 +516,14 @@ class CommentViewSet(viewsets.ModelViewSet):
         url = request.build_absolute_uri().split('api/')[1].rstrip('/')
         url = removeQueryParamAll(url)
 
-        for node in self.nodes:
-            if node.displayName == 'local':
-                continue
-            try:
-                request_url = remote_node.util.transform_url_for_node(
-                    f"{node.url.rstrip('/')}/{url}",
-                    node
-                )
-                auth_token = base64.b64encode(f"{node.displayName}:{node.password}".encode('ascii')).decode('ascii')
-                headers = {
-                    'Authorization': f'Basic {auth_token}',
-                    'Content-Type': 'application/json'
-                }
-                response = requests.get(request_url, headers=headers)
-                util.log('CommentViewSet/list', f"{node.nodeName} returned status code: {response.status_code}")
-                if response.status_code == 200:
-                    return Response(response.json())
-            except requests.RequestException as e:
-                util.log('CommentViewSet/list', f"Error connecting to {node.nodeName}: {e}")
+        requests_by_node = [
+            (node, remote_node.util.transform_url_for_node(f"{node.url.rstrip('/')}/{url}", node))
+            for node in self.nodes
+            if node.displayName != 'local'
+        ]
+        response = remote_node.util.get_first(requests_by_node)
+        if response is not None:
+            return Response(response.json())
         return Response(comment_list, status=status.HTTP_200_OK)
     
     def retrieve(self, request, author_id=None, post_id=None, pk=None):
@@ -589,10 +536,10 @@ class CommentViewSet(viewsets.ModelViewSet):
             comment = models.Comment.objects.get(pk=pk)
 
             if comment.post.id != post_id:
-                util.log('CommentViewSet/retrieve', f"Post {post_id} not found when retrieving comment")
+                util.log('CommentViewSet/retrieve', "Post %s not found when retrieving comment", post_id)
                 return Response({"error": f"Post {post_id} not found when retrieving comment"}, status=status.HTTP_404_NOT_FOUND)
             if comment.post.author.id != author_id:
-                util.log('CommentViewSet/retrieve', f"Author {author_id} is not the author of post {post_id}")
+                util.log('CommentViewSet/retrieve', "Author %s is not the author of post %s", author_id, post_id)
                 return Response({"error": f"Author {author_id} is not the author of post {post_id}"}, status=status.HTTP_404_NOT_FOUND)
 
             serializer = serializers.CommentSerializer(comment)
@@ -607,25 +554,14 @@ class CommentViewSet(viewsets.ModelViewSet):
         url = request.build_absolute_uri().split('api/')[1].rstrip('/')
         url = removeQueryParamAll(url)
 
-        for node in self.nodes:
-            if node.displayName == 'local':
-                continue
-            try:
-                request_url = remote_node.util.transform_url_for_node(
-                    f"{node.url.rstrip('/')}/{url}",
-                    node
-                )
-                auth_token = base64.b64encode(f"{node.displayName}:{node.password}".encode('ascii')).decode('ascii')
-                headers = {
-                    'Authorization': f'BASIC {auth_token}',
-                    'Content-Type': 'application/json'
-                }
-                response = requests.get(request_url, headers=headers)
-                util.log('CommentViewSet/retrieve', f"{node.nodeName} returned status code: {response.status_code}")
-                if response.status_code == 200:
-                    return Response(response.json())
-            except requests.RequestException as e:
-                util.log('CommentViewSet/retrieve', f"Error connecting to {node.nodeName}: {e}")
+        requests_by_node = [
+            (node, remote_node.util.transform_url_for_node(f"{node.url.rstrip('/')}/{url}", node))
+            for node in self.nodes
+            if node.displayName != 'local'
+        ]
+        response = remote_node.util.get_first(requests_by_node)
+        if response is not None:
+            return Response(response.json())
         return Response({"error": "Comment not found"}, status=status.HTTP_404_NOT_FOUND)
 
     def get_queryset(self):
@@ -650,11 +586,11 @@ class CommentViewSet(viewsets.ModelViewSet):
 
         post_id = self.kwargs.get('post_id')
         post = None
-        util.log('CommentViewSet/create', f'Post ID to comment on: {post_id}')
+        util.log('CommentViewSet/create', 'Post ID to comment on: %s', post_id)
         try:
             post = models.Post.objects.get(pk=post_id)
         except models.Post.DoesNotExist:
-            util.log('CommentViewSet/create', f"Post {post_id} not found locally")
+            util.log('CommentViewSet/create', "Post %s not found locally", post_id)
         
         # check for post on remote nodes if it exists create a comment on it
         if not post:
@@ -671,9 +607,7 @@ class CommentViewSet(viewsets.ModelViewSet):
             #check if actor is following the object and vice versa
             try:
                 user = User.objects.get(url=request.user.url)
-                if not Follower.objects.filter(actor=post.author, object=user).exists():
-                    return Response({"error": "You are not authorized to comment on this post"}, status=status.HTTP_401_UNAUTHORIZED)
-                if not Follower.objects.filter(actor=user, object=post.author).exists():
+                if not follower_graph.is_friend(post.author, user):
                     return Response({"error": "You are not authorized to comment on this post"}, status=status.HTTP_401_UNAUTHORIZED)
             except User.DoesNotExist:
                 url = f'{request.user.url.rstrip("/")}/followers/{post.author.url.rstrip("/")}'
@@ -685,11 +619,11 @@ class CommentViewSet(viewsets.ModelViewSet):
         serializer.is_valid(raise_exception=True)
         comment = serializer.save(post=post, author=request.user)
         headers = self.get_success_headers(serializer.data)
-        util.log('CommentViewSet/create', f"Comment successfully created: {comment}")
+        util.log('CommentViewSet/create', "Comment successfully created: %s", comment)
 
         # send notification to the author of the post
         try:
-            util.log('CommentViewSet/create', f'Sending notification to author of post')
+            util.log('CommentViewSet/create', 'Sending notification to author of post')
             inbox_comment = InboxComment.objects.create(
                 commentUrl= comment.url,
                 author=request.user.url,
@@ -702,7 +636,7 @@ class CommentViewSet(viewsets.ModelViewSet):
             )
             inbox_item.save()
         except Exception as e:
-            util.log('CommentViewSet/create', f'Error sending a new-comment notif to author inbox: {e}')
+            util.log('CommentViewSet/create', 'Error sending a new-comment notif to author inbox: %s', e)
 
         return Response(serializer.data, status=status.HTTP_201_CREATED, headers=headers)
 
@@ -724,13 +658,8 @@ class CommentViewSet(viewsets.ModelViewSet):
                     request_url.split('/comments')[0],
                     node
                 )
-                util.log('CommentViewSet/create_remote_comment', f"Request URL: {request_url}")
-                auth_token = base64.b64encode(f"{node.displayName}:{node.password}".encode('ascii')).decode('ascii')
-                headers = {
-                    'Authorization': f'Basic {auth_token}',
-                    'Content-Type': 'application/json'
-                }
-                response = requests.get(request_url, headers=headers)
+                util.log('CommentViewSet/create_remote_comment', "Request URL: %s", request_url)
+                response = remote_node.util.node_get(node, request_url)
                 if response.status_code == 200:
                     author = UserSerializer(request.user).data
                     if node.displayName == 'teamattack@email.com':
@@ -762,14 +691,14 @@ class CommentViewSet(viewsets.ModelViewSet):
                     url = f"{node.url.rstrip('/')}/authors/{response.json()['author']['id'].split('/')[-1]}/inbox"
                     if 'lost' in url:
                         url += '/'
-                    util.log('CommentViewSet/create_remote_comment', f"Sending comment to {url}")
-                    util.log('CommentViewSet/create_remote_comment', f"Data: {json.dumps(inbox_data, indent=4)}")
-                    response = requests.post(url, headers=headers, json=inbox_data)
-                    util.log('CommentViewSet/create_remote_comment', f"Response: {response.status_code}")
-                    util.log('CommentViewSet/create_remote_comment', f"Response: {response.json()}")
+                    util.log('CommentViewSet/create_remote_comment', "Sending comment to %s", url)
+                    util.log('CommentViewSet/create_remote_comment', lambda: f"Data: {json.dumps(inbox_data, indent=4)}")
+                    response = remote_node.util.node_post(node, url, json=inbox_data)
+                    util.log('CommentViewSet/create_remote_comment', "Response: %s", response.status_code)
+                    util.log('CommentViewSet/create_remote_comment', lambda: f"Response: {response.json()}")
                     return Response(response)
             except requests.RequestException as e:
-                util.log('CommentViewSet/create_remote_comment', f"Error connecting to {node.nodeName}: {e}")
+                util.log('CommentViewSet/create_remote_comment', "Error connecting to %s: %s", node.nodeName, e)
         return Response({"error": "Post not found"}, status=status.HTTP_404_NOT_FOUND)
 
 
@@ -792,19 +721,19 @@ class LikeViewSet(viewsets.ModelViewSet):
         # Get the post or comment object locally
         try:
             author = User.objects.get(pk=author_id)
-            util.log('LikeViewSet/list', f"Author {author.displayName} ({author_id}) found locally.")
+            util.log('LikeViewSet/list', "Author %s (%s) found locally.", author.displayName, author_id)
             if comment_id:
                 object = Comment.objects.get(pk=comment_id)
-                util.log('LikeViewSet/list', f"Comment {comment_id} found locally.")
+                util.log('LikeViewSet/list', "Comment %s found locally.", comment_id)
             else:
                 object = Post.objects.get(pk=post_id)
-                util.log('LikeViewSet/list', f"Post {post_id} found locally.")
+                util.log('LikeViewSet/list', "Post %s found locally.", post_id)
         except User.DoesNotExist:
-            util.log('LikeViewSet/list', f"Author {author_id} not found locally.")
+            util.log('LikeViewSet/list', "Author %s not found locally.", author_id)
         except Post.DoesNotExist:
-            util.log('LikeViewSet/list', f"Post {post_id} not found locally.")
+            util.log('LikeViewSet/list', "Post %s not found locally.", post_id)
         except Comment.DoesNotExist:
-            util.log('LikeViewSet/list', f"Comment {comment_id} not found locally.")
+            util.log('LikeViewSet/list', "Comment %s not found locally.", comment_id)
         else:
 
             # Verify the object is the author's
@@ -817,23 +746,26 @@ class LikeViewSet(viewsets.ModelViewSet):
                     assert object.author.id == author_id
             except AssertionError:
                 if comment_id:
-                    util.log('LikeViewSet/list', f"Comment {comment_id} not found on Post {post_id} by Author {author_id}")
-                    util.log('LikeViewSet/list', f"Post author: {object.post.author.id}, input author: {author_id}")
-                    util.log('LikeViewSet/list', f"Post ID: {object.post.id}, input post ID: {post_id}")
+                    util.log('LikeViewSet/list', "Comment %s not found on Post %s by Author %s", comment_id, post_id, author_id)
+                    util.log('LikeViewSet/list', "Post author: %s, input author: %s", object.post.author.id, author_id)
+                    util.log('LikeViewSet/list', "Post ID: %s, input post ID: %s", object.post.id, post_id)
                     return Response({"error": f"Object not found: Comment {comment_id} not found on Post {post_id} by Author {author_id}"}, 
                             status=status.HTTP_404_NOT_FOUND)
                 else:
-                    util.log('LikeViewSet/list', f"Post {post_id} not found by Author {author_id}")
-                    util.log('LikeViewSet/list', f"Post author: {object.author.id}, input author: {author_id}")
+                    util.log('LikeViewSet/list', "Post %s not found by Author %s", post_id, author_id)
+                    util.log('LikeViewSet/list', "Post author: %s, input author: %s", object.author.id, author_id)
                     return Response({"error": f"Object not found: Post {post_id} not found by Author {author_id}"},
                             status=status.HTTP_404_NOT_FOUND)
 
             # Get the likes
             likes = Like.objects.filter(object=object.url.rstrip('/')).order_by('-published')
-            util.log('LikeViewSet/list', f"Found {likes.count()} likes on {object.url} by {author_id}.")
+            # likes have always been returned all at once, so they're only paginated if a cursor is asked for
+            paginator = CustomPagination()
+            if paginator.cursor_requested(request):
+                likes = paginator.paginate_queryset(likes, request)
             serializer = serializers.LikeSerializer(likes, many=True)
-            util.log('LikeViewSet/list', f"Serialized likes: {serializer.data}")
-            return Response({"type": "likes", "items": serializer.data}, status=status.HTTP_200_OK)
+            util.log('LikeViewSet/list', lambda: f"Serialized likes: {serializer.data}")
+            return Response({"type": "likes", "items": serializer.data, **paginator.cursor_links()}, status=status.HTTP_200_OK)
 
         if 'all' not in request.query_params:
             return Response({"error": "Likes not found"}, status=status.HTTP_404_NOT_FOUND)
@@ -842,27 +774,62 @@ class LikeViewSet(viewsets.ModelViewSet):
         url = request.build_absolute_uri().split('api/')[1]
         url = removeQueryParamAll(url)
 
+        requests_by_node = []
         for node in self.nodes:
             if node.displayName == 'local':
                 continue
 
-            try:
-                request_url = remote_node.util.transform_url_for_node(
-                    f"{node.url.rstrip('/')}/{url}",
-                    node
-                )
-                auth_token = base64.b64encode(f'{node.displayName}:{node.password}'.encode('ascii')).decode('ascii')
-                headers = {
-                    'Authorization': f'Basic {auth_token}',
-                    'Content-Type': 'application/json'
-                }
-                util.log('LikeViewSet/list', f"Requesting likes from {node.nodeName}: {request_url}")
-                response = requests.get(request_url, headers=headers)
-                if response.status_code == 200:
-                    return Response(response.json())
-                else:
-                    util.log('LikeViewSet/list', f"{node.nodeName} returned status code: {response.status_code}")
-            except requests.RequestException as e:
-                util.log('LikeViewSet/list', f"Error requesting likes from {node.nodeName}: {e}")
+            request_url = remote_node.util.transform_url_for_node(
+                f"{node.url.rstrip('/')}/{url}",
+                node
+            )
+            util.log('LikeViewSet/list', "Requesting likes from %s: %s", node.nodeName, request_url)
+            requests_by_node.append((node, request_url))
+
+        response = remote_node.util.get_first(requests_by_node)
+        if response is not None:
+            return Response(response.json())
 
         return Response({"error": "Likes not found for requested object"}, status=status.HTTP_404_NOT_FOUND)
+
+
+class SearchViewSet(viewsets.GenericViewSet):
+    """
+    API endpoint to search posts and comments
+    """
+    pagination_class = CustomPagination
+
+    def list(self, request):
+        """
+        METHOD: GET
+        Returns the posts or comments matching a query that the user may see, best match first
+        URL: ://service/search?q={QUERY}&type={posts|comments}
+        """
+        query = request.query_params.get('q', '').strip()
+        kind = request.query_params.get('type', post_search.POSTS)
+        if not query:
+            return Response({"error": "A search query (q) is required"}, status=status.HTTP_400_BAD_REQUEST)
+        if kind not in [post_search.POSTS, post_search.COMMENTS]:
+            return Response({"error": f"Can only search {post_search.POSTS} or {post_search.COMMENTS}"}, status=status.HTTP_400_BAD_REQUEST)
+
+        util.log('SearchViewSet/list', 'User %s searching %s for %s', request.user, kind, query)
+        ids = post_search.search(kind, query, request.user)
+        page = self.paginate_queryset(ids)
+
+        # load the page of results, keeping them in rank order
+        if kind == post_search.POSTS:
+            found = models.Post.objects.with_comment_count().in_bulk(page)
+            items = serializers.PostSerializer([found[id] for id in page if id in found], many=True).data
+        else:
+            found = models.Comment.objects.select_related('author', 'post__author').in_bulk(page)
+            items = serializers.CommentSerializer([found[id] for id in page if id in found], many=True).data
+
+        return Response({
+            "type": kind,
+            "query": query,
+            # every visible match, even past the SEARCH_MAX_RESULTS that can be paged through
+            "count": post_search.count(kind, query, request.user),
+            "next": self.paginator.get_next_link(),
+            "previous": self.paginator.get_previous_link(),
+            "items": items,
+        }, status=status.HTTP_200_OK)
@@ -1,17 +1,22 @@
 from django.contrib import admin
 
 # Register your models here.
-from .models import RemoteNode
+from django.utils import timezone
+from .models import RemoteNode, OutboundDelivery
+from . import routing
 
 @admin.action(description='Enable remote node(s)')
 def approve_users(modeladmin, request, queryset):
     # Only set users as active if they are not a node
     queryset.update(disabled=False)
+    # update() doesn't send post_save, so drop the cached routes ourselves
+    routing.invalidate()
 
 @admin.action(description='Disable remote node(s)')
 def disable_users(modeladmin, request, queryset):
     # Only set users as active if they are not a node
     queryset.update(disabled=True)
+    routing.invalidate()
 
 class RemoteNodeAdmin(admin.ModelAdmin):
     list_display = [
@@ -19,12 +24,40 @@ class RemoteNodeAdmin(admin.ModelAdmin):
         'displayName',
         'url',
         'password',
-        'disabled'
+        'disabled',
+        'batch_inbox',
+        'health_state',
+        'error_rate',
+        'latency_ms',
+        'health_checked',
     ]
+    readonly_fields = ['health_state', 'error_rate', 'latency_ms', 'health_checked']
     actions = [
         approve_users,  # custom action to approve users
         disable_users    # custom action to set user as a remote node
     ]
 
 
-admin.site.register(RemoteNode, RemoteNodeAdmin)
\ No newline at end of file
+admin.site.register(RemoteNode, RemoteNodeAdmin)
+
+
+@admin.action(description='Retry delivery(s)')
+def retry_deliveries(modeladmin, request, queryset):
+    queryset.update(status=OutboundDelivery.PENDING, attempts=0, next_attempt_at=timezone.now())
+
+class OutboundDeliveryAdmin(admin.ModelAdmin):
+    list_display = [
+        'url',
+        'status',
+        'attempts',
+        'next_attempt_at',
+        'last_error',
+        'created',
+    ]
+    list_filter = ['status']
+    actions = [
+        retry_deliveries  # send dead/pending deliveries again right away
+    ]
+
+
+admin.site.register(OutboundDelivery, OutboundDeliveryAdmin)
@@ -4,3 +4,10 @@ from django.apps import AppConfig
 class RemoteNodeConfig(AppConfig):
     default_auto_field = "django.db.models.BigAutoField"
     name = "remote_node"
+
+    def ready(self):
+        # connect the signal receivers that invalidate cached credentials and routes
+        from django.core.signals import request_started
+        from . import authentication, delivery, routing
+        # send what was left queued before a restart, once the web process is serving requests
+        request_started.connect(delivery.start_on_first_request, dispatch_uid=delivery.START_ON_FIRST_REQUEST)
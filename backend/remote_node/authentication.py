@@ -0,0 +1,120 @@
+'''
+Cached verification of Basic auth credentials
+
+Checking a password runs Django's password hasher (PBKDF2), which is slow on purpose.
+Remote nodes send the same credentials on every request, so once a token has been verified
+we remember it for a while instead of hashing the password again.
+'''
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+from django.conf import settings
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
+from rest_framework.authentication import BasicAuthentication, get_authorization_header
+from restapi.models import User
+
+
+class CredentialCache:
+    '''
+    Bounded, TTL-based cache of verified Basic auth tokens.
+
+    - Keys are sha256 hashes of the token, so plain passwords are never stored.
+    - Each entry remembers the user's password hash and is_active flag. If either changed since
+      the token was verified (even through a queryset.update(), which skips signals), the entry is dropped.
+    - The least recently used entry is evicted once the cache is full.
+    '''
+    def __init__(self, max_size: int, ttl: float):
+        self.max_size = max_size
+        self.ttl = ttl
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _key(token: str) -> str:
+        return hashlib.sha256(token.encode('utf-8')).hexdigest()
+
+    def get(self, token: str) -> User:
+        '''
+        Return the user the token was verified for, or None if the token is not cached (or stale)
+        '''
+        key = self._key(token)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            user_pk, password_hash, expires_at = entry
+            if expires_at < time.monotonic():
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+
+        try:
+            user = User.objects.get(pk=user_pk)
+        except User.DoesNotExist:
+            user = None
+
+        if user is None or user.password != password_hash or not user.is_active:
+            self.invalidate_user(user_pk)
+            return None
+        return user
+
+    def set(self, token: str, user: User) -> None:
+        '''
+        Remember that the token was verified for this user
+        '''
+        key = self._key(token)
+        with self._lock:
+            self._entries[key] = (user.pk, user.password, time.monotonic() + self.ttl)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    def invalidate_user(self, user_pk) -> None:
+        '''
+        Drop every cached token of a user
+        '''
+        with self._lock:
+            for key in [key for key, entry in self._entries.items() if entry[0] == user_pk]:
+                del self._entries[key]
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+
+
+credential_cache = CredentialCache(
+    max_size=settings.REMOTE_AUTH_CACHE_SIZE,
+    ttl=settings.REMOTE_AUTH_CACHE_TTL,
+)
+
+
+@receiver(post_save, sender=User)
+@receiver(post_delete, sender=User)
+def invalidate_cached_credentials(sender, instance, **kwargs):
+    '''
+    A saved user may have a new password or is_active flag, so forget their cached tokens
+    '''
+    credential_cache.invalidate_user(instance.pk)
+
+
+class CachedBasicAuthentication(BasicAuthentication):
+    '''
+    DRF BasicAuthentication that shares the credential cache with RemoteAuthMiddleware,
+    so a request from a remote node only has its password hashed once.
+    '''
+    def authenticate(self, request):
+        auth = get_authorization_header(request).split()
+        if len(auth) != 2 or auth[0].lower() != b'basic':
+            return super().authenticate(request)
+
+        token = auth[1].decode('latin-1')
+        user = credential_cache.get(token)
+        if user is not None:
+            return (user, None)
+
+        result = super().authenticate(request)
+        if result is not None:
+            credential_cache.set(token, result[0])
+        return result
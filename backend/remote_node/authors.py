@@ -0,0 +1,185 @@
+'''
+Shared cache of remote authors
+
+Likes, comments, follows and inboxes only keep the URL of their (possibly remote) author, so
+serializing them means fetching the author's JSON from its node. Authors rarely change, so:
+
+- the JSON is kept in an in-process LRU cache (and optionally in a shared Django cache,
+  see REMOTE_AUTHOR_CACHE_BACKEND) for REMOTE_AUTHOR_CACHE_TTL seconds,
+- authors that don't exist (404) are remembered for REMOTE_AUTHOR_CACHE_NEGATIVE_TTL seconds,
+- once an entry expires it is still served for REMOTE_AUTHOR_CACHE_STALE_TTL seconds while it is
+  refreshed in the background, so requests don't wait on the remote node,
+- authors that aren't cached at all are fetched in parallel.
+'''
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+import requests
+from django.conf import settings
+from django.core.cache import caches
+import remote_node.util
+import util.main
+
+
+class AuthorCache:
+    '''
+    Author URL -> author JSON (None for authors that don't exist).
+
+    Each entry is (data, fresh_until, stale_until), in wall clock time so entries can be shared
+    between processes through the Django cache backend.
+    '''
+    def __init__(self, max_size: int, ttl: float, stale_ttl: float, negative_ttl: float, backend: str = None):
+        self.max_size = max_size
+        self.ttl = ttl
+        self.stale_ttl = stale_ttl
+        self.negative_ttl = negative_ttl
+        self.backend = backend
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _key(url: str) -> str:
+        return 'remote_author:' + hashlib.sha256(url.encode('utf-8')).hexdigest()
+
+    def lookup(self, url: str) -> tuple:
+        '''
+        Returns (found, data, stale). `found` is False if the author isn't cached (or is too old to serve),
+        `data` is None for authors that are known not to exist.
+        '''
+        now = time.time()
+        with self._lock:
+            entry = self._entries.get(url)
+            if entry is not None:
+                self._entries.move_to_end(url)
+
+        if entry is None and self.backend:
+            entry = caches[self.backend].get(self._key(url))
+            if entry is not None:
+                self._store(url, entry)
+
+        if entry is None:
+            return False, None, False
+        data, fresh_until, stale_until = entry
+        if now >= stale_until:
+            self.invalidate(url)
+            return False, None, False
+        return True, data, now >= fresh_until
+
+    def set(self, url: str, data: dict) -> None:
+        '''
+        Cache an author's JSON, or None if the author doesn't exist
+        '''
+        now = time.time()
+        ttl = self.ttl if data is not None else self.negative_ttl
+        entry = (data, now + ttl, now + ttl + self.stale_ttl)
+        self._store(url, entry)
+        if self.backend:
+            caches[self.backend].set(self._key(url), entry, timeout=ttl + self.stale_ttl)
+
+    def _store(self, url: str, entry: tuple) -> None:
+        with self._lock:
+            self._entries[url] = entry
+            self._entries.move_to_end(url)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    def invalidate(self, url: str) -> None:
+        with self._lock:
+            self._entries.pop(url, None)
+        if self.backend:
+            caches[self.backend].delete(self._key(url))
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+
+
+author_cache = AuthorCache(
+    max_size=settings.REMOTE_AUTHOR_CACHE_SIZE,
+    ttl=settings.REMOTE_AUTHOR_CACHE_TTL,
+    stale_ttl=settings.REMOTE_AUTHOR_CACHE_STALE_TTL,
+    negative_ttl=settings.REMOTE_AUTHOR_CACHE_NEGATIVE_TTL,
+    backend=settings.REMOTE_AUTHOR_CACHE_BACKEND,
+)
+
+
+def _store_response(url: str, response: requests.Response) -> dict:
+    '''
+    Cache what a node answered for an author, and return the author's JSON (None if there's none)
+    '''
+    if response is None:
+        return None
+    if response.status_code == 404:
+        author_cache.set(url, None)
+        return None
+    if response.status_code != 200:
+        util.main.log('authors/_store_response', 'Could not get author %s: status code %s', url, response.status_code)
+        return None
+    try:
+        data = response.json()
+    except ValueError:
+        util.main.log('authors/_store_response', 'Author %s is not JSON', url)
+        return None
+    author_cache.set(url, data)
+    return data
+
+
+# background refreshes of stale authors
+_refresh_pool = ThreadPoolExecutor(max_workers=4, thread_name_prefix='author_refresh')
+_refreshing = set()
+_refreshing_lock = threading.Lock()
+
+def _refresh(node, node_url: str, url: str) -> None:
+    try:
+        _store_response(url, remote_node.util.node_get(node, node_url))
+    except requests.RequestException as e:
+        util.main.log('authors/_refresh', 'Error refreshing author %s: %s', url, e)
+    finally:
+        with _refreshing_lock:
+            _refreshing.discard(url)
+
+def refresh_in_background(url: str) -> None:
+    '''
+    Refetch an author without waiting for it (only once at a time per author)
+    '''
+    with _refreshing_lock:
+        if url in _refreshing:
+            return
+        _refreshing.add(url)
+    # resolve on this thread, so the refresh doesn't need a database connection
+    node, node_url = remote_node.util.resolve(url)
+    if node is None:
+        with _refreshing_lock:
+            _refreshing.discard(url)
+        return
+    _refresh_pool.submit(_refresh, node, node_url, url)
+
+
+def get_remote_authors(urls) -> dict:
+    '''
+    Get the JSON of several remote authors, from the cache or (all at once) from their nodes.
+
+    Returns a dict of author url -> JSON. Authors that couldn't be fetched map to None.
+    '''
+    authors = {}
+    missing = []
+    for url in set(urls):
+        found, data, stale = author_cache.lookup(url)
+        if not found:
+            missing.append(url)
+            continue
+        authors[url] = data
+        if stale:
+            refresh_in_background(url)
+
+    for url, response in remote_node.util.get_many(missing).items():
+        authors[url] = _store_response(url, response)
+    return authors
+
+def get_author(url: str) -> dict:
+    '''
+    Get the JSON of a single author (None if it couldn't be fetched)
+    '''
+    return get_remote_authors([url])[url]
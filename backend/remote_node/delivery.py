@@ -0,0 +1,284 @@
+'''
+Persistent outbound delivery queue
+
+Inbox notifications we have to send to other nodes (e.g. telling every follower about a new post)
+are stored as OutboundDelivery rows instead of being POSTed during the request. They are sent by:
+
+- a dispatcher thread in the web process, woken up after the enqueuing transaction commits and on the
+  first request after a restart (can be turned off with OUTBOUND_DELIVERY_IN_PROCESS), and/or
+- the `python manage.py deliver_outbound` worker command.
+
+Both claim rows from the same table, so any number of them can run at once. Failed deliveries are
+retried with exponential backoff and are marked DEAD after OUTBOUND_DELIVERY_MAX_ATTEMPTS tries.
+'''
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from datetime import timedelta
+import requests
+from django.conf import settings
+from django.core.signals import request_started
+from django.db import connection, transaction
+from django.db.models import F, Min
+from django.utils import timezone
+from remote_node.models import OutboundDelivery
+import remote_node.util
+import remote_node.health
+import util.main
+
+# worker threads doing the actual HTTP requests
+_pool = ThreadPoolExecutor(max_workers=settings.OUTBOUND_DELIVERY_WORKERS, thread_name_prefix='outbound')
+
+def enqueue(url: str, payload: dict) -> OutboundDelivery:
+    '''
+    Queue a JSON payload to be POSTed to an inbox URL
+    '''
+    return enqueue_many([(url, payload)])[0]
+
+def enqueue_many(deliveries: list) -> list:
+    '''
+    Queue several (url, payload) tuples in a single insert.
+    The dispatcher is woken up once the current transaction commits.
+    '''
+    created = OutboundDelivery.objects.bulk_create([
+        OutboundDelivery(url=url, payload=payload) for url, payload in deliveries
+    ])
+    if created:
+        transaction.on_commit(kick)
+    return created
+
+def backoff(attempts: int) -> timedelta:
+    '''
+    How long to wait before retrying a delivery that has failed `attempts` times
+    '''
+    seconds = settings.OUTBOUND_DELIVERY_BACKOFF_BASE * 2 ** max(attempts - 1, 0)
+    return timedelta(seconds=min(seconds, settings.OUTBOUND_DELIVERY_BACKOFF_MAX))
+
+def _due(now):
+    return OutboundDelivery.objects.filter(
+        status__in=[OutboundDelivery.PENDING, OutboundDelivery.SENDING],
+        next_attempt_at__lte=now,
+    )
+
+def _lease(now) -> dict:
+    '''
+    The fields of a claimed delivery
+    '''
+    return {
+        'status': OutboundDelivery.SENDING,
+        'attempts': F('attempts') + 1,
+        'next_attempt_at': now + timedelta(seconds=settings.OUTBOUND_DELIVERY_LEASE),
+    }
+
+def _claim_rows(ids: list, now) -> list:
+    '''
+    Claim deliveries one at a time, for databases without SKIP LOCKED (e.g. SQLite). Another worker may have
+    read the same ids, but each update only matches while the delivery is still due, so only one worker
+    changes it. Returns the ids this worker claimed.
+    '''
+    return [id for id in ids if _due(now).filter(pk=id).update(**_lease(now))]
+
+def claim_due(limit: int) -> list:
+    '''
+    Claim up to `limit` deliveries that are due, and mark them as SENDING.
+
+    A claimed delivery is leased for OUTBOUND_DELIVERY_LEASE seconds: if the worker dies
+    before recording the result, the delivery becomes due again once the lease expires.
+    '''
+    now = timezone.now()
+    due = _due(now).order_by('next_attempt_at')
+    if connection.features.has_select_for_update_skip_locked:
+        with transaction.atomic():
+            # let several workers claim batches at the same time without waiting on each other
+            ids = list(due.select_for_update(skip_locked=True).values_list('id', flat=True)[:limit])
+            OutboundDelivery.objects.filter(id__in=ids).update(**_lease(now))
+    else:
+        ids = _claim_rows(list(due.values_list('id', flat=True)[:limit]), now)
+    if not ids:
+        return []
+    return list(OutboundDelivery.objects.filter(id__in=ids))
+
+def _item_errors(response) -> list:
+    '''
+    The error of each item of a 207 (multi-status) inbox response, None for the items that were added
+    '''
+    try:
+        items = response.json()['items']
+        return [None if 200 <= item['status'] < 300 else f"{item['status']}: {item['body']}"[:500] for item in items]
+    except (ValueError, KeyError, TypeError) as e:
+        util.main.log('delivery/_item_errors', 'Could not read multi-status response: %s', e, level=logging.WARNING)
+        return None
+
+def _send(node, url: str, json: dict) -> tuple:
+    '''
+    POST a delivery (runs on a worker thread, so no database access here).
+    Returns (error, item errors): the error is None on success, and the item errors are the
+    error of each item (see _item_errors) if the node answered 207, otherwise None.
+    A 207 without a status for every item is an error, so the whole batch is retried.
+    '''
+    try:
+        response = remote_node.util.node_post(node, url, json=json)
+    except requests.RequestException as e:
+        return str(e), None
+    if response.status_code == 207:
+        item_errors = _item_errors(response)
+        items = json.get('items')
+        if item_errors is None or not isinstance(items, list) or len(item_errors) != len(items):
+            # we can't tell which items were added: retry them all
+            return f'207: unreadable multi-status response {response.text[:500]}', None
+        return None, item_errors
+    if 200 <= response.status_code < 300:
+        return None, None
+    return f'{response.status_code}: {response.text[:500]}', None
+
+def _leased(delivery: OutboundDelivery):
+    '''
+    The delivery, if this worker still holds its lease. If the lease ran out and another worker claimed the
+    delivery again, its attempts went up, and the result is left for that worker to record.
+    '''
+    return OutboundDelivery.objects.filter(pk=delivery.pk, status=OutboundDelivery.SENDING, attempts=delivery.attempts)
+
+def _record(delivery: OutboundDelivery, **fields) -> None:
+    if not _leased(delivery).update(**fields):
+        util.main.log('delivery/_record', 'Lost the lease on delivery %s, not recording its result', delivery.pk, level=logging.WARNING)
+
+def _record_success(delivery: OutboundDelivery) -> None:
+    _record(delivery, status=OutboundDelivery.DELIVERED, delivered_at=timezone.now(), last_error='')
+
+def _record_failure(delivery: OutboundDelivery, error: str, permanent: bool = False) -> None:
+    if permanent or delivery.attempts >= settings.OUTBOUND_DELIVERY_MAX_ATTEMPTS:
+        util.main.log('delivery/_record_failure', 'Giving up on delivery %s to %s after %s attempt(s): %s', delivery.pk, delivery.url, delivery.attempts, error, level=logging.WARNING)
+        _record(delivery, status=OutboundDelivery.DEAD, last_error=error)
+        return
+
+    retry_in = backoff(delivery.attempts)
+    util.main.log('delivery/_record_failure', 'Delivery %s to %s failed (%s). Retrying in %s', delivery.pk, delivery.url, error, retry_in)
+    _record(delivery, status=OutboundDelivery.PENDING, next_attempt_at=timezone.now() + retry_in, last_error=error)
+
+def _batches(deliveries: list) -> list:
+    '''
+    Split deliveries to the same inbox into groups of at most OUTBOUND_DELIVERY_MAX_BATCH_ITEMS items
+    '''
+    batches, batch, items = [], [], 0
+    for delivery in deliveries:
+        count = len(delivery.payload['items'])
+        if batch and items + count > settings.OUTBOUND_DELIVERY_MAX_BATCH_ITEMS:
+            batches.append(batch)
+            batch, items = [], 0
+        batch.append(delivery)
+        items += count
+    if batch:
+        batches.append(batch)
+    return batches
+
+def deliver_due(limit: int = None) -> int:
+    '''
+    Claim one batch of due deliveries and send them in parallel.
+    Deliveries to the same inbox on a node with batch_inbox set are sent as a single POST.
+    Returns how many deliveries were attempted.
+    '''
+    deliveries = claim_due(limit or settings.OUTBOUND_DELIVERY_BATCH_SIZE)
+
+    futures = {}
+    # (node, inbox url) -> deliveries that can be sent together
+    inboxes = {}
+    for delivery in deliveries:
+        # work out the node on this thread, so the worker threads don't need a database connection
+        node, url, json = remote_node.util.prepare_post(delivery.url, delivery.payload)
+        if node is None:
+            _record_failure(delivery, 'no remote node matches the url', permanent=True)
+            continue
+        if node.batch_inbox and isinstance(json.get('items'), list):
+            inboxes.setdefault((node.pk, url), (node, []))[1].append(delivery)
+            continue
+        futures[_pool.submit(_send, node, url, json)] = [delivery]
+
+    for (_, url), (node, grouped) in inboxes.items():
+        for batch in _batches(grouped):
+            json = dict(batch[0].payload, items=[item for delivery in batch for item in delivery.payload['items']])
+            if len(batch) > 1:
+                util.main.log('delivery/deliver_due', 'Sending %s deliveries to %s in one POST', len(batch), url)
+            futures[_pool.submit(_send, node, url, json)] = batch
+
+    for future in as_completed(futures):
+        error, item_errors = future.result()
+        # the items of a batch are in the order of its deliveries
+        offset = 0
+        for delivery in futures[future]:
+            items = delivery.payload.get('items')
+            count = len(items) if isinstance(items, list) else 0
+            failed = [item_error for item_error in (item_errors or [])[offset:offset + count] if item_error]
+            offset += count
+            if error is None and not failed:
+                _record_success(delivery)
+            else:
+                _record_failure(delivery, error or failed[0])
+    remote_node.health.flush()
+    return len(deliveries)
+
+def drain() -> int:
+    '''
+    Send batches until nothing is due. Returns how many deliveries were attempted.
+    '''
+    total = 0
+    while True:
+        attempted = deliver_due()
+        if not attempted:
+            return total
+        total += attempted
+
+def next_due_in() -> float:
+    '''
+    Seconds until the next queued delivery is due (0 if one is due now), or None if the queue is empty
+    '''
+    next_attempt_at = OutboundDelivery.objects.filter(
+        status__in=[OutboundDelivery.PENDING, OutboundDelivery.SENDING],
+    ).aggregate(next_attempt_at=Min('next_attempt_at'))['next_attempt_at']
+    if next_attempt_at is None:
+        return None
+    return max((next_attempt_at - timezone.now()).total_seconds(), 0)
+
+def start_on_first_request(**kwargs) -> None:
+    '''
+    Wake up the in-process dispatcher when the web process serves its first request, if anything is queued,
+    so retries and expired leases left over from before a restart are sent without waiting for a new delivery
+    (connected to request_started in RemoteNodeConfig.ready, so management commands don't start it)
+    '''
+    request_started.disconnect(dispatch_uid=START_ON_FIRST_REQUEST)
+    if settings.OUTBOUND_DELIVERY_IN_PROCESS and next_due_in() is not None:
+        util.main.log('delivery/start_on_first_request', 'Deliveries are queued, starting the dispatcher')
+        kick()
+
+# in-process dispatcher
+START_ON_FIRST_REQUEST = 'outbound-delivery-start'
+_wake = threading.Event()
+_dispatcher = None
+_dispatcher_lock = threading.Lock()
+
+def _dispatch() -> None:
+    timeout = None
+    while True:
+        _wake.wait(timeout=timeout)
+        _wake.clear()
+        try:
+            drain()
+            # sleep until the next retry is due, or until someone enqueues something
+            timeout = next_due_in()
+        except Exception as e:
+            util.main.log('delivery/_dispatch', 'Error delivering outbound queue: %s', e, level=logging.ERROR)
+            timeout = settings.OUTBOUND_DELIVERY_BACKOFF_BASE
+        finally:
+            connection.close()
+
+def kick() -> None:
+    '''
+    Wake up the in-process dispatcher (starting it the first time)
+    '''
+    global _dispatcher
+    if not settings.OUTBOUND_DELIVERY_IN_PROCESS:
+        return
+    with _dispatcher_lock:
+        if _dispatcher is None or not _dispatcher.is_alive():
+            _dispatcher = threading.Thread(target=_dispatch, name='outbound-dispatcher', daemon=True)
+            _dispatcher.start()
+    _wake.set()
@@ -0,0 +1,187 @@
+'''
+Local directory of the authors on remote nodes
+
+"GET /authors?all" used to download the first page of every node's author list on each request and
+paginate everything in memory. Instead, every node's author list is copied (page by page, all nodes
+in parallel) into is_remote User rows in the background, and "?all" is one paginated query.
+
+The directory is refreshed at most every REMOTE_DIRECTORY_INTERVAL seconds, by:
+
+- a thread in the web process, started when "?all" is requested and the directory is out of date
+  (can be turned off with REMOTE_DIRECTORY_IN_PROCESS), and/or
+- the `python manage.py refresh_directory` worker command.
+'''
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+import requests
+from django.conf import settings
+from django.db import connection, transaction
+from django.db.models import Q
+from django.utils import timezone
+from remote_node.models import RemoteNode
+from remote_node.routing import routing_table
+from remote_node import health
+from restapi.models import User
+import remote_node.util
+import util.main
+
+# fields copied from a remote author's JSON
+AUTHOR_FIELDS = ['displayName', 'github', 'url', 'host', 'profileImage']
+
+def authors():
+    '''
+    Every author to list for "?all": our own, then the remote ones seen recently
+    '''
+    cutoff = timezone.now() - timedelta(seconds=settings.REMOTE_DIRECTORY_STALE_AFTER)
+    return User.objects.filter(is_staff=False, is_node=False, is_active=True).filter(
+        Q(is_remote=False) | Q(last_seen__gte=cutoff)
+    ).order_by('-date_joined', '-id')
+
+def _page_url(node: RemoteNode, page: int) -> str:
+    url = remote_node.util.transform_url_for_node(f"{node.url.rstrip('/')}/authors", node)
+    if node.displayName == 'user':
+        # team HTTP needs a trailing slash
+        url += '/'
+    return f'{url}?page={page}&size={settings.REMOTE_DIRECTORY_PAGE_SIZE}'
+
+def fetch_node_authors(node: RemoteNode) -> list:
+    '''
+    Every author listed by a node, page by page (runs on a worker thread, so no database access here)
+    '''
+    items = {}
+    for page in range(1, settings.REMOTE_DIRECTORY_MAX_PAGES + 1):
+        try:
+            response = remote_node.util.node_get(node, _page_url(node, page))
+        except requests.RequestException as e:
+            util.main.log('directory/fetch_node_authors', 'Error connecting to %s: %s', node.nodeName, e)
+            break
+        if response.status_code != 200:
+            # past the last page, or the node is having trouble
+            util.main.log('directory/fetch_node_authors', '%s returned status code %s for page %s', node.nodeName, response.status_code, page)
+            break
+        try:
+            page_items = response.json().get('items') or []
+        except (ValueError, AttributeError):
+            util.main.log('directory/fetch_node_authors', '%s returned a page of authors that is not JSON', node.nodeName)
+            break
+
+        new = {item['id']: item for item in page_items if isinstance(item, dict) and item.get('id')}
+        if not new.keys() - items.keys():
+            # some nodes ignore the page parameter and keep sending the same authors
+            break
+        items.update(new)
+        if len(page_items) < settings.REMOTE_DIRECTORY_PAGE_SIZE:
+            break
+    return list(items.values())
+
+def _other_node(user: User, node: RemoteNode) -> bool:
+    '''
+    Whether a remote author's url or host belongs to another node than `node`
+    '''
+    for url in [user.url, user.host]:
+        owner, _ = remote_node.util.resolve(url or '')
+        if owner is not None and owner.pk != node.pk:
+            return True
+    return False
+
+def store(node: RemoteNode, items: list) -> int:
+    '''
+    Create or update is_remote User rows for the authors' JSON listed by a node. Returns how many were stored.
+
+    Authors whose id belongs to a local author or to another node's author, or whose displayName is taken
+    by another user (displayNames are unique), are skipped.
+    '''
+    now = timezone.now()
+    authors = {}
+    for item in items:
+        if item.get('type', 'author').lower() != 'author' or not item.get('displayName'):
+            continue
+        authors[util.main.id_from_url(item['id'])] = item
+
+    existing = User.objects.in_bulk(list(authors))
+    # names used by anyone but the remote authors we are about to update
+    taken = set(User.objects.filter(displayName__in=[item['displayName'] for item in authors.values()])
+                .exclude(pk__in=[pk for pk, user in existing.items() if user.is_remote])
+                .values_list('displayName', flat=True))
+
+    created, updated = [], []
+    for author_id, item in authors.items():
+        fields = {
+            'displayName': item['displayName'],
+            'github': item.get('github') or '',
+            'url': util.main.standardize_url(item.get('url') or item['id']),
+            'host': item.get('host') or '',
+            'profileImage': item.get('profileImage'),
+        }
+        user = existing.get(author_id)
+        if user is not None and not user.is_remote:
+            continue
+        if user is not None and _other_node(user, node):
+            # a node can only update its own authors
+            util.main.log('directory/store', 'Skipping remote author %s listed by %s: it belongs to another node', author_id, node.nodeName)
+            continue
+        if fields['displayName'] in taken:
+            util.main.log('directory/store', 'Skipping remote author %s: displayName %s is taken', author_id, fields['displayName'])
+            continue
+        taken.add(fields['displayName'])
+
+        if user is None:
+            user = User(id=author_id, is_remote=True, last_seen=now, **fields)
+            user.set_unusable_password()
+            created.append(user)
+        else:
+            for field, value in fields.items():
+                setattr(user, field, value)
+            user.last_seen = now
+            updated.append(user)
+
+    with transaction.atomic():
+        User.objects.bulk_create(created)
+        User.objects.bulk_update(updated, AUTHOR_FIELDS + ['last_seen'])
+    return len(created) + len(updated)
+
+def refresh() -> int:
+    '''
+    Copy every enabled node's author list into the database. Returns how many authors were stored.
+    '''
+    nodes = [node for node in routing_table().nodes if node.displayName != 'local']
+    if not nodes:
+        return 0
+    with ThreadPoolExecutor(max_workers=min(len(nodes), settings.REMOTE_NODE_FANOUT_WORKERS), thread_name_prefix='directory') as pool:
+        results = list(pool.map(fetch_node_authors, nodes))
+    health.flush()
+
+    stored = sum(store(node, items) for node, items in zip(nodes, results))
+    util.main.log('directory/refresh', 'Stored %s remote author(s) from %s node(s)', stored, len(nodes))
+    return stored
+
+# in-process refresh
+_refreshed_at = None
+_refresh_lock = threading.Lock()
+
+def is_stale() -> bool:
+    return _refreshed_at is None or time.monotonic() - _refreshed_at >= settings.REMOTE_DIRECTORY_INTERVAL
+
+def _refresh() -> None:
+    try:
+        refresh()
+    except Exception as e:
+        util.main.log('directory/_refresh', 'Error refreshing the remote author directory: %s', e)
+    finally:
+        connection.close()
+        _refresh_lock.release()
+
+def refresh_in_background() -> None:
+    '''
+    Start refreshing the directory if it's out of date (only once at a time)
+    '''
+    global _refreshed_at
+    if not settings.REMOTE_DIRECTORY_IN_PROCESS or not is_stale():
+        return
+    if not _refresh_lock.acquire(blocking=False):
+        return
+    # even if this refresh fails, don't try again before the interval is over
+    _refreshed_at = time.monotonic()
+    threading.Thread(target=_refresh, name='directory-refresh', daemon=True).start()
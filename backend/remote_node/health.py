@@ -0,0 +1,173 @@
+'''
+Health tracking and circuit breaking for remote nodes
+
+Every request to a remote node is recorded here (see remote_node.util.node_get/node_post):
+
+- the error rate over the last REMOTE_NODE_BREAKER_WINDOW seconds (connection errors, timeouts and 5xx),
+- an exponentially weighted moving average of the response time.
+
+When the error rate gets too high the node's breaker opens and requests to it fail right away
+(with NodeUnavailable) instead of waiting on a dead node. After REMOTE_NODE_BREAKER_COOLDOWN seconds
+the breaker is half-open: a single request is let through as a probe, and its result closes or
+re-opens the breaker. Only the probe decides: requests that were sent before the breaker opened and
+finish while it's half-open are recorded, but don't change its state.
+
+A snapshot of each node's health is saved on the RemoteNode (for the admin page) by flush(),
+which the request threads call, so the worker threads never touch the database.
+'''
+import logging
+import threading
+import time
+from collections import deque
+import requests
+from django.conf import settings
+from django.utils import timezone
+from remote_node.models import RemoteNode
+import util.main
+
+CLOSED = 'closed'
+OPEN = 'open'
+HALF_OPEN = 'half-open'
+
+# the ticket allow() hands out for requests that aren't the half-open probe
+REQUEST = True
+
+# weight of the newest response time in the latency average
+LATENCY_EWMA_ALPHA = 0.2
+
+
+class NodeUnavailable(requests.ConnectionError):
+    '''
+    Raised instead of sending a request to a node whose breaker is open
+    '''
+
+
+class NodeHealth:
+    '''
+    Health of a single remote node
+    '''
+    def __init__(self):
+        self.state = CLOSED
+        self.results = deque()
+        self.latency = None
+        self.opened_at = None
+        # the ticket of the half-open probe in flight, if any
+        self.probe = None
+        self.dirty = False
+        self.persisted_at = float('-inf')
+        self.persisted_state = CLOSED
+
+    def error_rate(self, now: float) -> float:
+        while self.results and self.results[0][0] < now - settings.REMOTE_NODE_BREAKER_WINDOW:
+            self.results.popleft()
+        if not self.results:
+            return 0.0
+        return sum(1 for _, ok in self.results if not ok) / len(self.results)
+
+
+_health = {}
+_lock = threading.Lock()
+
+def _get(node: RemoteNode) -> NodeHealth:
+    health = _health.get(node.pk)
+    if health is None:
+        health = _health.setdefault(node.pk, NodeHealth())
+    return health
+
+def allow(node: RemoteNode):
+    '''
+    Whether a request may be sent to the node right now: False if not, otherwise a ticket to pass to record()
+    with the request's result (the half-open probe gets its own ticket, so its result can be told apart)
+    '''
+    with _lock:
+        health = _get(node)
+        if health.state == CLOSED:
+            return REQUEST
+        if health.state == OPEN:
+            if time.monotonic() - health.opened_at < settings.REMOTE_NODE_BREAKER_COOLDOWN:
+                return False
+            util.main.log('health/allow', 'Breaker of %s is half-open, sending a probe', node.nodeName)
+            health.state = HALF_OPEN
+            health.dirty = True
+        # half-open: only one probe at a time
+        if health.probe is not None:
+            return False
+        health.probe = object()
+        return health.probe
+
+def record(node: RemoteNode, ok: bool, latency: float, ticket=REQUEST) -> None:
+    '''
+    Record the result of a request to the node (latency in seconds), sent with the ticket allow() gave it
+    '''
+    now = time.monotonic()
+    with _lock:
+        health = _get(node)
+        health.results.append((now, ok))
+        health.latency = latency if health.latency is None else (
+            LATENCY_EWMA_ALPHA * latency + (1 - LATENCY_EWMA_ALPHA) * health.latency
+        )
+        health.dirty = True
+
+        if health.state == HALF_OPEN:
+            if ticket is not health.probe:
+                # a request sent before the breaker opened: only the probe decides
+                return
+            health.probe = None
+            if ok:
+                util.main.log('health/record', 'Probe to %s succeeded, closing its breaker', node.nodeName, level=logging.INFO)
+                health.state = CLOSED
+                health.results.clear()
+            else:
+                util.main.log('health/record', 'Probe to %s failed, opening its breaker again', node.nodeName, level=logging.WARNING)
+                health.state = OPEN
+                health.opened_at = now
+        elif health.state == CLOSED and not ok:
+            if (len(health.results) >= settings.REMOTE_NODE_BREAKER_MIN_REQUESTS
+                    and health.error_rate(now) >= settings.REMOTE_NODE_BREAKER_ERROR_RATE):
+                util.main.log('health/record', 'Too many errors from %s, opening its breaker', node.nodeName, level=logging.WARNING)
+                health.state = OPEN
+                health.opened_at = now
+
+def _snapshot(health: NodeHealth, now: float) -> dict:
+    return {
+        'health_state': health.state,
+        'error_rate': health.error_rate(now),
+        'latency_ms': None if health.latency is None else health.latency * 1000,
+    }
+
+def snapshot(node: RemoteNode) -> dict:
+    '''
+    The node's health, as saved on the RemoteNode
+    '''
+    with _lock:
+        return _snapshot(_get(node), time.monotonic())
+
+def flush() -> None:
+    '''
+    Save the health of the nodes that changed, at most every REMOTE_NODE_HEALTH_PERSIST_INTERVAL seconds per node
+    (breaker state changes are saved right away)
+    '''
+    now = time.monotonic()
+    with _lock:
+        due = [
+            pk for pk, health in _health.items()
+            if health.dirty and (
+                health.state != health.persisted_state
+                or now - health.persisted_at >= settings.REMOTE_NODE_HEALTH_PERSIST_INTERVAL
+            )
+        ]
+        snapshots = {}
+        for pk in due:
+            health = _health[pk]
+            health.dirty = False
+            health.persisted_at = now
+            health.persisted_state = health.state
+            snapshots[pk] = _snapshot(health, now)
+
+    for pk, fields in snapshots.items():
+        # update() so the routing table isn't invalidated by a post_save
+        RemoteNode.objects.filter(pk=pk).update(health_checked=timezone.now(), **fields)
+
+def reset() -> None:
+    with _lock:
+        _health.clear()
@@ -0,0 +1,29 @@
+from django.core.management.base import BaseCommand
+from django.db import connection
+import time
+
+from remote_node import delivery
+
+# python manage.py deliver_outbound [--once] [--interval SECONDS]
+
+class Command(BaseCommand):
+    help = "send queued inbox deliveries to other nodes (see remote_node/delivery.py)."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--once', action='store_true', help='send everything that is due, then exit')
+        parser.add_argument('--interval', type=float, default=5.0, help='seconds to wait between polls when the queue is idle')
+
+    def handle(self, *args, **options):
+        if options['once']:
+            sent = delivery.drain()
+            print(f'Attempted {sent} deliveries.')
+            return
+
+        print('Delivering outbound queue. Press Ctrl+C to stop.')
+        while True:
+            sent = delivery.drain()
+            if sent:
+                print(f'Attempted {sent} deliveries.')
+            # don't hold a connection open while idle
+            connection.close()
+            time.sleep(options['interval'])
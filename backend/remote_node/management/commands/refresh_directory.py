@@ -0,0 +1,29 @@
+from django.core.management.base import BaseCommand
+from django.conf import settings
+from django.db import connection
+import time
+
+from remote_node import directory
+
+# python manage.py refresh_directory [--once] [--interval SECONDS]
+
+class Command(BaseCommand):
+    help = "copy the author lists of remote nodes into the database (see remote_node/directory.py)."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--once', action='store_true', help='refresh once, then exit')
+        parser.add_argument('--interval', type=float, default=settings.REMOTE_DIRECTORY_INTERVAL, help='seconds between refreshes')
+
+    def handle(self, *args, **options):
+        if options['once']:
+            stored = directory.refresh()
+            print(f'Stored {stored} remote authors.')
+            return
+
+        print('Refreshing the remote author directory. Press Ctrl+C to stop.')
+        while True:
+            stored = directory.refresh()
+            print(f'Stored {stored} remote authors.')
+            # don't hold a connection open while idle
+            connection.close()
+            time.sleep(options['interval'])
@@ -6,6 +6,7 @@ from django.conf import settings
 from django.http import HttpResponse
 import base64
 from restapi.models import User
+from remote_node.authentication import credential_cache
 import util.main as util
 
 
@@ -22,7 +23,7 @@ class RemoteAuthMiddleware:
         referer = urllib.parse.urlparse(request.META.get('HTTP_REFERER')).netloc
         host = request.build_absolute_uri()
         host_domain = urllib.parse.urlparse(host).netloc
-        util.log('RemoteAuthMiddleware', f'referer: {referer}, host: {host}, request.path: {request.path}')
+        util.log('RemoteAuthMiddleware', 'referer: %s, host: %s, request.path: %s', referer, host, request.path)
 
         if '/api/admin' in host:
             # if we're accessing the admin page, no auth needed
@@ -55,21 +56,31 @@ class RemoteAuthMiddleware:
         # https://stackoverflow.com/a/46428523
         try:
             token = request.META.get('HTTP_AUTHORIZATION').split(' ')[1]
-            displayName, pwd = base64.b64decode(token).decode('ascii').split(':')
-            user = User.objects.get(displayName=displayName)
         except Exception as e:
-            util.log('RemoteAuthMiddleware', f'Exception: {e}')
-            return HttpResponse('Unauthorized', status=401)
-        
-        password_valid = user.check_password(pwd)
-        if not password_valid:
-            util.log('RemoteAuthMiddleware', f'Password invalid for user {user.displayName}. Unauthorized.')
+            util.log('RemoteAuthMiddleware', 'Exception: %s', e)
             return HttpResponse('Unauthorized', status=401)
 
-        util.log('RemoteAuthMiddleware', f'user: {user}')
-        if not user.is_active:
-            util.log('RemoteAuthMiddleware', f'User {user.displayName} not active. Unauthorized.')
-            return HttpResponse('Unauthorized', status=401)
+        # tokens we already verified skip the (slow) password check
+        user = credential_cache.get(token)
+        if user is None:
+            try:
+                displayName, pwd = base64.b64decode(token).decode('ascii').split(':')
+                user = User.objects.get(displayName=displayName)
+            except Exception as e:
+                util.log('RemoteAuthMiddleware', 'Exception: %s', e)
+                return HttpResponse('Unauthorized', status=401)
+
+            password_valid = user.check_password(pwd)
+            if not password_valid:
+                util.log('RemoteAuthMiddleware', 'Password invalid for user %s. Unauthorized.', user.displayName)
+                return HttpResponse('Unauthorized', status=401)
+
+            util.log('RemoteAuthMiddleware', 'user: %s', user)
+            if not user.is_active:
+                util.log('RemoteAuthMiddleware', 'User %s not active. Unauthorized.', user.displayName)
+                return HttpResponse('Unauthorized', status=401)
+
+            credential_cache.set(token, user)
 
         if user.is_node:
             print(f'[RemoteAuthMiddleware] User {user.displayName} is a node. Auth granted.')
@@ -0,0 +1,18 @@
+# Generated by Django 5.0.14 on 2026-10-18 14:32
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('remote_node', '0005_delete_incomingnode'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='remotenode',
+            name='timeout',
+            field=models.FloatField(blank=True, help_text='request timeout in seconds (defaults to REMOTE_NODE_TIMEOUT)', null=True),
+        ),
+    ]
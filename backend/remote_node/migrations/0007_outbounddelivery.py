@@ -0,0 +1,31 @@
+# Generated by Django 5.0.14 on 2026-10-18 14:44
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('remote_node', '0006_remotenode_timeout'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='OutboundDelivery',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('url', models.URLField(help_text='inbox url the payload is POSTed to', max_length=500)),
+                ('payload', models.JSONField(help_text='JSON body of the request')),
+                ('status', models.CharField(choices=[('PENDING', 'Pending'), ('SENDING', 'Sending'), ('DELIVERED', 'Delivered'), ('DEAD', 'Dead')], default='PENDING', max_length=20)),
+                ('attempts', models.PositiveIntegerField(default=0, help_text='number of times we tried to send it')),
+                ('next_attempt_at', models.DateTimeField(default=django.utils.timezone.now, help_text='when the delivery is due (or when a SENDING lease expires)')),
+                ('last_error', models.TextField(blank=True, default='', help_text='why the last attempt failed')),
+                ('created', models.DateTimeField(auto_now_add=True)),
+                ('delivered_at', models.DateTimeField(blank=True, null=True)),
+            ],
+            options={
+                'indexes': [models.Index(fields=['status', 'next_attempt_at'], name='remote_node_status_5d2c87_idx')],
+            },
+        ),
+    ]
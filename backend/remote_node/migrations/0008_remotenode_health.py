@@ -0,0 +1,33 @@
+# Generated by Django 5.0.14 on 2026-10-18 15:04
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('remote_node', '0007_outbounddelivery'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='remotenode',
+            name='error_rate',
+            field=models.FloatField(default=0.0, editable=False, help_text='share of recent requests that failed'),
+        ),
+        migrations.AddField(
+            model_name='remotenode',
+            name='health_checked',
+            field=models.DateTimeField(blank=True, editable=False, help_text='when the health snapshot was saved', null=True),
+        ),
+        migrations.AddField(
+            model_name='remotenode',
+            name='health_state',
+            field=models.CharField(choices=[('closed', 'Closed'), ('half-open', 'Half-open'), ('open', 'Open')], default='closed', editable=False, help_text='circuit breaker state', max_length=20),
+        ),
+        migrations.AddField(
+            model_name='remotenode',
+            name='latency_ms',
+            field=models.FloatField(blank=True, editable=False, help_text='average response time in milliseconds', null=True),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.0.14 on 2026-10-18 15:28
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('remote_node', '0008_remotenode_health'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='remotenode',
+            name='batch_inbox',
+            field=models.BooleanField(default=False, help_text="whether the node's inbox accepts several items per POST, so queued deliveries to it can be sent together"),
+        ),
+    ]
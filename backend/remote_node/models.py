@@ -1,4 +1,5 @@
 from django.db import models
+from django.utils import timezone
 
 # Create your models here.
 class RemoteNode(models.Model):
@@ -9,4 +10,52 @@ class RemoteNode(models.Model):
     displayName = models.CharField(max_length=250, unique=True, help_text="the author's display name", blank=True, null=True)
     url = models.URLField(max_length=250, help_text="url to the author's profile")
     password = models.CharField(max_length=250, help_text="password to the remote node", blank=True, null=True)
-    disabled = models.BooleanField(help_text="whether the remote node is disabled", default=False)
\ No newline at end of file
+    disabled = models.BooleanField(help_text="whether the remote node is disabled", default=False)
+    timeout = models.FloatField(help_text="request timeout in seconds (defaults to REMOTE_NODE_TIMEOUT)", blank=True, null=True)
+    batch_inbox = models.BooleanField(help_text="whether the node's inbox accepts several items per POST, so queued deliveries to it can be sent together", default=False)
+
+    # snapshot of the node's health (see remote_node/health.py). Only saved with update(), never edited by hand
+    HEALTH_STATES = [
+        ('closed', 'Closed'),
+        ('half-open', 'Half-open'),
+        ('open', 'Open'),
+    ]
+    health_state = models.CharField(max_length=20, choices=HEALTH_STATES, default='closed', editable=False, help_text="circuit breaker state")
+    error_rate = models.FloatField(default=0.0, editable=False, help_text="share of recent requests that failed")
+    latency_ms = models.FloatField(blank=True, null=True, editable=False, help_text="average response time in milliseconds")
+    health_checked = models.DateTimeField(blank=True, null=True, editable=False, help_text="when the health snapshot was saved")
+
+class OutboundDelivery(models.Model):
+    '''
+    A JSON payload waiting to be POSTed to an inbox on some node.
+
+    Deliveries are sent by remote_node/delivery.py. Failed deliveries are retried with
+    exponential backoff, and give up (DEAD) after OUTBOUND_DELIVERY_MAX_ATTEMPTS tries.
+    '''
+    PENDING = 'PENDING'
+    SENDING = 'SENDING'
+    DELIVERED = 'DELIVERED'
+    DEAD = 'DEAD'
+    STATUS_CHOICES = [
+        (PENDING, 'Pending'),
+        (SENDING, 'Sending'),
+        (DELIVERED, 'Delivered'),
+        (DEAD, 'Dead'),
+    ]
+
+    url = models.URLField(max_length=500, help_text="inbox url the payload is POSTed to")
+    payload = models.JSONField(help_text="JSON body of the request")
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default=PENDING)
+    attempts = models.PositiveIntegerField(default=0, help_text="number of times we tried to send it")
+    next_attempt_at = models.DateTimeField(default=timezone.now, help_text="when the delivery is due (or when a SENDING lease expires)")
+    last_error = models.TextField(blank=True, default='', help_text="why the last attempt failed")
+    created = models.DateTimeField(auto_now_add=True)
+    delivered_at = models.DateTimeField(blank=True, null=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['status', 'next_attempt_at']),
+        ]
+
+    def __str__(self):
+        return f'{self.status} {self.url}'
@@ -0,0 +1,157 @@
+'''
+Cache of responses to GET requests proxied to remote nodes
+
+The "?all" endpoints pass remote posts, comments, likes, images and authors straight through, and the
+frontend polls them, so the same remote resource would be fetched every few seconds. Instead, 200 responses
+are kept in memory, keyed by node and (transformed) URL:
+
+- a response is fresh for the max-age its Cache-Control gives, or else for the TTL of its kind of
+  resource (REMOTE_RESPONSE_CACHE_TTLS, picked from the URL). "no-store" and "private" responses aren't
+  kept, "no-cache" ones are revalidated every time,
+- once it's no longer fresh, a response with an ETag (or Last-Modified) is revalidated with If-None-Match
+  (If-Modified-Since), and a 304 answer serves the cached response again,
+- the least recently used responses are dropped to keep the bodies under REMOTE_RESPONSE_CACHE_MAX_BYTES.
+'''
+import threading
+import time
+import urllib.parse
+from collections import OrderedDict
+import requests
+from django.conf import settings
+
+
+class CachedResponse:
+    '''
+    A cached response and how long it can be served without asking the node again
+    '''
+    def __init__(self, response: requests.Response, fresh_until: float):
+        self.response = response
+        self.fresh_until = fresh_until
+        self.etag = response.headers.get('ETag')
+        self.last_modified = response.headers.get('Last-Modified')
+        self.size = len(response.content or b'')
+
+    def is_fresh(self, now: float) -> bool:
+        return now < self.fresh_until
+
+    def can_revalidate(self) -> bool:
+        return bool(self.etag or self.last_modified)
+
+    def validators(self) -> dict:
+        '''
+        Headers to revalidate the response with
+        '''
+        headers = {}
+        if self.etag:
+            headers['If-None-Match'] = self.etag
+        if self.last_modified:
+            headers['If-Modified-Since'] = self.last_modified
+        return headers
+
+
+def resource(url: str) -> str:
+    '''
+    The kind of resource a URL is for (e.g. 'posts' for .../authors/{id}/posts/{id}), or None
+    '''
+    segments = [segment for segment in urllib.parse.urlparse(url).path.split('/') if segment]
+    for segment in reversed(segments):
+        if segment in settings.REMOTE_RESPONSE_CACHE_TTLS:
+            return segment
+    return None
+
+def cache_control(response: requests.Response) -> dict:
+    '''
+    The response's Cache-Control directives, e.g. {'max-age': '60', 'no-cache': None}
+    '''
+    directives = {}
+    for directive in (response.headers.get('Cache-Control') or '').split(','):
+        name, _, value = directive.strip().partition('=')
+        if name:
+            directives[name.lower()] = value.strip('"') or None
+    return directives
+
+def ttl(url: str, response: requests.Response) -> float:
+    '''
+    How long (seconds) the response to a GET of the URL stays fresh, or None if it must not be cached
+    '''
+    directives = cache_control(response)
+    if 'no-store' in directives or 'private' in directives:
+        return None
+    if 'no-cache' in directives:
+        return 0.0
+    # we're a shared cache, so s-maxage wins over max-age
+    for name in ['s-maxage', 'max-age']:
+        if directives.get(name):
+            try:
+                return max(float(directives[name]), 0.0)
+            except ValueError:
+                pass
+    return settings.REMOTE_RESPONSE_CACHE_TTLS.get(resource(url), settings.REMOTE_RESPONSE_CACHE_DEFAULT_TTL)
+
+
+class ResponseCache:
+    '''
+    (node, URL) -> CachedResponse, least recently used first, with the bodies under `max_bytes` in total
+    '''
+    def __init__(self, max_bytes: int):
+        self.max_bytes = max_bytes
+        self.size = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: tuple) -> CachedResponse:
+        '''
+        The cached response, fresh or one that can be revalidated, or None
+        '''
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            if not entry.is_fresh(time.monotonic()) and not entry.can_revalidate():
+                self._remove(key)
+                return None
+            self._entries.move_to_end(key)
+            return entry
+
+    def store(self, key: tuple, url: str, response: requests.Response) -> None:
+        '''
+        Cache a response if it's cacheable
+        '''
+        if response.status_code != 200:
+            return
+        seconds = ttl(url, response)
+        if seconds is None:
+            return
+        entry = CachedResponse(response, time.monotonic() + seconds)
+        if entry.size > self.max_bytes or (seconds == 0 and not entry.can_revalidate()):
+            return
+        with self._lock:
+            self._remove(key)
+            self._entries[key] = entry
+            self.size += entry.size
+            while self.size > self.max_bytes:
+                self._remove(next(iter(self._entries)))
+
+    def revalidated(self, key: tuple, url: str, entry: CachedResponse, not_modified: requests.Response) -> None:
+        '''
+        The node answered 304: the cached response is fresh again
+        '''
+        seconds = ttl(url, not_modified)
+        with self._lock:
+            if seconds is None:
+                self._remove(key)
+            else:
+                entry.fresh_until = time.monotonic() + seconds
+
+    def _remove(self, key: tuple) -> None:
+        entry = self._entries.pop(key, None)
+        if entry is not None:
+            self.size -= entry.size
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self.size = 0
+
+
+response_cache = ResponseCache(settings.REMOTE_RESPONSE_CACHE_MAX_BYTES)
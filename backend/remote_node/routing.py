@@ -0,0 +1,94 @@
+'''
+In-process routing table from URLs to remote nodes
+
+Working out which node serves a URL used to load every enabled RemoteNode and try them one by one.
+Instead, the enabled nodes are loaded once into a prefix trie keyed on host + path segments,
+and the table is rebuilt after a RemoteNode is saved or deleted (or after REMOTE_NODE_ROUTES_TTL
+seconds, so changes made by other processes are picked up too).
+'''
+import threading
+import time
+from urllib.parse import urlsplit
+from django.conf import settings
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
+from remote_node.models import RemoteNode
+
+def route_key(url: str) -> list:
+    '''
+    Split a URL into the keys used by the trie: the lowercased host, then each path segment
+    '''
+    parts = urlsplit(url)
+    return [parts.netloc.lower()] + [segment for segment in parts.path.split('/') if segment]
+
+class RoutingTable:
+    '''
+    Longest-prefix trie of the enabled remote nodes.
+
+    Each trie level is a dict of key -> child level, and the nodes whose URL ends at that
+    level are stored under the NODES key.
+    '''
+    NODES = None
+
+    def __init__(self, nodes: list):
+        self.nodes = list(nodes)
+        self._root = {}
+        # every node by host, for URLs whose path doesn't match the node's URL yet (see candidates())
+        self._by_host = {}
+        for node in self.nodes:
+            level = self._root
+            for key in route_key(node.url):
+                level = level.setdefault(key, {})
+            level.setdefault(self.NODES, []).append(node)
+            self._by_host.setdefault(route_key(node.url)[0], []).append(node)
+
+    def candidates(self, url: str) -> list:
+        '''
+        Nodes that may serve the URL, best match first.
+
+        These are the nodes whose URL is a prefix of the URL (longest first), followed by the other
+        nodes on the same host. The latter still need a chance since transform_url_for_node may
+        rewrite the path for them (e.g. team lost's URLs are given out without /api/).
+        '''
+        keys = route_key(url)
+        matches = []
+        level = self._root
+        for key in keys:
+            level = level.get(key)
+            if level is None:
+                break
+            matches.extend(level.get(self.NODES, []))
+        matches.reverse()
+        return matches + [node for node in self._by_host.get(keys[0], []) if node not in matches]
+
+_table = None
+_built_at = 0.0
+_lock = threading.Lock()
+
+def routing_table() -> RoutingTable:
+    '''
+    Return the routing table, building it from the database if it is missing or expired
+    '''
+    global _table, _built_at
+    table = _table
+    if table is not None and time.monotonic() - _built_at < settings.REMOTE_NODE_ROUTES_TTL:
+        return table
+
+    with _lock:
+        if _table is None or time.monotonic() - _built_at >= settings.REMOTE_NODE_ROUTES_TTL:
+            _table = RoutingTable(RemoteNode.objects.filter(disabled=False))
+            _built_at = time.monotonic()
+        return _table
+
+def invalidate() -> None:
+    '''
+    Throw away the routing table, so it's rebuilt on the next lookup
+    '''
+    global _table
+    with _lock:
+        _table = None
+
+@receiver(post_save, sender=RemoteNode)
+@receiver(post_delete, sender=RemoteNode)
+def invalidate_routing_table(sender, **kwargs):
+    invalidate()
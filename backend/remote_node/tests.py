@@ -1,14 +1,23 @@
-from django.test import LiveServerTestCase, TestCase
+from django.test import LiveServerTestCase, TestCase, override_settings
+from django.utils import timezone
+from django.core.signals import request_started
+from django.db import connection
 from unittest.mock import patch 
 from django.test.client import RequestFactory
 from remote_node.middleware import RemoteAuthMiddleware
 from django.conf import settings
 from util.tests import LiveServerThreadWithReuse
 from unittest.mock import MagicMock
+from time import sleep
 from restapi.models import User
 import base64
 from remote_node import util
-from remote_node.models import RemoteNode
+from remote_node.models import RemoteNode, OutboundDelivery
+from remote_node import delivery, authors, health, directory, responses
+import time
+import requests
+import email.message
+import urllib.request
 
 # Create your tests here.
 
@@ -108,6 +117,46 @@ class RemoteAuthMiddlewareTest(TestCase):
         self.assertNotEqual(get_response.return_value, response)
         self.assertEqual(response.status_code, 401)
 
+    def _remote_request(self, token):
+        rf = RequestFactory()
+        request = rf.get('/')
+        request.META['HTTP_REFERER'] = b''
+        request.META['HTTP_AUTHORIZATION'] = f'Basic {token}'
+        request.build_absolute_uri = lambda: 'https://our-node.com/api/'
+        return request
+
+    def test_middleware_caches_credentials(self):
+        '''
+        Tests that a verified token does not have its password checked again
+        '''
+        get_response = MagicMock()
+        middleware = RemoteAuthMiddleware(get_response)
+        self.assertEqual(middleware(self._remote_request(self.userNodeToken)), get_response.return_value)
+
+        with patch.object(User, 'check_password') as mock_check_password:
+            response = middleware(self._remote_request(self.userNodeToken))
+            self.assertFalse(mock_check_password.called)
+        self.assertEqual(response, get_response.return_value)
+
+    def test_middleware_cache_invalidated(self):
+        '''
+        Tests that changing the password or deactivating the node invalidates the cached token
+        '''
+        get_response = MagicMock()
+        middleware = RemoteAuthMiddleware(get_response)
+        self.assertEqual(middleware(self._remote_request(self.userNodeToken)), get_response.return_value)
+
+        node = User.objects.get(displayName='testNode')
+        node.set_password('newPwd')
+        node.save()
+        self.assertEqual(middleware(self._remote_request(self.userNodeToken)).status_code, 401)
+
+        # queryset.update() does not send signals, the cache must still notice
+        new_token = base64.b64encode(b'testNode:newPwd').decode('ascii')
+        self.assertEqual(middleware(self._remote_request(new_token)), get_response.return_value)
+        User.objects.filter(displayName='testNode').update(is_active=False)
+        self.assertEqual(middleware(self._remote_request(new_token)).status_code, 401)
+
 
 class RemoteAuthUtilTest(TestCase):
     '''
@@ -123,20 +172,50 @@ class RemoteAuthUtilTest(TestCase):
         )
         self.node1Token = base64.b64encode(b'local:node1pwd').decode('ascii')
     
-    @patch('requests.get')
+    @patch('requests.Session.get')
     def testNode1(self, mock_get):
         '''
         test that the util.get sends the right headers
-        we are mocking the requests.get so that we don't actually send a request
+        we are mocking the pooled session's get so that we don't actually send a request
         https://stackoverflow.com/a/28821004
         '''
+        mock_get.return_value.status_code = 200
         util.get('http://localhost:8000/api/nested/api')
 
         self.assertTrue(mock_get.called)
         headers = mock_get.call_args[1]['headers']
         self.assertEqual(headers['Authorization'], f'Basic {self.node1Token}')
         self.assertEqual(headers['Content-Type'], 'application/json')
-        
+
+    @patch('requests.Session.get')
+    def test_node_timeout(self, mock_get):
+        '''
+        test that the node's own timeout is used over the default one
+        '''
+        self.node1.timeout = 2.5
+        self.node1.save()
+        mock_get.return_value.status_code = 200
+        util.get('http://localhost:8000/api/nested/api')
+        self.assertEqual(mock_get.call_args[1]['timeout'], 2.5)
+
+    def test_session_reused(self):
+        '''
+        test that requests to the same node share one pooled session
+        '''
+        session = util.get_session(self.node1)
+        self.assertIs(session, util.get_session(RemoteNode.objects.get(nodeName='node1')))
+
+    def test_session_ignores_cookies(self):
+        '''
+        test that cookies set by a node aren't kept on the shared session
+        '''
+        session = util.get_session(self.node1)
+        headers = email.message.Message()
+        headers['Set-Cookie'] = 'sessionid=abc; Path=/'
+        response = MagicMock(info=MagicMock(return_value=headers))
+        session.cookies.extract_cookies(response, urllib.request.Request('http://localhost:8000/api/authors'))
+        self.assertEqual(len(session.cookies), 0)
+
 
 class TransformURLTest(TestCase):
     def setUp(self):
@@ -163,4 +242,507 @@ class TransformURLTest(TestCase):
         url = 'https://snackoverflow-7f593e547e10.herokuapp.com/api/authors/0bc32965-95f6-4450-8d19-5e484e825dee/inbox'
         transformed = util.transform_url_for_node(url, self.node_snack)
         self.assertEqual(transformed, url)
-        
\ No newline at end of file
+        
+
+class GetFirstTest(TestCase):
+    '''
+    Tests that util.get_first queries nodes in parallel and returns the first 200
+    '''
+    def setUp(self):
+        self.node_slow = RemoteNode.objects.create(nodeName='slow', displayName='slow', url='https://slow.com/api/')
+        self.node_fast = RemoteNode.objects.create(nodeName='fast', displayName='fast', url='https://fast.com/api/')
+        responses.response_cache.clear()
+
+    def tearDown(self):
+        responses.response_cache.clear()
+
+    def _fake_get(self, node, url, headers=None):
+        response = MagicMock()
+        response.headers = {'Cache-Control': 'no-store'}
+        if node.nodeName == 'slow':
+            sleep(0.5)
+            response.status_code = 404
+        else:
+            response.status_code = 200
+        return response
+
+    def test_first_success(self):
+        with patch('remote_node.util.node_get', side_effect=self._fake_get):
+            response = util.get_first([
+                (self.node_slow, 'https://slow.com/api/authors'),
+                (self.node_fast, 'https://fast.com/api/authors'),
+            ])
+        self.assertEqual(response.status_code, 200)
+
+    def test_deadline(self):
+        with patch('remote_node.util.node_get', side_effect=self._fake_get):
+            response = util.get_first([(self.node_slow, 'https://slow.com/api/authors')], deadline=0.1)
+        self.assertIsNone(response)
+
+
+class ResponseCacheTest(TestCase):
+    '''
+    Tests that proxied GETs are cached and revalidated with their ETag
+    '''
+    def setUp(self):
+        self.node = RemoteNode.objects.create(nodeName='remote', displayName='remote', url='https://remote.com/api/')
+        self.url = 'https://remote.com/api/authors/1/posts/2'
+        responses.response_cache.clear()
+
+    def tearDown(self):
+        responses.response_cache.clear()
+
+    def _response(self, status_code, headers=None, content=b'{"type": "post"}'):
+        response = requests.Response()
+        response.status_code = status_code
+        response.headers.update(headers or {})
+        response._content = content
+        return response
+
+    def test_fresh_response_served_from_cache(self):
+        with patch('remote_node.util.node_get', return_value=self._response(200, {'ETag': '"v1"'})) as mock_get:
+            first = util.cached_get(self.node, self.url)
+            second = util.cached_get(self.node, self.url)
+        self.assertEqual(mock_get.call_count, 1)
+        self.assertIs(first, second)
+        self.assertEqual(second.json(), {'type': 'post'})
+
+    def test_revalidates_with_etag(self):
+        with patch('remote_node.util.node_get', return_value=self._response(200, {'ETag': '"v1"', 'Cache-Control': 'max-age=0'})):
+            first = util.cached_get(self.node, self.url)
+        with patch('remote_node.util.node_get', return_value=self._response(304, content=b'')) as mock_get:
+            second = util.cached_get(self.node, self.url)
+        self.assertEqual(mock_get.call_args.kwargs['headers']['If-None-Match'], '"v1"')
+        self.assertIs(first, second)
+
+    def test_no_store(self):
+        with patch('remote_node.util.node_get', return_value=self._response(200, {'Cache-Control': 'no-store'})) as mock_get:
+            util.cached_get(self.node, self.url)
+            util.cached_get(self.node, self.url)
+        self.assertEqual(mock_get.call_count, 2)
+
+    def test_errors_not_cached(self):
+        with patch('remote_node.util.node_get', return_value=self._response(404)) as mock_get:
+            util.cached_get(self.node, self.url)
+            util.cached_get(self.node, self.url)
+        self.assertEqual(mock_get.call_count, 2)
+
+    def test_ttl_by_resource(self):
+        response = self._response(200)
+        self.assertEqual(responses.ttl('https://remote.com/api/authors/1/posts/2/image', response), settings.REMOTE_RESPONSE_CACHE_TTLS['image'])
+        self.assertEqual(responses.ttl('https://remote.com/api/authors/1/posts/2/comments?page=1', response), settings.REMOTE_RESPONSE_CACHE_TTLS['comments'])
+        self.assertEqual(responses.ttl(self.url, self._response(200, {'Cache-Control': 'public, max-age=5'})), 5.0)
+
+    def test_memory_budget(self):
+        cache = responses.ResponseCache(max_bytes=10)
+        cache.store(('a',), self.url, self._response(200, content=b'123456'))
+        cache.store(('b',), self.url, self._response(200, content=b'123456'))
+        self.assertIsNone(cache.get(('a',)))
+        self.assertIsNotNone(cache.get(('b',)))
+        self.assertEqual(cache.size, 6)
+
+
+class OutboundDeliveryTest(TestCase):
+    '''
+    Tests the outbound delivery queue: success, retry with backoff, and dead-lettering
+    '''
+    def setUp(self):
+        self.node = RemoteNode.objects.create(nodeName='remote', displayName='remote', url='https://remote.com/api/')
+        self.url = 'https://remote.com/api/authors/1/inbox'
+
+    def _response(self, status_code):
+        response = MagicMock()
+        response.status_code = status_code
+        response.text = ''
+        return response
+
+    def test_delivered(self):
+        queued = delivery.enqueue(self.url, {'type': 'inbox', 'items': []})
+        with patch('remote_node.util.node_post', return_value=self._response(201)) as mock_post:
+            self.assertEqual(delivery.deliver_due(), 1)
+        mock_post.assert_called_once()
+        queued.refresh_from_db()
+        self.assertEqual(queued.status, OutboundDelivery.DELIVERED)
+        self.assertEqual(queued.attempts, 1)
+        self.assertIsNotNone(queued.delivered_at)
+
+    @override_settings(OUTBOUND_DELIVERY_MAX_ATTEMPTS=2)
+    def test_retry_then_dead(self):
+        queued = delivery.enqueue(self.url, {'type': 'inbox', 'items': []})
+        with patch('remote_node.util.node_post', return_value=self._response(500)):
+            delivery.deliver_due()
+            queued.refresh_from_db()
+            # first failure: back in the queue, but not due yet
+            self.assertEqual(queued.status, OutboundDelivery.PENDING)
+            self.assertGreater(queued.next_attempt_at, timezone.now())
+            self.assertEqual(delivery.deliver_due(), 0)
+
+            OutboundDelivery.objects.filter(pk=queued.pk).update(next_attempt_at=timezone.now())
+            delivery.deliver_due()
+        queued.refresh_from_db()
+        self.assertEqual(queued.status, OutboundDelivery.DEAD)
+        self.assertEqual(queued.attempts, 2)
+        self.assertIn('500', queued.last_error)
+
+    @override_settings(OUTBOUND_DELIVERY_MAX_BATCH_ITEMS=3)
+    def test_batched_per_inbox(self):
+        self.node.batch_inbox = True
+        self.node.save()
+        queued = delivery.enqueue_many([(self.url, {'type': 'inbox', 'items': [{'type': 'like', 'n': n}]}) for n in range(4)])
+        def post(node, url, json):
+            response = self._response(207)
+            response.json.return_value = {'type': 'inbox', 'items': [{'status': 201, 'body': {}} for _ in json['items']]}
+            return response
+        with patch('remote_node.util.node_post', side_effect=post) as mock_post:
+            self.assertEqual(delivery.deliver_due(), 4)
+        self.assertEqual([len(call.kwargs['json']['items']) for call in mock_post.call_args_list], [3, 1])
+        self.assertEqual(OutboundDelivery.objects.filter(pk__in=[d.pk for d in queued], status=OutboundDelivery.DELIVERED).count(), 4)
+
+    def test_batched_item_failures_retried(self):
+        self.node.batch_inbox = True
+        self.node.save()
+        queued = delivery.enqueue_many([(self.url, {'type': 'inbox', 'items': [{'type': 'like', 'n': n}]}) for n in range(3)])
+        response = self._response(207)
+        response.json.return_value = {'type': 'inbox', 'items': [
+            {'status': 201, 'body': {}},
+            {'status': 500, 'body': {'error': 'oops'}},
+            {'status': 201, 'body': {}},
+        ]}
+        with patch('remote_node.util.node_post', return_value=response):
+            delivery.deliver_due()
+        statuses = [OutboundDelivery.objects.get(pk=d.pk) for d in queued]
+        self.assertEqual([d.status for d in statuses], [OutboundDelivery.DELIVERED, OutboundDelivery.PENDING, OutboundDelivery.DELIVERED])
+        self.assertIn('oops', statuses[1].last_error)
+
+    def test_unreadable_multi_status_retried(self):
+        self.node.batch_inbox = True
+        self.node.save()
+        queued = delivery.enqueue_many([(self.url, {'type': 'inbox', 'items': [{'type': 'like', 'n': n}]}) for n in range(2)])
+        response = self._response(207)
+        response.json.side_effect = ValueError('not json')
+        with patch('remote_node.util.node_post', return_value=response):
+            delivery.deliver_due()
+        # and a status for only some of the items
+        OutboundDelivery.objects.filter(pk__in=[d.pk for d in queued]).update(next_attempt_at=timezone.now())
+        response = self._response(207)
+        response.json.return_value = {'type': 'inbox', 'items': [{'status': 201, 'body': {}}]}
+        with patch('remote_node.util.node_post', return_value=response):
+            delivery.deliver_due()
+        statuses = [OutboundDelivery.objects.get(pk=d.pk) for d in queued]
+        self.assertEqual([d.status for d in statuses], [OutboundDelivery.PENDING, OutboundDelivery.PENDING])
+        self.assertEqual([d.attempts for d in statuses], [2, 2])
+        self.assertIn('unreadable', statuses[0].last_error)
+
+    def test_expired_lease_result_not_recorded(self):
+        queued = delivery.enqueue(self.url, {'type': 'inbox', 'items': []})
+        [stale] = delivery.claim_due(10)
+        # the lease runs out, and another worker claims and delivers it
+        OutboundDelivery.objects.filter(pk=queued.pk).update(next_attempt_at=timezone.now())
+        [current] = delivery.claim_due(10)
+        delivery._record_success(current)
+        # the first worker finishes late and must not put it back in the queue
+        delivery._record_failure(stale, 'timed out')
+        queued.refresh_from_db()
+        self.assertEqual(queued.status, OutboundDelivery.DELIVERED)
+        self.assertEqual(queued.last_error, '')
+
+    def test_no_matching_node_is_dead(self):
+        queued = delivery.enqueue('https://unknown.com/api/authors/1/inbox', {'type': 'inbox', 'items': []})
+        delivery.deliver_due()
+        queued.refresh_from_db()
+        self.assertEqual(queued.status, OutboundDelivery.DEAD)
+
+    def test_expired_lease_is_reclaimed(self):
+        queued = delivery.enqueue(self.url, {'type': 'inbox', 'items': []})
+        self.assertEqual(len(delivery.claim_due(10)), 1)
+        # claimed deliveries aren't handed out again while leased
+        self.assertEqual(delivery.claim_due(10), [])
+        OutboundDelivery.objects.filter(pk=queued.pk).update(next_attempt_at=timezone.now())
+        self.assertEqual(len(delivery.claim_due(10)), 1)
+
+    def test_claimed_once_without_skip_locked(self):
+        queued = delivery.enqueue_many([(self.url, {'type': 'inbox', 'items': []}) for _ in range(2)])
+        ids = [d.pk for d in queued]
+        now = timezone.now()
+        # two workers that read the same due deliveries: only the first one gets them
+        self.assertEqual(delivery._claim_rows(ids, now), ids)
+        self.assertEqual(delivery._claim_rows(ids, now), [])
+        self.assertEqual(set(OutboundDelivery.objects.filter(pk__in=ids).values_list('attempts', flat=True)), {1})
+
+        OutboundDelivery.objects.filter(pk=ids[0]).update(next_attempt_at=now)
+        with patch.object(connection.features, 'has_select_for_update_skip_locked', False):
+            self.assertEqual([d.pk for d in delivery.claim_due(10)], [ids[0]])
+
+    def test_started_on_first_request(self):
+        delivery.enqueue(self.url, {'type': 'inbox', 'items': []})
+        request_started.connect(delivery.start_on_first_request, dispatch_uid=delivery.START_ON_FIRST_REQUEST)
+        with patch('remote_node.delivery.kick') as mock_kick:
+            request_started.send(sender=self.__class__)
+            request_started.send(sender=self.__class__)
+        # only the first request wakes up the dispatcher
+        mock_kick.assert_called_once()
+
+    def test_not_started_when_queue_empty(self):
+        with patch('remote_node.delivery.kick') as mock_kick:
+            delivery.start_on_first_request()
+        mock_kick.assert_not_called()
+
+    @override_settings(OUTBOUND_DELIVERY_BACKOFF_BASE=10, OUTBOUND_DELIVERY_BACKOFF_MAX=60)
+    def test_backoff(self):
+        self.assertEqual(delivery.backoff(1).total_seconds(), 10)
+        self.assertEqual(delivery.backoff(3).total_seconds(), 40)
+        self.assertEqual(delivery.backoff(10).total_seconds(), 60)
+
+
+class RoutingTest(TestCase):
+    '''
+    Tests that URLs are routed to the right node through the cached routing table
+    '''
+    def setUp(self):
+        self.node_lost = RemoteNode.objects.create(
+            nodeName='lost',
+            displayName='attack',
+            url='https://lostone-8ec8a3227ce0.herokuapp.com/api/',
+        )
+        self.node_host = RemoteNode.objects.create(nodeName='host', displayName='host', url='https://shared.com/')
+        self.node_api = RemoteNode.objects.create(nodeName='api', displayName='api', url='https://shared.com/api/')
+
+    def test_longest_prefix(self):
+        node, url = util.resolve('https://shared.com/api/authors/1/')
+        self.assertEqual(node, self.node_api)
+        self.assertEqual(url, 'https://shared.com/api/authors/1')
+
+        node, url = util.resolve('https://shared.com/other/authors/1')
+        self.assertEqual(node, self.node_host)
+
+    def test_transformed_url(self):
+        node, url = util.resolve('https://lostone-8ec8a3227ce0.herokuapp.com/authors/1/inbox')
+        self.assertEqual(node, self.node_lost)
+        self.assertEqual(url, 'https://lostone-8ec8a3227ce0.herokuapp.com/api/authors/1/inbox/')
+
+    def test_no_match(self):
+        node, url = util.resolve('https://unknown.com/api/authors/1')
+        self.assertIsNone(node)
+
+    def test_no_queries_once_built(self):
+        util.resolve('https://shared.com/api/authors/1')
+        with self.assertNumQueries(0):
+            util.resolve('https://shared.com/api/authors/2')
+            util.resolve('https://unknown.com/api/authors/1')
+
+    def test_invalidated_on_save(self):
+        util.resolve('https://shared.com/api/authors/1')
+        self.node_api.disabled = True
+        self.node_api.save()
+        node, url = util.resolve('https://shared.com/api/authors/1')
+        self.assertEqual(node, self.node_host)
+
+
+class AuthorCacheTest(TestCase):
+    '''
+    Tests the remote author cache: LRU eviction, negative caching and stale-while-revalidate
+    '''
+    def setUp(self):
+        authors.author_cache.clear()
+        self.url = 'https://remote.com/api/authors/1'
+
+    def _response(self, status_code, data=None):
+        response = MagicMock()
+        response.status_code = status_code
+        response.json.return_value = data
+        return response
+
+    def test_lru(self):
+        cache = authors.AuthorCache(max_size=2, ttl=60, stale_ttl=60, negative_ttl=60)
+        cache.set('a', {'id': 'a'})
+        cache.set('b', {'id': 'b'})
+        cache.lookup('a')
+        cache.set('c', {'id': 'c'})
+        # b was the least recently used
+        self.assertFalse(cache.lookup('b')[0])
+        self.assertEqual(cache.lookup('a'), (True, {'id': 'a'}, False))
+
+    def test_cached(self):
+        with patch('remote_node.util.get_many', return_value={self.url: self._response(200, {'id': self.url})}) as mock_get_many:
+            self.assertEqual(authors.get_author(self.url), {'id': self.url})
+            self.assertEqual(authors.get_author(self.url), {'id': self.url})
+        self.assertEqual(mock_get_many.call_count, 2)
+        # the second call didn't need to fetch anything
+        self.assertEqual(mock_get_many.call_args[0][0], [])
+
+    def test_negative_caching(self):
+        with patch('remote_node.util.get_many', return_value={self.url: self._response(404)}):
+            self.assertIsNone(authors.get_author(self.url))
+        self.assertEqual(authors.author_cache.lookup(self.url), (True, None, False))
+
+    def test_stale_while_revalidate(self):
+        authors.author_cache.set(self.url, {'id': self.url, 'displayName': 'old'})
+        # make the entry stale, but still servable
+        data, fresh_until, stale_until = authors.author_cache._entries[self.url]
+        authors.author_cache._entries[self.url] = (data, time.time() - 1, stale_until)
+
+        with patch('remote_node.authors.refresh_in_background') as mock_refresh, patch('remote_node.util.get_many', return_value={}):
+            self.assertEqual(authors.get_author(self.url)['displayName'], 'old')
+        mock_refresh.assert_called_once_with(self.url)
+
+    def test_shared_backend(self):
+        one = authors.AuthorCache(max_size=10, ttl=60, stale_ttl=60, negative_ttl=60, backend='default')
+        two = authors.AuthorCache(max_size=10, ttl=60, stale_ttl=60, negative_ttl=60, backend='default')
+        one.set(self.url, {'id': self.url})
+        self.assertEqual(two.lookup(self.url), (True, {'id': self.url}, False))
+        one.invalidate(self.url)
+        two.clear()
+        self.assertFalse(two.lookup(self.url)[0])
+
+
+@override_settings(
+    REMOTE_NODE_BREAKER_WINDOW=60,
+    REMOTE_NODE_BREAKER_MIN_REQUESTS=3,
+    REMOTE_NODE_BREAKER_ERROR_RATE=0.5,
+    REMOTE_NODE_BREAKER_COOLDOWN=30,
+)
+class HealthTest(TestCase):
+    '''
+    Tests for the per-node circuit breaker
+    '''
+    def setUp(self):
+        health.reset()
+        self.node = RemoteNode.objects.create(nodeName='flaky', displayName='flaky', url='https://flaky.com/api/')
+        self.url = 'https://flaky.com/api/authors/1'
+
+    def tearDown(self):
+        health.reset()
+
+    def _fail(self, times):
+        with patch('requests.Session.get', side_effect=requests.ConnectionError('down')):
+            for _ in range(times):
+                with self.assertRaises(requests.ConnectionError):
+                    util.node_get(self.node, self.url)
+
+    def test_opens_after_errors(self):
+        self._fail(3)
+        self.assertEqual(health.snapshot(self.node)['health_state'], health.OPEN)
+
+        with patch('requests.Session.get') as mock_get:
+            with self.assertRaises(health.NodeUnavailable):
+                util.node_get(self.node, self.url)
+        # the node wasn't contacted at all
+        mock_get.assert_not_called()
+
+    def test_client_errors_are_healthy(self):
+        with patch('requests.Session.get', return_value=MagicMock(status_code=404)):
+            for _ in range(5):
+                util.node_get(self.node, self.url)
+        self.assertEqual(health.snapshot(self.node)['health_state'], health.CLOSED)
+        self.assertEqual(health.snapshot(self.node)['error_rate'], 0.0)
+
+    def test_half_open_probe(self):
+        self._fail(3)
+        # pretend the cooldown is over
+        health._health[self.node.pk].opened_at -= 31
+
+        probe = health.allow(self.node)
+        self.assertTrue(probe)
+        # only one probe at a time
+        self.assertFalse(health.allow(self.node))
+        health.record(self.node, True, 0.1, probe)
+        self.assertEqual(health.snapshot(self.node)['health_state'], health.CLOSED)
+
+    def test_only_probe_decides(self):
+        # a slow request sent while the breaker was still closed
+        ticket = health.allow(self.node)
+        self._fail(3)
+        health._health[self.node.pk].opened_at -= 31
+        probe = health.allow(self.node)
+
+        # the slow request succeeding doesn't close the breaker
+        health.record(self.node, True, 5.0, ticket)
+        self.assertEqual(health.snapshot(self.node)['health_state'], health.HALF_OPEN)
+        self.assertFalse(health.allow(self.node))
+
+        health.record(self.node, False, 0.1, probe)
+        self.assertEqual(health.snapshot(self.node)['health_state'], health.OPEN)
+
+    def test_flush(self):
+        self._fail(3)
+        health.flush()
+        self.node.refresh_from_db()
+        self.assertEqual(self.node.health_state, health.OPEN)
+        self.assertEqual(self.node.error_rate, 1.0)
+        self.assertIsNotNone(self.node.latency_ms)
+        self.assertIsNotNone(self.node.health_checked)
+
+
+@override_settings(REMOTE_DIRECTORY_PAGE_SIZE=2, REMOTE_DIRECTORY_MAX_PAGES=10)
+class DirectoryTest(TestCase):
+    '''
+    Tests the local directory of remote authors behind "GET /authors?all"
+    '''
+    def setUp(self):
+        self.node = RemoteNode.objects.create(nodeName='remote', displayName='remote', url='https://remote.com/api/')
+        self.local = User.objects.create_user(displayName='local author', password='pwd', github='', profileImage=None)
+
+    def _author(self, n, displayName=None):
+        return {
+            'type': 'author',
+            'id': f'https://remote.com/api/authors/remote-{n}',
+            'url': f'https://remote.com/api/authors/remote-{n}',
+            'host': 'https://remote.com/api/',
+            'displayName': displayName or f'remote {n}',
+            'github': None,
+            'profileImage': None,
+        }
+
+    def _pages(self, node, url, **kwargs):
+        # 3 authors, 2 per page
+        page = int(url.split('page=')[1].split('&')[0])
+        items = [self._author(n) for n in range(3)][(page - 1) * 2:page * 2]
+        return MagicMock(status_code=200, json=MagicMock(return_value={'type': 'authors', 'items': items}))
+
+    def test_refresh(self):
+        with patch('remote_node.util.node_get', side_effect=self._pages) as mock_get:
+            self.assertEqual(directory.refresh(), 3)
+        self.assertEqual(mock_get.call_count, 2)
+
+        remote = User.objects.get(pk='remote-0')
+        self.assertTrue(remote.is_remote)
+        self.assertEqual(remote.url, 'https://remote.com/api/authors/remote-0')
+        self.assertFalse(remote.has_usable_password())
+
+        # refreshing again updates the authors instead of copying them twice
+        with patch('remote_node.util.node_get', side_effect=self._pages):
+            directory.refresh()
+        self.assertEqual(User.objects.filter(is_remote=True).count(), 3)
+
+    def test_store_skips_conflicts(self):
+        stored = directory.store(self.node, [self._author(0, displayName='local author'), {**self._author(1), 'id': self.local.id}])
+        self.assertEqual(stored, 0)
+        self.assertFalse(User.objects.filter(is_remote=True).exists())
+
+    def test_store_skips_other_nodes_authors(self):
+        other = RemoteNode.objects.create(nodeName='other', displayName='other', url='https://other.com/api/')
+        directory.store(self.node, [self._author(0)])
+        # another node listing an author with the same id can't take it over
+        hijack = {**self._author(0), 'displayName': 'hijacked', 'url': 'https://other.com/api/authors/remote-0', 'host': 'https://other.com/api/'}
+        self.assertEqual(directory.store(other, [hijack]), 0)
+        remote = User.objects.get(pk='remote-0')
+        self.assertEqual(remote.displayName, 'remote 0')
+        self.assertEqual(remote.url, 'https://remote.com/api/authors/remote-0')
+
+        # its own node still updates it
+        self.assertEqual(directory.store(self.node, [{**self._author(0), 'displayName': 'renamed'}]), 1)
+        self.assertEqual(User.objects.get(pk='remote-0').displayName, 'renamed')
+
+    def test_list_all_from_database(self):
+        directory.store(self.node, [self._author(0), self._author(1)])
+        # remote authors that haven't been listed by their node in a while are left out
+        User.objects.filter(pk='remote-1').update(last_seen=timezone.now() - timezone.timedelta(days=2))
+
+        with patch('remote_node.util.node_get') as mock_get:
+            response = self.client.get('/api/authors?all')
+        mock_get.assert_not_called()
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(
+            sorted(author['displayName'] for author in response.data['items']),
+            ['local author', 'remote 0'],
+        )
@@ -2,65 +2,263 @@
 Utilities regarding remote node functionality
 '''
 import requests
+from http.cookiejar import DefaultCookiePolicy
+from requests.adapters import HTTPAdapter
+from django.conf import settings
 from remote_node.models import RemoteNode
+from remote_node.routing import routing_table
+from remote_node import health
+from remote_node.responses import response_cache
 import base64
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
 from rest_framework.response import Response
 from rest_framework import status
 import util.main
 
-def get(url: str, header: dict = None) -> requests.Response:
+# one pooled, keep-alive session per remote node (keyed by the node's base URL)
+_sessions = {}
+_sessions_lock = threading.Lock()
+
+def get_session(node: RemoteNode) -> requests.Session:
+    '''
+    Return the shared session for a remote node, creating it the first time it's needed.
+
+    The session keeps a connection pool to the node, so repeated requests reuse
+    the same TCP/TLS connection instead of doing a new handshake every time.
+    '''
+    key = node.url.rstrip('/')
+    session = _sessions.get(key)
+    if session is not None:
+        return session
+
+    with _sessions_lock:
+        # someone else might have made the session while we were waiting on the lock
+        if key not in _sessions:
+            session = requests.Session()
+            # the session is shared by every thread and request to the node, so a cookie set by one
+            # response would be sent with unrelated requests: never store any
+            session.cookies.set_policy(DefaultCookiePolicy(allowed_domains=[]))
+            adapter = HTTPAdapter(
+                pool_connections=settings.REMOTE_NODE_POOL_CONNECTIONS,
+                pool_maxsize=settings.REMOTE_NODE_POOL_MAXSIZE,
+            )
+            session.mount('http://', adapter)
+            session.mount('https://', adapter)
+            _sessions[key] = session
+        return _sessions[key]
+
+def auth_headers(node: RemoteNode) -> dict:
+    '''
+    Basic auth + JSON headers we send to a remote node
+    '''
+    token = base64.b64encode(f'{node.displayName}:{node.password}'.encode('ascii')).decode('ascii')
+    return {
+        'Authorization': f'Basic {token}',
+        'Content-Type': 'application/json'
+    }
+
+def node_timeout(node: RemoteNode) -> float:
+    '''
+    Request timeout (seconds) for a remote node
+    '''
+    return node.timeout or settings.REMOTE_NODE_TIMEOUT
+
+def _send(node: RemoteNode, method: str, url: str, **kwargs) -> requests.Response:
+    '''
+    Send a request to a remote node, unless its circuit breaker is open, and record how it went
+    '''
+    ticket = health.allow(node)
+    if not ticket:
+        raise health.NodeUnavailable(f'{node.nodeName} is unavailable (circuit breaker open), not sending {method.upper()} {url}')
+    start = time.monotonic()
+    ok = False
+    try:
+        response = getattr(get_session(node), method)(url, timeout=node_timeout(node), **kwargs)
+        # 4xx is the node answering properly, only count server errors against it
+        ok = response.status_code < 500
+        return response
+    finally:
+        health.record(node, ok, time.monotonic() - start, ticket)
+
+def node_get(node: RemoteNode, url: str, headers: dict = None) -> requests.Response:
+    '''
+    GET a URL on a remote node through the node's pooled session
+    '''
+    return _send(node, 'get', url, headers=headers or auth_headers(node))
+
+def node_post(node: RemoteNode, url: str, json: dict, headers: dict = None) -> requests.Response:
+    '''
+    POST JSON to a URL on a remote node through the node's pooled session
+    '''
+    return _send(node, 'post', url, json=json, headers=headers or auth_headers(node))
+
+def cached_get(node: RemoteNode, url: str) -> requests.Response:
+    '''
+    GET a URL on a remote node, through the response cache (see remote_node/responses.py)
+    '''
+    if not settings.REMOTE_RESPONSE_CACHE_MAX_BYTES:
+        return node_get(node, url)
+
+    key = (node.pk, url)
+    entry = response_cache.get(key)
+    if entry is not None and entry.is_fresh(time.monotonic()):
+        util.main.log('util/cached_get', 'Serving %s from the response cache', url)
+        return entry.response
+
+    headers = auth_headers(node)
+    if entry is not None:
+        headers.update(entry.validators())
+    response = node_get(node, url, headers=headers)
+    if response.status_code == 304 and entry is not None:
+        util.main.log('util/cached_get', '%s has not changed, serving it from the response cache', url)
+        response_cache.revalidated(key, url, entry, response)
+        return entry.response
+    response_cache.store(key, url, response)
+    return response
+
+# shared worker pool used to query several remote nodes at once
+_executor = ThreadPoolExecutor(max_workers=settings.REMOTE_NODE_FANOUT_WORKERS, thread_name_prefix='remote_node')
+
+def get_first(requests_by_node: list, deadline: float = None):
+    '''
+    GET from several remote nodes in parallel and return the first response with a 200 status.
+
+    `requests_by_node` is a list of (node, url) tuples. Once a node answers with a 200,
+    the requests that haven't started yet are cancelled and the rest are ignored.
+    Returns None if no node returned a 200 before the deadline (in seconds).
+    Responses go through the response cache.
+    '''
+    if not requests_by_node:
+        return None
+    if deadline is None:
+        deadline = settings.REMOTE_NODE_FANOUT_DEADLINE
+
+    futures = {
+        _executor.submit(cached_get, node, url): (node, url)
+        for node, url in requests_by_node
+    }
+    pending = set(futures)
+    end = time.monotonic() + deadline
+    try:
+        while pending:
+            remaining = end - time.monotonic()
+            if remaining <= 0:
+                util.main.log('util/get_first', 'Deadline of %ss reached with %s node(s) still pending', deadline, len(pending))
+                return None
+            done, pending = wait(pending, timeout=remaining, return_when=FIRST_COMPLETED)
+            for future in done:
+                node, url = futures[future]
+                try:
+                    response = future.result()
+                except requests.RequestException as e:
+                    util.main.log('util/get_first', 'Error connecting to %s: %s', node.nodeName, e)
+                    continue
+                if response.status_code == 200:
+                    util.main.log('util/get_first', '%s returned 200 for %s', node.nodeName, url)
+                    return response
+                util.main.log('util/get_first', '%s returned status code %s for %s', node.nodeName, response.status_code, url)
+        return None
+    finally:
+        for future in pending:
+            future.cancel()
+        health.flush()
+
+def resolve(url: str) -> tuple:
+    '''
+    Find the remote node that serves a URL.
+
+    Returns a (node, url) tuple, where url has been transformed for that node.
+    If no node matches, the node is None.
+    '''
     url = util.main.standardize_url(url)
-    util.main.log('util/GET', f'GETting from {url}.')
-    # look through RemoteNode until we find the one that matches the url
-    for node in RemoteNode.objects.filter(disabled=False):
-        url = transform_url_for_node(url, node)
-
-        if url.startswith(node.url.rstrip('/')):
-            util.main.log('util/GET', f'Getting from {node.url}')
-            # if we find it, we return the response
-            if not header:
-                token = base64.b64encode(f'{node.displayName}:{node.password}'.encode('ascii')).decode('ascii')
-                headers = {
-                    'Authorization': f'Basic {token}',
-                    'Content-Type': 'application/json'
-                }
-
-            response = requests.get(url, headers=headers)
-            util.main.log('util/GET', f'{node.url} returned response {response.status_code} in {response.elapsed.total_seconds()} seconds')
-            return response
-    
-    util.main.log('util/GET', f'No node matched the URL {url}. Returning 404.')
-    return Response({ 'error': 'we tried to search through all nodes, but we couldn\'t find any that matched!'}, status=status.HTTP_404_NOT_FOUND)
+    # only try the nodes the routing table says could serve this url (no database queries)
+    for node in routing_table().candidates(url):
+        node_url = transform_url_for_node(url, node)
+
+        if node_url.startswith(node.url.rstrip('/')):
+            return node, node_url
+    return None, url
+
+def get(url: str, header: dict = None) -> requests.Response:
+    util.main.log('util/GET', 'GETting from %s.', url)
+    node, url = resolve(url)
+    if node is None:
+        util.main.log('util/GET', 'No node matched the URL %s. Returning 404.', url)
+        return Response({ 'error': 'we tried to search through all nodes, but we couldn\'t find any that matched!'}, status=status.HTTP_404_NOT_FOUND)
+
+    util.main.log('util/GET', 'Getting from %s', node.url)
+    try:
+        response = node_get(node, url, headers=header)
+    finally:
+        health.flush()
+    util.main.log('util/GET', '%s returned response %s in %s seconds', node.url, response.status_code, response.elapsed.total_seconds())
+    return response
+
+def get_many(urls: list, deadline: float = None, cache: bool = False) -> dict:
+    '''
+    GET several URLs (possibly on different nodes) in parallel, through the response cache if `cache` is set.
+
+    Returns a dict of url -> response. URLs that don't belong to any node, failed,
+    or didn't answer before the deadline (in seconds) map to None.
+    '''
+    if deadline is None:
+        deadline = settings.REMOTE_NODE_FANOUT_DEADLINE
+
+    responses = {url: None for url in urls}
+    futures = {}
+    for url in responses:
+        # resolve on this thread, so the worker threads don't need a database connection
+        node, node_url = resolve(url)
+        if node is None:
+            util.main.log('util/get_many', 'No node matched the URL %s', url)
+            continue
+        futures[_executor.submit(cached_get if cache else node_get, node, node_url)] = url
+
+    done, pending = wait(futures, timeout=deadline)
+    for future in pending:
+        future.cancel()
+        util.main.log('util/get_many', '%s did not answer within %ss', futures[future], deadline)
+    for future in done:
+        try:
+            responses[futures[future]] = future.result()
+        except requests.RequestException as e:
+            util.main.log('util/get_many', 'Error getting %s: %s', futures[future], e)
+    health.flush()
+    return responses
+
+def prepare_post(url: str, json: dict) -> tuple:
+    '''
+    Find the node a POST should go to, and shape the URL and JSON body the way that node expects.
+
+    Returns a (node, url, json) tuple. If no node matches, the node is None.
+    '''
+    node, url = resolve(url)
+    if node is None:
+        return None, url, json
+
+    if node.nodeName == 'lost':
+        if '/inbox' in url:
+            util.main.log('util/POST', 'stripping off inbox wrapping from inbox forward data, and capitalizing "type": "Follow"')
+            json['type'] = 'Follow'
+            if 'items' in json:
+                json = json['items'][0]
+            else:
+                util.main.log('util/POST', 'no items in json but i literally do not care anymore. Here is the JSON post data: %s', json)
+    return node, url, json
 
 def post(url: str, json: dict) -> requests.Response:
-    url = util.main.standardize_url(url)
-    util.main.log('util/POST', f'POSTing to {url} with JSON {json}. Need to look through all nodes to find the right one')
-
-    # look through RemoteNode until we find the one that matches the url
-    for node in RemoteNode.objects.filter(disabled=False):
-        util.main.log('util/POST', f'Getting from {node.url}')
-        url = transform_url_for_node(url, node)
-
-        if url.startswith(node.url.rstrip('/')):
-            # if we find it, we return the response
-            token = base64.b64encode(f'{node.displayName}:{node.password}'.encode('ascii')).decode('ascii')
-            headers = {
-                'Authorization': f'Basic {token}',
-                'Content-Type': 'application/json'
-            }
-            if node.nodeName == 'lost':
-                if '/inbox' in url:
-                    util.main.log('util/POST', f'stripping off inbox wrapping from inbox forward data, and capitalizing "type": "Follow"')
-                    json['type'] = 'Follow'
-                    if 'items' in json:
-                        json = json['items'][0]
-                    else:
-                        util.main.log('util/POST', f'no items in json but i literally do not care anymore. Here is the JSON post data: {json}')
-
-            util.main.log('util/POST', f'Bingo! Returning response {url} with JSON {json}')
-            return requests.post(url, json=json, headers=headers)
-    
-    return Response({ 'error': 'we tried to search through all nodes, but we couldn\'t find any that matched!'}, status=status.HTTP_404_NOT_FOUND)
+    util.main.log('util/POST', 'POSTing to %s with JSON %s. Need to look through all nodes to find the right one', url, json)
+    node, url, json = prepare_post(url, json)
+    if node is None:
+        return Response({ 'error': 'we tried to search through all nodes, but we couldn\'t find any that matched!'}, status=status.HTTP_404_NOT_FOUND)
+
+    util.main.log('util/POST', 'Bingo! Returning response %s with JSON %s', url, json)
+    try:
+        return node_post(node, url, json=json)
+    finally:
+        health.flush()
 
 def transform_url_for_node(url: str, node: RemoteNode) -> str:
     '''
@@ -70,11 +268,11 @@ def transform_url_for_node(url: str, node: RemoteNode) -> str:
 
     '''
 
-    util.main.log('remote_node/util/transform_url_for_node', f'Transforming url {url} for node {node.nodeName}')
+    util.main.log('remote_node/util/transform_url_for_node', 'Transforming url %s for node %s', url, node.nodeName)
     url = util.main.standardize_url(url)
 
     if node.nodeName == 'lost':
-        util.main.log('remote_node/util/transform_url_for_node', f'Adding trailing slash to {url} for team lost')
+        util.main.log('remote_node/util/transform_url_for_node', 'Adding trailing slash to %s for team lost', url)
         url_split = url.split('?', maxsplit=2)
         if len(url_split) > 1:
             url = url_split[0] + '/?' + url_split[1]
@@ -83,8 +281,8 @@ def transform_url_for_node(url: str, node: RemoteNode) -> str:
         
         # also, replace "https://lostone-8ec8a3227ce0.herokuapp.com/" with "https://lostone-8ec8a3227ce0.herokuapp.com/api/"
         if "https://lostone-8ec8a3227ce0.herokuapp.com/api" not in url:
-            util.main.log('remote_node/util/transform_url_for_node', f'adding /api/ to url {url}')
+            util.main.log('remote_node/util/transform_url_for_node', 'adding /api/ to url %s', url)
             url = url.replace("https://lostone-8ec8a3227ce0.herokuapp.com/", "https://lostone-8ec8a3227ce0.herokuapp.com/api/")
 
-    util.main.log('remote_node/util/transform_url_for_node', f'Returning url {url}')
+    util.main.log('remote_node/util/transform_url_for_node', 'Returning url %s', url)
     return url
@@ -1,6 +1,7 @@
 from django.shortcuts import render
 import requests
 from .models import RemoteNode
+from .util import node_get
 # Create your views here.
 
 class RemoteNodeView():
@@ -8,7 +9,7 @@ class RemoteNodeView():
         nodes = RemoteNode.objects.filter(disabled=False)
         for node in nodes:
             try:
-                response = requests.get(node.url, auth=(node.displayName, node.password))
+                response = node_get(node, node.url)
                 if response.status_code == 200:
                     # Process successful response from the node
                     print(f"Connected to {node.name}")
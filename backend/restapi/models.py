@@ -44,6 +44,10 @@ class User(AbstractUser):
     # isRemoteUser is a boolean field that is true if the user is copied from a remote node
     is_remote = models.BooleanField(default=False)
 
+    # when a remote author was last listed by their node (see remote_node/directory.py).
+    # Remote authors that haven't been seen in a while are left out of the "?all" author list
+    last_seen = models.DateTimeField(blank=True, null=True)
+
     USERNAME_FIELD = 'displayName'
     REQUIRED_FIELDS = ['github']
 
@@ -4,6 +4,7 @@ from django.urls import path, include
 from post import urls as post_urls
 from inbox import urls as inbox_urls
 from followers import urls as followers_urls
+from post import views as post_views
 
 # Create a router and register the user and author viewsets with it
 router = routers.DefaultRouter(trailing_slash=False)
@@ -24,5 +25,6 @@ urlpatterns = [
     path('api/authors/<str:author_id>/inbox', include(inbox_urls)),
     path('api/authors/<str:author_id>/liked', views.LikedViewSet.as_view({'get': 'list'})),
     path('api/authors/<str:author_id>/followers', include(followers_urls)),
-    path('api/update_github', views.UpdateGithub.as_view())
+    path('api/update_github', views.UpdateGithub.as_view()),
+    path('api/search', post_views.SearchViewSet.as_view({'get': 'list'}))
 ]
\ No newline at end of file
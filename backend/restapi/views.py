@@ -9,22 +9,25 @@ from post.serializers import LikeSerializer
 from post.models import Like, Post
 from rest_framework import permissions
 from restapi.serializers import UserSerializer
-from post.serializers import PostSerializer
-from githubUpdater.githubUpdater import updateGithubAll, updateGithubSingle
+from githubUpdater import scheduler as github_scheduler
 from remote_node.models import RemoteNode
 import remote_node.util
+import remote_node.directory
+from django.db import transaction
 
 import requests
 from util.main import url_remove_trailing_slash
 import util.main as util
 import os
+from util.pagination import KeysetPagination
 
 BASE_URL = os.environ.get('HOST_API_URL') + 'authors'
 
-class CustomPagination(pagination.PageNumberPagination):
+class CustomPagination(KeysetPagination):
     page_size = 20
     page_size_query_param = 'size'
     max_page_size = 10000
+    cursor_fields = ('date_joined', 'id')
 
 
 class AuthView(APIView):
@@ -68,7 +71,7 @@ class AuthView(APIView):
 
             return Response(serialized_user, status=status.HTTP_201_CREATED)
         else:
-            util.log('AuthView/post', f"Error: {serializer.errors}")
+            util.log('AuthView/post', "Error: %s", serializer.errors)
             return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
 
@@ -81,7 +84,7 @@ class AuthView(APIView):
 
         curl -X GET -u "admin:1234" http://localhost:8000/api/auth/
         '''
-        util.log('AuthView/get', f'Login request {request.user}, {request.auth}')
+        util.log('AuthView/get', 'Login request %s, %s', request.user, request.auth)
         if not request.user.is_authenticated:
             return Response(status=status.HTTP_401_UNAUTHORIZED)
 
@@ -118,52 +121,20 @@ class AuthorViewSet(viewsets.ModelViewSet):
 
         authors = {"type": "authors", "items": []}
 
-        # Get local authors first
-        util.log('AuthorViewSet/list', 'Requesting local authors only, all not in query params')
-        queryset = models.User.objects.filter(is_staff=False, is_node=False, is_active=True, is_remote=False).order_by('-date_joined')
-        local_serializer = serializers.UserSerializer(queryset, many=True)
-        authors["items"] = local_serializer.data
-
-        # if all authors are not requested, paginate and return local authors
         if "all" not in request.query_params:
-            paginator = CustomPagination()
-            paginated_authors = paginator.paginate_queryset(authors["items"], request)
-            authors["items"] = paginated_authors
-            return Response(authors, status=status.HTTP_200_OK)
-
+            util.log('AuthorViewSet/list', 'Requesting local authors only, all not in query params')
+            queryset = models.User.objects.filter(is_staff=False, is_node=False, is_active=True, is_remote=False).order_by('-date_joined', '-id')
+        else:
+            # remote authors come from our copy of every node's author list, which is refreshed in the background
+            util.log('AuthorViewSet/list', 'Requesting local and remote authors')
+            queryset = remote_node.directory.authors()
+            transaction.on_commit(remote_node.directory.refresh_in_background)
 
-        # otherwise, return all authors from all nodes
-        remote_authors = []
-        for node in self.nodes:
-            # Skip the local node
-            if node.displayName == "local":
-                continue
-            
-            request_url = remote_node.util.transform_url_for_node(
-                f"{node.url.rstrip('/')}/authors",
-                node
-            )
-            auth_token = base64.b64encode(f"{node.displayName}:{node.password}".encode('ascii')).decode('ascii')
-            headers = {"Authorization": f"Basic {auth_token}"}
-            try:
-                if node.displayName == 'user':
-                    # team HTTP needs a trailing slash
-                    request_url += '/'
-                response = requests.get(request_url, headers=headers)
-                if response.status_code != status.HTTP_200_OK:
-                    util.log('AuthorViewSet/list', f"Failed to connect to {node.nodeName}. Status code: {response.status_code}")
-                    continue
-                remote_authors.extend(response.json()["items"])
-            except requests.RequestException as e:
-                util.log('AuthorViewSet/list', f"Error connecting to {node.nodeName}: {e}")
-
-        # Combine local and remote authors
-        authors["items"] += remote_authors
-
-        # Paginate the combined authors
+        # the database does the paginating, so we only serialize the requested page
         paginator = CustomPagination()
-        paginated_authors = paginator.paginate_queryset(authors["items"], request)
-        authors["items"] = paginated_authors
+        paginated_authors = paginator.paginate_queryset(queryset, request)
+        authors["items"] = serializers.UserSerializer(paginated_authors, many=True).data
+        authors.update(paginator.cursor_links())
         return Response(authors, status=status.HTTP_200_OK)
 
     def retrieve(self, request, pk):
@@ -181,14 +152,15 @@ class AuthorViewSet(viewsets.ModelViewSet):
             author_data = serializer.data
             return Response(author_data, status=status.HTTP_200_OK)
         except models.User.DoesNotExist:
-            util.log('AuthorViewSet/retrieve', f"Author {author_id} not found locally")
+            util.log('AuthorViewSet/retrieve', "Author %s not found locally", author_id)
 
         # if all is not in the query params, return 404
         if "all" not in request.query_params:
-            util.log('AuthorViewSet/retrieve', f"All not in query params, returning 404 for author {author_id}")
+            util.log('AuthorViewSet/retrieve', "All not in query params, returning 404 for author %s", author_id)
             return Response(status=status.HTTP_404_NOT_FOUND)
         
         # Try find the author on a remote node
+        requests_by_node = []
         for node in self.nodes:
             # Skip local node
             if node.displayName == "local":
@@ -198,17 +170,12 @@ class AuthorViewSet(viewsets.ModelViewSet):
                 f"{node.url}authors/{author_id}", 
                 node
             )
-            util.log('AuthorViewSet/retrieve', f"Requesting author {author_id} from {node.nodeName} using URL {request_url}")
-            auth_token = base64.b64encode(f"{node.displayName}:{node.password}".encode('ascii')).decode('ascii')
-            headers = {"Authorization": f"Basic {auth_token}"}
-            try:
-                response = requests.get(request_url, headers=headers)
-                # Return if found, log otherwise
-                if response.status_code == status.HTTP_200_OK:
-                    return Response(response.json())
-                util.log('AuthorViewSet/retrieve', f"{node.displayName} returned status code {response.status_code} for author {author_id}")
-            except requests.RequestException as e:
-                util.log('AuthorViewSet/retrieve', f"Error connecting to {node.nodeName}: {e}")
+            util.log('AuthorViewSet/retrieve', "Requesting author %s from %s using URL %s", author_id, node.nodeName, request_url)
+            requests_by_node.append((node, request_url))
+
+        response = remote_node.util.get_first(requests_by_node)
+        if response is not None:
+            return Response(response.json())
 
         return Response(status=status.HTTP_404_NOT_FOUND)
 
@@ -253,9 +220,9 @@ class AuthorViewSet(viewsets.ModelViewSet):
                 clearGithubPosts.delete()
             except Post.DoesNotExist:
                 pass
-            util.log('AuthorViewSet/update', f'Cleared {postCount} github posts')
-            # update the github posts
-            util.log('AuthorViewSet/update', f'Added {len(updateGithubSingle(pk))} new github posts')
+            util.log('AuthorViewSet/update', 'Cleared %s github posts', postCount)
+            # the new github posts are added in the background
+            github_scheduler.request_sync(author)
         updated_author = serializers.UserSerializer(author).data
         return Response(updated_author, status=status.HTTP_200_OK)
 
@@ -274,12 +241,13 @@ class LikedViewSet(viewsets.ModelViewSet):
         try:
             author = models.User.objects.get(pk=author_id)
         except models.User.DoesNotExist:
-            util.log('LikedViewSet/list', f"Author {author_id} not found locally")
+            util.log('LikedViewSet/list', "Author %s not found locally", author_id)
         else:
-            util.log('LikedViewSet/list', f"Author {author_id} found locally")
+            util.log('LikedViewSet/list', "Author %s found locally", author_id)
             likes = Like.objects.filter(author=author.url)
-            serializer = self.serializer_class(likes, many=True)
             author_data = UserSerializer(author).data
+            # every like is by this author, so there's no need to look the author up again
+            serializer = self.serializer_class(likes, many=True, context={'authors': {author.url: author_data}})
             for like in serializer.data:
                 like["author"] = author_data
                 return Response({
@@ -295,22 +263,20 @@ class LikedViewSet(viewsets.ModelViewSet):
         url = request.build_absolute_uri().split('api/')[1]
         url = util.removeQueryParamAll(url)
 
+        requests_by_node = []
         for node in self.nodes:
             if node.displayName == "local":
                 continue
-            try:
-                request_url = remote_node.util.transform_url_for_node(
-                    f"{node.url.rstrip('/')}/{url}",
-                    node
-                )
-                util.log('LikedViewSet/list', f'Requesting from {request_url}')
-                response = remote_node.util.get(request_url)
-                if response.status_code == 200:
-                    return Response(response.json())
-                else:
-                    util.log('LikedViewSet/list', f"Failed to connect to {node.nodeName}. Status code: {response.status_code}")
-            except requests.RequestException as e:
-                util.log('LikedViewSet/list', f"Error connecting to {node.nodeName}: {e}")
+            request_url = remote_node.util.transform_url_for_node(
+                f"{node.url.rstrip('/')}/{url}",
+                node
+            )
+            util.log('LikedViewSet/list', 'Requesting from %s', request_url)
+            requests_by_node.append((node, request_url))
+
+        response = remote_node.util.get_first(requests_by_node)
+        if response is not None:
+            return Response(response.json())
         return Response(status=status.HTTP_404_NOT_FOUND)
 
 
@@ -320,23 +286,23 @@ class UpdateGithub(APIView):
     Update the github posts
     URL: /update_github/
     '''
+    def get(self, request):
+        '''
+        METHOD: GET
+        Returns the github sync status of every author
+        '''
+        return Response({"type": "github-sync", "items": github_scheduler.statuses()}, status=status.HTTP_200_OK)
+
     def put(self, request):
         '''
         METHOD: PUT
-        Updates the github field of a user
+        Starts syncing the github posts of the authors that are due, in the background.
+        Returns right away (GET has the sync status of every author)
         '''
         # Nodes are not allowed to update local authors
         # if request.user.is_node:
         #     return Response(status=status.HTTP_403_FORBIDDEN)
 
-        util.log('UpdateGithub', 'Updating github posts')
-        newPosts = {
-            "type": "github-new",
-            "items": []
-        }
-
-        new_created = updateGithubAll()
-        for post in new_created:
-            newPosts["items"].append(PostSerializer(post).data)
-        return Response(newPosts, status=status.HTTP_200_OK)
-
+        util.log('UpdateGithub', 'Waking up the github sync')
+        github_scheduler.kick()
+        return Response({"type": "github-sync", "status": "queued"}, status=status.HTTP_202_ACCEPTED)
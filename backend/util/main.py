@@ -1,4 +1,7 @@
-import backend.settings
+import logging
+
+# every message logged through log() goes to this logger (configured in settings.LOGGING)
+logger = logging.getLogger('shiganshina')
 
 def standardize_url(url: str) -> str:
     '''
@@ -15,12 +18,21 @@ def url_remove_trailing_slash(url: str) -> str:
     return url.rstrip('/')
 
 
-def log(domain: str, message: str) -> None:
+def log(domain: str, message, *args, level: int = logging.DEBUG) -> None:
     '''
-    Log a message to the console
+    Log a message to the console, e.g. `log('PostViewSet/list', 'Posts: %s', posts)`
+
+    Nothing is formatted unless the message is actually emitted, so pass the values as %-style
+    `args` instead of building an f-string. For expensive messages (e.g. dumping a whole payload)
+    pass a function returning the message: it's only called if the message is emitted.
     '''
-    if backend.settings.LOG_LEVEL == 'DEBUG':
-        print(f'[{domain}] {message}')
+    if not logger.isEnabledFor(level):
+        return
+    if callable(message):
+        message = message()
+    elif args:
+        message = str(message) % args
+    logger.log(level, '[%s] %s', domain, message)
 
 
 def removeQueryParamAll(url: str) -> str:
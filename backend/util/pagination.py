@@ -0,0 +1,102 @@
+'''
+Pagination shared by the list endpoints
+'''
+import base64
+from datetime import datetime
+from django.db.models import Q, QuerySet
+from rest_framework import pagination
+from rest_framework.exceptions import NotFound
+from rest_framework.utils.urls import remove_query_param, replace_query_param
+
+
+class KeysetPagination(pagination.PageNumberPagination):
+    '''
+    Page number pagination (`?page=&size=`), with an opt-in cursor mode.
+
+    Other nodes rely on `?page=&size=`, so that stays the default. Passing `?cursor` (empty for the
+    first page) switches to keyset pagination on `cursor_fields` (newest first): each page is
+    fetched with a `WHERE (published, id) < (...)` condition instead of COUNT(*) + OFFSET, so deep
+    pages are as cheap as the first one. Cursor mode only applies to querysets, lists are always
+    paginated by page number.
+    '''
+    cursor_query_param = 'cursor'
+    # (timestamp field, unique tie-breaker field). Results are ordered by both, descending
+    cursor_fields = ('published', 'id')
+
+    def cursor_requested(self, request) -> bool:
+        return self.cursor_query_param in request.query_params
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.cursor_mode = self.cursor_requested(request) and isinstance(queryset, QuerySet)
+        if not self.cursor_mode:
+            return super().paginate_queryset(queryset, request, view)
+
+        self.request = request
+        page_size = self.get_page_size(request)
+        timestamp_field, id_field = self.cursor_fields
+        reverse, position = self.decode_cursor(request.query_params.get(self.cursor_query_param))
+
+        if position is None:
+            queryset = queryset.order_by(f'-{timestamp_field}', f'-{id_field}')
+        elif not reverse:
+            timestamp, id = position
+            queryset = queryset.filter(
+                Q(**{f'{timestamp_field}__lt': timestamp})
+                | Q(**{timestamp_field: timestamp, f'{id_field}__lt': id})
+            ).order_by(f'-{timestamp_field}', f'-{id_field}')
+        else:
+            # walking backwards: fetch the items just newer than the cursor, oldest first, then flip them
+            timestamp, id = position
+            queryset = queryset.filter(
+                Q(**{f'{timestamp_field}__gt': timestamp})
+                | Q(**{timestamp_field: timestamp, f'{id_field}__gt': id})
+            ).order_by(timestamp_field, id_field)
+
+        # fetch one extra item to know whether there's another page after this one
+        items = list(queryset[:page_size + 1])
+        has_more = len(items) > page_size
+        items = items[:page_size]
+        if reverse:
+            items.reverse()
+            self.has_next, self.has_previous = True, has_more
+        else:
+            self.has_next, self.has_previous = has_more, position is not None
+        self.page_items = items
+        return items
+
+    def encode_cursor(self, item, reverse: bool) -> str:
+        timestamp_field, id_field = self.cursor_fields
+        timestamp = getattr(item, timestamp_field).isoformat()
+        raw = f"{'p' if reverse else 'n'}|{timestamp}|{getattr(item, id_field)}"
+        return base64.urlsafe_b64encode(raw.encode('utf-8')).decode('ascii')
+
+    def decode_cursor(self, cursor: str) -> tuple:
+        '''
+        Returns (reverse, (timestamp, id)). The position is None for the first page.
+        '''
+        if not cursor:
+            return False, None
+        try:
+            direction, timestamp, id = base64.urlsafe_b64decode(cursor.encode('ascii')).decode('utf-8').split('|', 2)
+            return direction == 'p', (datetime.fromisoformat(timestamp), id)
+        except (ValueError, UnicodeError):
+            raise NotFound('Invalid cursor.')
+
+    def cursor_links(self) -> dict:
+        '''
+        `next`/`previous` links to add to the response in cursor mode (empty otherwise)
+        '''
+        if not getattr(self, 'cursor_mode', False):
+            return {}
+        url = self.request.build_absolute_uri()
+        links = {'next': None, 'previous': None}
+        if self.has_next and self.page_items:
+            links['next'] = replace_query_param(url, self.cursor_query_param, self.encode_cursor(self.page_items[-1], reverse=False))
+        if self.has_previous:
+            if self.page_items:
+                links['previous'] = replace_query_param(url, self.cursor_query_param, self.encode_cursor(self.page_items[0], reverse=True))
+            else:
+                links['previous'] = replace_query_param(url, self.cursor_query_param, '')
+        # page numbers mean nothing in cursor mode
+        links = {key: link and remove_query_param(link, self.page_query_param) for key, link in links.items()}
+        return links
@@ -2,7 +2,11 @@
 Utility functions/classes for tests
 ''' 
 
+import logging
+from unittest.mock import MagicMock, patch
+import django.test
 import django.test.testcases
+import util.main
 
 
 class LiveServerThreadWithReuse(django.test.testcases.LiveServerThread):
@@ -20,3 +24,34 @@ class LiveServerThreadWithReuse(django.test.testcases.LiveServerThread):
             allow_reuse_address=True,
             connections_override=connections_override,
         )
+
+
+class LogTest(django.test.SimpleTestCase):
+    '''
+    Tests that util.main.log only formats messages that are actually emitted
+    '''
+    def test_disabled_level_is_not_formatted(self):
+        message = MagicMock()
+        with patch.object(util.main.logger, 'isEnabledFor', return_value=False), \
+                patch.object(util.main.logger, 'log') as mock_log:
+            util.main.log('LogTest', message)
+            util.main.log('LogTest', 'value: %s', message)
+        message.assert_not_called()
+        message.__str__.assert_not_called()
+        mock_log.assert_not_called()
+
+    def test_emitted(self):
+        with self.assertLogs('shiganshina', level='DEBUG') as logs:
+            util.main.log('LogTest', 'value: %s', 42)
+            util.main.log('LogTest', lambda: 'computed')
+            util.main.log('LogTest', '100%')
+        self.assertEqual(
+            [record.getMessage() for record in logs.records],
+            ['[LogTest] value: 42', '[LogTest] computed', '[LogTest] 100%'],
+        )
+
+    def test_level(self):
+        with self.assertLogs('shiganshina', level='WARNING') as logs:
+            util.main.log('LogTest', 'debug')
+            util.main.log('LogTest', 'warning', level=logging.WARNING)
+        self.assertEqual([record.getMessage() for record in logs.records], ['[LogTest] warning'])
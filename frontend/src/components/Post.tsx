@@ -359,9 +359,10 @@ const Post: React.FC<PostProps> = ({
         <div className="post-text">{postContentState.content}</div>
       );
     } else if (postContentState.contentType.includes("image")) {
-      // Assuming the base64 string is ready to be used directly or
+      // Lists of posts give the URL of the image. Otherwise the content is base64:
       // prepend 'data:image/png;base64,' if the base64 string does not start with 'data:image'
-      const imageSrc = postContentState.content.startsWith('data:image') ? postContentState.content : `data:image/png;base64,${postContentState.content}`;
+      const content = postContentState.content;
+      const imageSrc = content.startsWith('data:image') || content.startsWith('http') ? content : `data:image/png;base64,${content}`;
       return (
         <div className="post-images">
           <img src={imageSrc} alt='Posted Image'></img>